@@ -0,0 +1,52 @@
+import json
+import os
+from argparse import ArgumentParser
+from asyncio import run
+from pathlib import Path
+
+# The benchmark runs against a local mock backend, so the credentials aren't used.
+os.environ.setdefault("SPOTGAZER_BASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SERVICE_USERNAME", "benchmark")
+os.environ.setdefault("SERVICE_PASSWORD", "benchmark")
+
+from src.benchmark import BenchmarkConfig, compare_reports, run_benchmark
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Measure the throughput and latency of the detection pipeline.")
+    parser.add_argument("--streams", type=int, default=BenchmarkConfig.streams)
+    parser.add_argument("--parking-lots", type=int, default=BenchmarkConfig.parking_lots)
+    parser.add_argument("--duration", type=float, default=BenchmarkConfig.duration)
+    parser.add_argument("--warmup", type=float, default=BenchmarkConfig.warmup)
+    parser.add_argument("--processing-rate", type=float, default=BenchmarkConfig.processing_rate)
+    parser.add_argument("--video", type=Path, action="append", default=[], help="Replay the local video file.")
+    parser.add_argument("--resolution", type=int, nargs=2, default=BenchmarkConfig.resolution)
+    parser.add_argument("--fps", type=float, default=BenchmarkConfig.fps)
+    parser.add_argument("--model", default=BenchmarkConfig.model)
+    parser.add_argument("--output", type=Path, help="Store the results in the JSON file.")
+    parser.add_argument("--baseline", type=Path, help="Compare the results with the stored ones.")
+    arguments = parser.parse_args()
+
+    config = BenchmarkConfig(
+        streams=arguments.streams,
+        parking_lots=arguments.parking_lots,
+        duration=arguments.duration,
+        warmup=arguments.warmup,
+        processing_rate=arguments.processing_rate,
+        videos=arguments.video,
+        resolution=tuple(arguments.resolution),
+        fps=arguments.fps,
+        model=arguments.model,
+    )
+    report = run(run_benchmark(config))
+    if arguments.baseline:
+        report["changes"] = compare_reports(json.loads(arguments.baseline.read_text()), report)
+
+    serialized_report = json.dumps(report, indent=2)
+    print(serialized_report)  # noqa: T201
+    if arguments.output:
+        arguments.output.write_text(serialized_report)
+
+
+if __name__ == "__main__":
+    main()
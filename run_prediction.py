@@ -1,21 +1,19 @@
 import sys
-from asyncio import CancelledError, run, wait_for
-from datetime import UTC, datetime
+from asyncio import CancelledError, run
 from multiprocessing import Process
 from time import sleep
 
-from src.settings import MAX_STREAMS, STREAMS_USAGE_DURATION
+from src.settings import MAX_STREAMS, WORKER_PROCESSES
 from src.spot_gazer import SpotGazer
+from src.supervisor import Supervisor
 
 
 async def run_prediction() -> None:
     spot_gazer = SpotGazer()
     try:
-        await wait_for(
-            spot_gazer.start_detection(datetime.now(UTC) + STREAMS_USAGE_DURATION, MAX_STREAMS),
-            STREAMS_USAGE_DURATION.seconds,
-        )
-    except (KeyboardInterrupt, CancelledError, TimeoutError):
+        # Runs until the worker has to be recycled because of its memory usage.
+        await spot_gazer.run_detection(MAX_STREAMS)
+    except (KeyboardInterrupt, CancelledError):
         pass
     finally:
         await spot_gazer.stop_detection()
@@ -26,11 +24,16 @@ def run_sync_prediction() -> None:
 
 
 def main() -> None:
+    if WORKER_PROCESSES > 1:
+        # The supervisor recycles its workers on its own.
+        run(Supervisor(WORKER_PROCESSES).run())
+        sys.exit(1)  # The function is expected to run forever.
+
     times_to_wait = 12  # 1 minute with a 5-second interval between waits.
     while times_to_wait > 0:
-        # Running `SpotGazer` in a loop leads to a memory leak because resources are not released
-        # when the detection terminates. The solution is to use a process.
-        # Inspired by https://github.com/ultralytics/ultralytics/issues/6981.
+        # Resources of Ultralytics aren't fully released when the detection terminates, which leads
+        # to a memory leak. Therefore, the long-lived worker runs in a process which is recycled
+        # once it reaches the memory limit. Inspired by https://github.com/ultralytics/ultralytics/issues/6981.
         process = Process(target=run_sync_prediction)
         process.start()
         process.join()
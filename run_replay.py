@@ -0,0 +1,42 @@
+import json
+import os
+from argparse import ArgumentParser
+from asyncio import run
+from pathlib import Path
+
+# The replay runs against a local mock backend, so the credentials aren't used.
+os.environ.setdefault("SPOTGAZER_BASE_URL", "http://127.0.0.1")
+os.environ.setdefault("SERVICE_USERNAME", "replay")
+os.environ.setdefault("SERVICE_PASSWORD", "replay")
+# Every replayed frame is processed at the captured resolution and captured again for the comparison.
+os.environ.setdefault("ADAPTIVE_CONTROL_ENABLED", "0")
+os.environ.setdefault("CAPTURE_SAMPLE_INTERVAL", "0")
+
+from src.benchmark import compare_reports
+from src.replay import ReplayConfig, run_replay
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Replay the captured streams through the detection pipeline.")
+    parser.add_argument("capture_dir", type=Path, help="Directory the frames have been captured to.")
+    parser.add_argument(
+        "--realtime", action="store_true", help="Replay at the captured pace, not at the maximum speed."
+    )
+    parser.add_argument("--model", default=ReplayConfig.model)
+    parser.add_argument("--output", type=Path, help="Store the results in the JSON file.")
+    parser.add_argument("--baseline", type=Path, help="Compare the results with the stored ones.")
+    arguments = parser.parse_args()
+
+    config = ReplayConfig(capture_dir=arguments.capture_dir, realtime=arguments.realtime, model=arguments.model)
+    report = run(run_replay(config))
+    if arguments.baseline:
+        report["changes"] = compare_reports(json.loads(arguments.baseline.read_text()), report)
+
+    serialized_report = json.dumps(report, indent=2)
+    print(serialized_report)  # noqa: T201
+    if arguments.output:
+        arguments.output.write_text(serialized_report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import time
+from typing import Any, Self
+
+from .settings import (
+    ADAPTIVE_ACTIVE_CHURN,
+    ADAPTIVE_ADJUST_INTERVAL,
+    ADAPTIVE_CONTROL_ENABLED,
+    ADAPTIVE_HIGH_LOAD,
+    ADAPTIVE_IMGSZ_LEVELS,
+    ADAPTIVE_LOW_LOAD,
+    ADAPTIVE_MAX_STRIDE,
+)
+
+CHURN_SMOOTHING = 0.2
+"""Weight of the latest observation in the exponential moving average of the churn."""
+
+
+class AdaptiveController:
+    """Adjust the frame stride and the inference size of a stream to the load and the scene activity.
+
+    The stream is processed on every `stride`-th run of its parking lot and inferred at `imgsz`.
+    Both are adjusted by at most one step every `adjust_interval` seconds within the bounds:
+    - Above the `high_load` watermark the stream is degraded gracefully instead of falling behind:
+      a quiet scene is sampled less often, an active one (or one at the maximum stride)
+      is inferred at a lower resolution.
+    - Below the `low_load` watermark an active scene is sampled more often, then the resolution
+      is restored.
+    - Otherwise a quiet scene is sampled less often to reclaim the CPU.
+
+    The activity of the scene is the churn, i.e. the moving average of how often the detections
+    change between the observations of the stream.
+
+    Usage:
+    ```python
+    controller = AdaptiveController.from_stream(stream)
+    if controller.is_due():
+        boxes = await predictor.detect_vehicles(frame, imgsz=controller.imgsz)
+        controller.observe(has_changed=...)
+        controller.adjust(load)
+    ```
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        min_stride: int = 1,
+        max_stride: int = ADAPTIVE_MAX_STRIDE,
+        imgsz_levels: tuple[int, ...] = ADAPTIVE_IMGSZ_LEVELS,
+        adjust_interval: float = ADAPTIVE_ADJUST_INTERVAL,
+        high_load: float = ADAPTIVE_HIGH_LOAD,
+        low_load: float = ADAPTIVE_LOW_LOAD,
+        active_churn: float = ADAPTIVE_ACTIVE_CHURN,
+    ) -> None:
+        self.min_stride = min_stride
+        self.max_stride = max(min_stride, max_stride)
+        self.imgsz_levels = sorted(imgsz_levels)
+        self.adjust_interval = adjust_interval
+        self.high_load = high_load
+        self.low_load = low_load
+        self.active_churn = active_churn
+        self.stride = min_stride
+        self.level = len(self.imgsz_levels) - 1
+        self.churn = 0.0
+        self._runs = 0
+        self._adjusted_at = time.monotonic()
+
+    @classmethod
+    def from_stream(cls, stream: dict[str, Any]) -> Self:
+        """Create the controller with the bounds overridden by the stream source, if any.
+
+        The stream source may set `min_stride`, `max_stride`, `min_imgsz` and `max_imgsz`.
+        The inference sizes are the bounds and the `ADAPTIVE_IMGSZ_LEVELS` between them, so the
+        bounds apply even if they aren't among the levels. Equal bounds pin the value. Without
+        the adaptive control, the stream is pinned to the minimum stride and the maximum inference size.
+        """
+        min_stride = stream.get("min_stride") or 1
+        max_stride = stream.get("max_stride") or (ADAPTIVE_MAX_STRIDE if ADAPTIVE_CONTROL_ENABLED else min_stride)
+        min_imgsz = stream.get("min_imgsz") or min(ADAPTIVE_IMGSZ_LEVELS)
+        max_imgsz = stream.get("max_imgsz") or max(ADAPTIVE_IMGSZ_LEVELS)
+        if not ADAPTIVE_CONTROL_ENABLED:
+            min_imgsz = max_imgsz
+        min_imgsz = min(min_imgsz, max_imgsz)
+        imgsz_levels = {min_imgsz, max_imgsz} | {
+            imgsz for imgsz in ADAPTIVE_IMGSZ_LEVELS if min_imgsz <= imgsz <= max_imgsz
+        }
+        return cls(min_stride=min_stride, max_stride=max_stride, imgsz_levels=tuple(imgsz_levels))
+
+    @property
+    def imgsz(self) -> int:
+        return self.imgsz_levels[self.level]
+
+    def is_due(self) -> bool:
+        """Count the run of the parking lot and return whether the stream has to be processed on it."""
+        self._runs += 1
+        return self._runs % self.stride == 0
+
+    def observe(self, *, has_changed: bool) -> None:
+        """Record whether the detections have changed since the previous observation of the stream."""
+        self.churn += CHURN_SMOOTHING * (has_changed - self.churn)
+
+    def adjust(self, load: float) -> None:
+        """Step the stride or the inference size towards the load, see the class description."""
+        now = time.monotonic()
+        if now - self._adjusted_at < self.adjust_interval:
+            return
+        self._adjusted_at = now
+
+        is_active = self.churn >= self.active_churn
+        if load > self.high_load:
+            if not is_active and self.stride < self.max_stride:
+                self.stride += 1
+            elif self.level > 0:
+                self.level -= 1
+            elif self.stride < self.max_stride:
+                self.stride += 1
+        elif load < self.low_load and is_active and self.stride > self.min_stride:
+            self.stride -= 1
+        elif load < self.low_load and self.level < len(self.imgsz_levels) - 1:
+            self.level += 1
+        elif not is_active and self.stride < self.max_stride:
+            self.stride += 1
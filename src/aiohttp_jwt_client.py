@@ -1,15 +1,36 @@
-from datetime import UTC, datetime
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
 from typing import Any, Literal
 
-from aiohttp import ClientSession
+from aiohttp import ClientResponse, ClientSession, TCPConnector
 from aiohttp.typedefs import StrOrURL
 from jwt import decode
 
 from .logging_config import logging
+from .metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
 
 logger = logging.getLogger(__file__)
 
 
+def _orjson_dumps(obj: Any) -> str:  # noqa: ANN401
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()  # type: ignore[union-attr]
+
+
+# The orjson fast path is used when the package is installed.
+json_dumps = json.dumps if orjson is None else _orjson_dumps
+json_loads = json.loads if orjson is None else orjson.loads
+
+
 class AiohttpJWTClient:
     """Asynchronous HTTP client with a JWT authentication built-in.
 
@@ -35,11 +56,16 @@ class AiohttpJWTClient:
 
     Note:
         - Remember to close the session after use to free resources.
-        - Tokens expiration is handled automatically.
+        - Tokens expiration is handled automatically. Only one refresh is in flight at a time, concurrent
+          requests await it instead of refreshing on their own. The access token is refreshed in the
+          background `token_refresh_margin` seconds before it expires, and a request rejected with 401
+          is retried once with fresh tokens.
         - The bearer `Authorization` header is set by default.
+        - Connections are kept alive for `keepalive_timeout` seconds and resolved hosts are cached for
+          `dns_cache_ttl` seconds, so requests rarely pay for new connections.
     """
 
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         *,
         username: str,
@@ -47,44 +73,137 @@ class AiohttpJWTClient:
         api_token_url: StrOrURL,
         api_token_refresh_url: StrOrURL,
         base_url: StrOrURL | None = None,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout: float = 30,
+        dns_cache_ttl: int = 300,
+        token_refresh_margin: float = 30,
     ) -> None:
         self.__username = username
         self.__password = password
         self.api_token_url = api_token_url
         self.api_token_refresh_url = api_token_refresh_url
+        self.token_refresh_margin = timedelta(seconds=token_refresh_margin)
         # NOTE: remember to close the session!
-        self.session = ClientSession(base_url)
+        self.session = ClientSession(
+            base_url,
+            connector=TCPConnector(
+                limit=connection_limit,
+                limit_per_host=connection_limit_per_host,
+                keepalive_timeout=keepalive_timeout,
+                ttl_dns_cache=dns_cache_ttl,
+            ),
+            json_serialize=json_dumps,
+        )
 
         self.__access_token: str
         self.__refresh_token: str
         self._access_token_expiration: datetime
         self._refresh_token_expiration: datetime | None = None
+        # UNIX time until which the tokens are used without checks, so requests skip the datetime handling.
+        self._tokens_valid_until = 0.0
+        self._refresh_task: asyncio.Task[None] | None = None
+        self._background_refresh: asyncio.TimerHandle | None = None
 
     async def request_json(
         self, url: str, method: Literal["get", "post", "put", "patch", "delete"] = "get", **kwargs: Any
     ) -> dict[str, Any]:
-        await self.refresh_tokens()
-        async with getattr(self.session, method)(url, **kwargs) as response:
-            return await response.json()
+        raise_for_status = kwargs.pop("raise_for_status", False)
+        async with self.request(url, method, **kwargs) as response:
+            if raise_for_status:
+                response.raise_for_status()
+            return await response.json(loads=json_loads)
+
+    @asynccontextmanager
+    async def request(
+        self,
+        url: str,
+        method: Literal["get", "post", "put", "patch", "delete"] = "get",
+        **kwargs: Any,  # noqa: ANN401
+    ) -> AsyncIterator[ClientResponse]:
+        """Send an authenticated request and yield the response, e.g. to read its headers.
+
+        A request rejected as unauthorized is retried once with refreshed tokens.
+        """
+        retried = False
+        while True:
+            if time.time() >= self._tokens_valid_until:
+                await self.refresh_tokens()
+            access_token = self.__access_token
+            async with self.session.request(method, url, raise_for_status=False, **kwargs) as response:
+                if response.status == HTTPStatus.UNAUTHORIZED and not retried:
+                    logger.warning("The request to %s is unauthorized, retrying with refreshed tokens", url)
+                    self._invalidate_access_token(access_token)
+                    retried = True
+                    continue
+                yield response
+                return
 
     async def refresh_tokens(self) -> None:
-        """Refresh tokens and update the default authorization header."""
-        if not self._refresh_token_expiration or datetime.now(UTC) > self._refresh_token_expiration:
-            async with self.session.post(
-                self.api_token_url, json={"username": self.__username, "password": self.__password}
-            ) as response:
-                tokens = await response.json()
-                self.__access_token = tokens["access"]
-                self.__refresh_token = tokens["refresh"]
-        elif datetime.now(UTC) > self._access_token_expiration:
+        """Refresh tokens and update the default authorization header.
+
+        Concurrent calls share a single refresh. Cancelling a caller doesn't cancel the refresh.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_tokens())
+        await asyncio.shield(self._refresh_task)
+
+    async def _refresh_tokens(self) -> None:
+        now = datetime.now(UTC)
+        if not self._refresh_token_expiration or now > self._refresh_token_expiration - self.token_refresh_margin:
+            await self._obtain_tokens()
+            metrics.increment("token_refreshes", kind="login")
+        elif now > self._access_token_expiration - self.token_refresh_margin:
             async with self.session.post(
                 self.api_token_refresh_url, json={"refresh": self.__refresh_token}
             ) as response:
-                self.__access_token = (await response.json())["access"]
+                if response.status == HTTPStatus.UNAUTHORIZED:
+                    # The refresh token has been revoked.
+                    await self._obtain_tokens()
+                    metrics.increment("token_refreshes", kind="login")
+                else:
+                    self.__access_token = (await response.json())["access"]
+                    metrics.increment("token_refreshes", kind="refresh")
         else:
             return
         self._extract_tokens_expiration_datetime()
         self.session.headers["Authorization"] = f"Bearer {self.__access_token}"
+        self._schedule_background_refresh()
+
+    async def _obtain_tokens(self) -> None:
+        async with self.session.post(
+            self.api_token_url, json={"username": self.__username, "password": self.__password}
+        ) as response:
+            tokens = await response.json()
+            self.__access_token = tokens["access"]
+            self.__refresh_token = tokens["refresh"]
+
+    def _invalidate_access_token(self, access_token: str) -> None:
+        """Force the refresh unless the rejected token has already been replaced."""
+        if access_token == self.__access_token:
+            self._access_token_expiration = datetime.fromtimestamp(0, tz=UTC)
+            self._tokens_valid_until = 0.0
+
+    def _schedule_background_refresh(self) -> None:
+        if self._background_refresh is not None:
+            self._background_refresh.cancel()
+            self._background_refresh = None
+        delay = self._tokens_valid_until - time.time()
+        # Tokens which are already due are refreshed by the next request.
+        if delay > 0:
+            self._background_refresh = asyncio.get_running_loop().call_later(delay, self._refresh_in_background)
+
+    def _refresh_in_background(self) -> None:
+        self._background_refresh = None
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_tokens())
+            self._refresh_task.add_done_callback(self._log_background_refresh_failure)
+
+    @staticmethod
+    def _log_background_refresh_failure(task: asyncio.Task[None]) -> None:
+        # The next request retries the refresh.
+        if not task.cancelled() and (exception := task.exception()) is not None:
+            logger.error("Failed to refresh the tokens in the background", exc_info=exception)
 
     def _extract_tokens_expiration_datetime(self) -> None:
         decoded_access_token = decode(self.__access_token, options={"verify_signature": False})
@@ -93,6 +212,14 @@ class AiohttpJWTClient:
         decoded_refresh_token = decode(self.__refresh_token, options={"verify_signature": False})
         self._refresh_token_expiration = datetime.fromtimestamp(decoded_refresh_token["exp"], tz=UTC)
 
+        expiration = min(self._access_token_expiration, self._refresh_token_expiration)
+        self._tokens_valid_until = (expiration - self.token_refresh_margin).timestamp()
+
     async def close(self) -> None:
         """Shortcut for the `self.session.close`."""
+        if self._background_refresh is not None:
+            self._background_refresh.cancel()
+            self._background_refresh = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
         await self.session.close()
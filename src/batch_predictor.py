@@ -0,0 +1,139 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .logging_config import logging
+from .metrics import metrics
+from .model_cache import load_model
+from .settings import (
+    BATCH_MAX_DELAY,
+    BATCH_MAX_SIZE,
+    INFERENCE_WORKERS,
+    YOLO_PREDICTION_PARAMETERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPredictor:
+    """Run a single shared YOLO model over the frames of all streams processed by the worker.
+
+    Frames submitted via `detect_vehicles` are collected into a batch until either `max_batch_size`
+    frames are pending or `max_batch_delay` seconds have passed since the first of them arrived.
+    The batch is then passed to the model in one `predict` call and the boxes of the detected
+    vehicles are fanned back to every awaiting caller, regardless of the parking lot it belongs to.
+    Frames requested at different inference sizes are split into one `predict` call per size.
+
+    The inference itself runs in a dedicated thread pool, so the event loop keeps serving other
+    parking lots (and collecting the next batch) while the model is busy.
+
+    Usage:
+    ```python
+    predictor = BatchPredictor("yolo11n.pt")
+    boxes = await asyncio.gather(*(predictor.detect_vehicles(frame) for frame in frames))
+    ```
+    """
+
+    def __init__(
+        self,
+        model: str | Path = YOLO_PREDICTION_PARAMETERS["model"],  # type: ignore[assignment]
+        task: str = YOLO_PREDICTION_PARAMETERS["task"],
+        *,
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_batch_delay: float = BATCH_MAX_DELAY,
+        inference_workers: int = INFERENCE_WORKERS,
+    ) -> None:
+        self.yolo = load_model(model, task)
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self._pending: list[tuple[np.ndarray, int, asyncio.Future[np.ndarray]]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._executor = ThreadPoolExecutor(inference_workers, thread_name_prefix="inference")
+        self._running_batches: set[asyncio.Task[None]] = set()
+
+    async def detect_vehicles(self, frame: np.ndarray, imgsz: int | None = None) -> np.ndarray:
+        """Queue the frame for the next batch and wait for the vehicles detected on it.
+
+        Args:
+            frame: The image to detect the vehicles on.
+            imgsz: Inference size the frame is resized to, `YOLO_PREDICTION_PARAMETERS["imgsz"]` by default.
+
+        Returns:
+            Array of shape (N, 5) with `x1, y1, x2, y2` boxes of the detected vehicles in pixels
+            followed by their confidence.
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[np.ndarray] = loop.create_future()
+        self._pending.append((frame, imgsz or YOLO_PREDICTION_PARAMETERS["imgsz"], future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_batch_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        batches: dict[int, list[tuple[np.ndarray, asyncio.Future[np.ndarray]]]] = {}
+        for frame, imgsz, future in batch:
+            batches.setdefault(imgsz, []).append((frame, future))
+        for imgsz, sized_batch in batches.items():
+            # Keep a reference to the task, otherwise it may be garbage collected before completion.
+            task = asyncio.create_task(self._run_batch(sized_batch, imgsz))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def _run_batch(self, batch: list[tuple[np.ndarray, asyncio.Future[np.ndarray]]], imgsz: int) -> None:
+        frames = [frame for frame, _ in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            detected_boxes = await loop.run_in_executor(self._executor, self._predict, frames, imgsz)
+        except Exception as exc:
+            logger.exception("Batched inference of %d frames failed", len(frames))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for (_, future), boxes in zip(batch, detected_boxes, strict=True):
+            # The awaiting coroutine may have been cancelled in the meantime.
+            if not future.done():
+                future.set_result(boxes)
+
+    def _predict(self, frames: list[np.ndarray], imgsz: int | None = None) -> list[np.ndarray]:
+        """Return the boxes of the detected vehicles for each frame of the batch."""
+        parameters: dict[str, Any] = {**YOLO_PREDICTION_PARAMETERS, "batch": len(frames)}
+        if imgsz is not None:
+            parameters["imgsz"] = imgsz
+        with metrics.measure("inference", imgsz=parameters["imgsz"]):
+            results = self.yolo.predict(source=frames, stream=False, **parameters)
+        metrics.increment("inferred_frames", len(frames))
+        logger.debug("Batched inference of %d frames completed", len(frames))
+        # The data holds `x1, y1, x2, y2, confidence, class` rows.
+        return [result.boxes.data[:, :5].cpu().numpy() for result in results]
+
+    def warmup(self) -> None:
+        """Run a blank batch through the model, so that the first real batch isn't delayed by lazy initialization."""
+        imgsz = YOLO_PREDICTION_PARAMETERS["imgsz"]
+        self._predict([np.zeros((imgsz, imgsz, 3), dtype=np.uint8)] * self.max_batch_size)
+        logger.info("The model has been warmed up")
+
+    def close(self) -> None:
+        """Cancel pending batches and release the inference threads."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for _, _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        for task in self._running_batches:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
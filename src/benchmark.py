@@ -0,0 +1,173 @@
+import asyncio
+import subprocess
+import time
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from itertools import cycle
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+import cv2
+import numpy as np
+
+from .logging_config import logging
+from .metrics import metrics
+from .mock_backend import MockBackend
+from .resources import get_rss
+from .settings import YOLO_PREDICTION_PARAMETERS
+from .spot_gazer import SpotGazer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BenchmarkConfig:
+    streams: int = 4
+    parking_lots: int = 2
+    duration: float = 30
+    """Seconds the measurements are taken for."""
+    warmup: float = 10
+    """Seconds the pipeline runs before the measurements, so that the streams are opened and the caches warm."""
+    processing_rate: float = 1
+    videos: list[Path] = field(default_factory=list)
+    """Local video files the streams replay. Synthetic videos are generated if none are given."""
+    resolution: tuple[int, int] = (1280, 720)
+    """Width and height of the synthetic videos."""
+    fps: float = 15
+    """Frame rate of the synthetic videos."""
+    model: str = YOLO_PREDICTION_PARAMETERS["model"]  # type: ignore[assignment]
+
+
+def generate_video(path: Path, *, duration: float, resolution: tuple[int, int], fps: float, seed: int = 0) -> Path:
+    """Write a synthetic parking lot video where "vehicles" arrive and leave from time to time.
+
+    Most of the frames are static like on a real parking lot, so the change detection is exercised too.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = resolution
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, resolution)
+    background = np.full((height, width, 3), 90, dtype=np.uint8)
+    spot_width, spot_height = width // 10, height // 4
+    spots = [
+        (x, y) for y in range(height // 8, height - spot_height, spot_height + 10) for x in range(0, width, spot_width)
+    ]
+    for x, y in spots:
+        cv2.rectangle(background, (x, y), (x + spot_width - 1, y + spot_height - 1), (255, 255, 255), 2)
+    occupied = rng.random(len(spots)) < 0.5  # noqa: PLR2004
+    colors = rng.integers(0, 255, (len(spots), 3))
+
+    frame = background.copy()
+    for index in range(int(duration * fps)):
+        if index % int(2 * fps) == 0:
+            occupied[rng.integers(len(spots))] ^= True
+            frame = background.copy()
+            for (x, y), is_occupied, color in zip(spots, occupied, colors, strict=True):
+                if is_occupied:
+                    top_left = (x + spot_width // 5, y + spot_height // 8)
+                    bottom_right = (x + spot_width * 4 // 5, y + spot_height * 7 // 8)
+                    cv2.rectangle(frame, top_left, bottom_right, color.tolist(), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def build_parking_lots(config: BenchmarkConfig, sources: list[str]) -> list[dict[str, Any]]:
+    """Spread the streams replaying the sources evenly across the parking lots."""
+    parking_lots = [
+        {"parking_lot_id": parking_lot_id, "processing_rate": config.processing_rate, "streams": []}
+        for parking_lot_id in range(1, config.parking_lots + 1)
+    ]
+    for stream_id, (parking_lot, source) in enumerate(zip(cycle(parking_lots), cycle(sources), strict=False), start=1):
+        if stream_id > config.streams:
+            break
+        parking_lot["streams"].append(
+            {"id": stream_id, "stream_source": source, "is_active": True, "in_use_until": None}
+        )
+    return [parking_lot for parking_lot in parking_lots if parking_lot["streams"]]
+
+
+def current_commit() -> str | None:
+    with suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            cwd=Path(__file__).parent,
+            text=True,
+        ).stdout.strip()
+    return None
+
+
+async def run_benchmark(config: BenchmarkConfig) -> dict[str, Any]:
+    """Run the detection pipeline against the mock backend and return the measured performance."""
+    with TemporaryDirectory(prefix="spot-gazer-benchmark-") as directory:
+        sources = [str(video) for video in config.videos]
+        if not sources:
+            logger.info("Generating a synthetic video")
+            video = generate_video(
+                Path(directory) / "synthetic.avi",
+                # Streams must not run out of frames before the end.
+                duration=config.warmup + config.duration + 30,
+                resolution=config.resolution,
+                fps=config.fps,
+            )
+            sources = [str(video)]
+
+        backend = MockBackend(build_parking_lots(config, sources))
+        base_url = await backend.start()
+        spot_gazer = SpotGazer(config.model, occupancy_spool_path=Path(directory) / "spool.sqlite3", base_url=base_url)
+        # All streams are leased at once rather than ramped up with the capacity.
+        detection = asyncio.create_task(spot_gazer.run_detection(config.streams, claim_step=config.streams))
+        try:
+            await asyncio.sleep(config.warmup)
+            metrics.reset()
+            readings = len(backend.readings)
+            started_at, cpu_started_at = time.perf_counter(), time.process_time()
+            await asyncio.sleep(config.duration)
+            elapsed, cpu_time = time.perf_counter() - started_at, time.process_time() - cpu_started_at
+            if detection.done():
+                # Propagate the failure of the pipeline.
+                detection.result()
+
+            return {
+                "commit": current_commit(),
+                "created_at": datetime.now(UTC).isoformat(),
+                "config": {**asdict(config), "videos": sources if config.videos else ["synthetic"]},
+                "elapsed": elapsed,
+                "frames": metrics.counters["frames"],
+                "frames_per_second": metrics.counters["frames"] / elapsed,
+                "inferred_frames_per_second": metrics.counters["inferred_frames"] / elapsed,
+                "uploaded_readings": len(backend.readings) - readings,
+                "lost_streams": sum(
+                    not stream["is_active"] for parking_lot in backend.parking_lots for stream in parking_lot["streams"]
+                ),
+                "stages": metrics.summary(),
+                "rss_bytes": get_rss(),
+                "cpu_percent": 100 * cpu_time / elapsed,
+            }
+        finally:
+            detection.cancel()
+            with suppress(asyncio.CancelledError):
+                await detection
+            await spot_gazer.stop_detection()
+            await backend.stop()
+
+
+def compare_reports(baseline: dict[str, Any], report: dict[str, Any]) -> dict[str, float]:
+    """Return the relative changes of the key figures, e.g. `0.1` means 10% more than the baseline."""
+
+    def change(old: float, new: float) -> float:
+        return (new - old) / old if old else float("inf") if new else 0.0
+
+    changes = {
+        "frames_per_second": change(baseline["frames_per_second"], report["frames_per_second"]),
+        "cpu_percent": change(baseline["cpu_percent"], report["cpu_percent"]),
+        "rss_bytes": change(baseline["rss_bytes"], report["rss_bytes"]),
+    }
+    for stage, durations in report["stages"].items():
+        if stage in baseline["stages"]:
+            for percentile in ("p50", "p99"):
+                changes[f"{stage}_{percentile}"] = change(baseline["stages"][stage][percentile], durations[percentile])
+    return changes
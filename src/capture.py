@@ -0,0 +1,286 @@
+import json
+import mmap
+import queue
+import struct
+import time
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+from threading import Thread
+from typing import Any, BinaryIO, NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from .logging_config import logging
+from .metrics import metrics
+from .settings import (
+    CAPTURE_JPEG_QUALITY,
+    CAPTURE_MAX_BYTES,
+    CAPTURE_QUEUE_SIZE,
+    CAPTURE_SAMPLE_INTERVAL,
+    CAPTURE_SEGMENT_BYTES,
+)
+from .stream_reader import Frame
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<dII")
+"""Header of a captured frame: the UNIX time, the size of the JPEG image and the number of the detections."""
+BOX_SIZE = 5 * 4
+"""Bytes of a detection: `x1, y1, x2, y2, confidence` as float32."""
+REPLAY_SCHEME = "replay://"
+"""Stream sources with the scheme replay the frames captured for a stream, e.g. `replay:///capture/stream-1`."""
+METADATA_FILE = "stream.json"
+SEGMENT_SUFFIX = ".seg"
+CAPTURED_STREAM_FIELDS = (
+    "id",
+    "stream_source",
+    "roi",
+    "spots",
+    "overlap",
+    "tiled",
+    "tile_size",
+    "min_stride",
+    "max_stride",
+    "min_imgsz",
+    "max_imgsz",
+)
+"""Fields of the stream source which are captured, so that the replayed stream is processed the same way."""
+
+
+class CapturedFrame(NamedTuple):
+    timestamp: float
+    """UNIX time the frame was grabbed at."""
+    jpeg: bytes
+    boxes: np.ndarray
+    """Array of shape (N, 5) with the detections produced for the frame."""
+
+    def decode(self) -> np.ndarray:
+        return cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def read_captured_frames(stream_directory: Path) -> Iterator[CapturedFrame]:
+    """Yield the frames captured for a stream, oldest first.
+
+    Segments are memory-mapped, so only the records being read are paged in. A record cut short
+    (e.g. by a crash of the worker) ends its segment.
+    """
+    for segment in sorted(stream_directory.glob(f"*{SEGMENT_SUFFIX}")):
+        with segment.open("rb") as file:
+            if not segment.stat().st_size:
+                continue
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                offset = 0
+                while offset + RECORD_HEADER.size <= len(mapped):
+                    timestamp, image_size, boxes_number = RECORD_HEADER.unpack_from(mapped, offset)
+                    image_start = offset + RECORD_HEADER.size
+                    boxes_start = image_start + image_size
+                    offset = boxes_start + boxes_number * BOX_SIZE
+                    if offset > len(mapped):
+                        break
+                    boxes = np.frombuffer(mapped[boxes_start:offset], dtype=np.float32).reshape(-1, 5)
+                    yield CapturedFrame(timestamp, mapped[image_start:boxes_start], boxes)
+
+
+def read_capture_metadata(stream_directory: Path) -> dict[str, Any]:
+    """Return the parking lot ID, the processing rate and the stream source fields of the captured stream."""
+    return json.loads((stream_directory / METADATA_FILE).read_text())
+
+
+class CaptureWriter:
+    """Capture sampled frames of the streams with their detections into compact on-disk segments.
+
+    Every stream has its own directory with the metadata of the stream (`stream.json`) and
+    append-only segment files of at most `segment_bytes`. Each record of a segment holds the
+    time the frame was grabbed at, the frame encoded as JPEG and the detections produced for it.
+    Once the segments of all streams exceed `max_bytes`, the oldest ones are deleted.
+
+    Frames are encoded and written by a background thread. The capture never stalls the pipeline:
+    frames are dropped while the queue is full. A stream is captured at most once every
+    `sample_interval` seconds.
+
+    Usage:
+    ```python
+    capture_writer = CaptureWriter("capture")
+    capture_writer.write(parking_lot, stream, timestamp, image, boxes)
+    capture_writer.close()
+    for frame in read_captured_frames(Path("capture/stream-1")):
+        image = frame.decode()
+    ```
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        directory: str | Path,
+        *,
+        max_bytes: int = CAPTURE_MAX_BYTES,
+        segment_bytes: int = CAPTURE_SEGMENT_BYTES,
+        sample_interval: float = CAPTURE_SAMPLE_INTERVAL,
+        jpeg_quality: int = CAPTURE_JPEG_QUALITY,
+        queue_size: int = CAPTURE_QUEUE_SIZE,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.sample_interval = sample_interval
+        self.jpeg_quality = jpeg_quality
+        self._sampled_at: dict[int, float] = {}
+        self._queue: queue.Queue[tuple[dict[str, Any], float, np.ndarray, np.ndarray] | None] = queue.Queue(queue_size)
+        # Segments of all streams from the oldest one, the segments left by previous runs included.
+        # The names are nanosecond timestamps, so they sort chronologically.
+        self._segments: deque[Path] = deque(
+            sorted(self.directory.glob(f"*/*{SEGMENT_SUFFIX}"), key=lambda segment: segment.name)
+        )
+        self._total_bytes = sum(segment.stat().st_size for segment in self._segments)
+        self._open_segments: dict[int, BinaryIO] = {}
+        self._thread = Thread(target=self._run, daemon=True, name="capture-writer")
+        self._thread.start()
+
+    def write(
+        self,
+        parking_lot: dict[str, Any],
+        stream: dict[str, Any],
+        timestamp: float,
+        image: np.ndarray,
+        boxes: np.ndarray,
+    ) -> None:
+        """Queue the frame of the stream for the capture unless the stream has been captured too recently."""
+        if timestamp - self._sampled_at.get(stream["id"], float("-inf")) < self.sample_interval:
+            return
+        self._sampled_at[stream["id"]] = timestamp
+        metadata = {
+            "parking_lot_id": parking_lot["parking_lot_id"],
+            "processing_rate": parking_lot["processing_rate"],
+            "stream": {field: stream[field] for field in CAPTURED_STREAM_FIELDS if field in stream},
+        }
+        try:
+            self._queue.put_nowait((metadata, timestamp, image, boxes))
+        except queue.Full:
+            metrics.increment("dropped_captures")
+
+    def close(self) -> None:
+        """Write the queued frames and close the segments."""
+        self._queue.put(None)
+        self._thread.join()
+        for file in self._open_segments.values():
+            file.close()
+        self._open_segments.clear()
+
+    def _run(self) -> None:
+        while (item := self._queue.get()) is not None:
+            try:
+                self._write(*item)
+            except (OSError, cv2.error):
+                logger.exception("Failed to capture a frame of stream ID %s", item[0]["stream"]["id"])
+
+    def _write(self, metadata: dict[str, Any], timestamp: float, image: np.ndarray, boxes: np.ndarray) -> None:
+        stream_id = metadata["stream"]["id"]
+        success, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not success:
+            return
+        boxes = np.ascontiguousarray(boxes[:, :5], dtype=np.float32)
+        record = RECORD_HEADER.pack(timestamp, jpeg.size, len(boxes)) + jpeg.tobytes() + boxes.tobytes()
+
+        file = self._open_segments.get(stream_id) or self._open_segment(metadata)
+        if file.tell() and file.tell() + len(record) > self.segment_bytes:
+            file.close()
+            file = self._open_segment(metadata)
+        file.write(record)
+        # Flushed records can be replayed even if the worker crashes.
+        file.flush()
+        self._total_bytes += len(record)
+        metrics.increment("captured_frames")
+        self._evict()
+
+    def _open_segment(self, metadata: dict[str, Any]) -> BinaryIO:
+        stream_directory = self.directory / f"stream-{metadata['stream']['id']}"
+        stream_directory.mkdir(exist_ok=True)
+        # The configuration of the stream may have changed since the last segment.
+        (stream_directory / METADATA_FILE).write_text(json.dumps(metadata))
+        segment = stream_directory / f"{time.time_ns()}{SEGMENT_SUFFIX}"
+        file = segment.open("ab")
+        self._segments.append(segment)
+        self._open_segments[metadata["stream"]["id"]] = file
+        return file
+
+    def _evict(self) -> None:
+        """Delete the oldest segments until the capture fits the disk quota."""
+        while self._total_bytes > self.max_bytes and len(self._segments) > 1:
+            segment = self._segments.popleft()
+            for stream_id, file in list(self._open_segments.items()):
+                if file.name == str(segment):
+                    file.close()
+                    del self._open_segments[stream_id]
+            self._total_bytes -= segment.stat().st_size
+            segment.unlink()
+            logger.debug("Captured segment %s has been deleted to free the disk space", segment)
+
+
+class ReplayReader:
+    """Stand-in for the `StreamReader` which replays the frames captured for a stream.
+
+    In real time, `read` returns the latest captured frame as of the time passed since the first
+    read, like the reader of a live stream. Otherwise every captured frame is returned once,
+    in order and without waiting, so the replay is deterministic and as fast as the pipeline goes.
+    `None` is returned once all frames have been replayed.
+
+    Usage:
+    ```python
+    reader = ReplayReader(Path("capture/stream-1"), realtime=False)
+    while (frame := reader.read()) is not None:
+        print(frame.image.shape, frame.captured_at)
+    ```
+    """
+
+    def __init__(self, stream_directory: Path, *, realtime: bool = True) -> None:
+        self.source = str(stream_directory)
+        self.realtime = realtime
+        self._frames = read_captured_frames(stream_directory)
+        self._next = next(self._frames, None)
+        if self._next is None:
+            msg = f"No frames have been captured in {stream_directory}"
+            raise ConnectionError(msg)
+        self._first_timestamp = self._next.timestamp
+        self._started_at: float | None = None
+        self._latest: Frame | None = None
+
+    def read(self) -> Frame | None:
+        if not self.realtime:
+            captured_frame, self._next = self._next, next(self._frames, None)
+            return None if captured_frame is None else self._decode(captured_frame)
+
+        now = time.monotonic()
+        if self._started_at is None:
+            self._started_at = now
+        elapsed = now - self._started_at
+        latest_captured_frame = None
+        while self._next is not None and self._next.timestamp - self._first_timestamp <= elapsed:
+            latest_captured_frame, self._next = self._next, next(self._frames, None)
+        if latest_captured_frame is not None:
+            self._latest = self._decode(latest_captured_frame)
+        elif self._next is None:
+            return None
+        # Between the captured frames, the latest one is still current.
+        return self._latest
+
+    def close(self) -> None:
+        self._frames.close()
+
+    @staticmethod
+    def _decode(captured_frame: CapturedFrame) -> Frame:
+        # The frames are replayed as fresh, the gaps between the sampled frames aren't stalls.
+        return Frame(captured_frame.decode(), 0.0, captured_frame.timestamp)
+
+
+def open_replay(url: str) -> ReplayReader:
+    """Open the reader replaying the captured stream of the URL.
+
+    The frames are replayed in real time unless the URL asks for the maximum speed,
+    e.g. `replay:///capture/stream-1?speed=max`.
+    """
+    parts = urlsplit(url)
+    speed = parse_qs(parts.query).get("speed", ["realtime"])[0]
+    return ReplayReader(Path(parts.netloc + parts.path), realtime=speed != "max")
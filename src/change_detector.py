@@ -0,0 +1,78 @@
+import time
+
+import cv2
+import numpy as np
+
+from .settings import (
+    CHANGE_DETECTION_SIZE,
+    CHANGE_FORCED_REFRESH_INTERVAL,
+    CHANGE_PIXEL_THRESHOLD,
+    CHANGE_RATIO_THRESHOLD,
+)
+
+
+class ChangeDetector:
+    """Cheap pre-inference gate which tells whether a frame has changed since the last inferred one.
+
+    Frames are downscaled to `size`, converted to grayscale and blurred, then compared to the
+    last frame the inference was run on. The frame is considered changed if more than
+    `ratio_threshold` of its pixels differ by more than `pixel_threshold` intensity levels.
+    Parking lots are mostly static between arrivals and departures, so unchanged frames may reuse
+    the last detections. The inference is forced every `refresh_interval` seconds anyway to bound
+    the drift caused by slow changes (e.g. lighting). Replayed frames pass the time they were
+    captured at, so the refreshes don't depend on the speed of the replay.
+
+    Usage:
+    ```python
+    change_detector = ChangeDetector()
+    if change_detector.should_infer(frame):
+        boxes = await predictor.detect_vehicles(frame)
+    ```
+    """
+
+    def __init__(
+        self,
+        *,
+        size: tuple[int, int] = CHANGE_DETECTION_SIZE,
+        pixel_threshold: int = CHANGE_PIXEL_THRESHOLD,
+        ratio_threshold: float = CHANGE_RATIO_THRESHOLD,
+        refresh_interval: float = CHANGE_FORCED_REFRESH_INTERVAL,
+    ) -> None:
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.ratio_threshold = ratio_threshold
+        self.refresh_interval = refresh_interval
+        self._reference: np.ndarray | None = None
+        self._refreshed_at = 0.0
+
+    def should_infer(self, frame: np.ndarray, timestamp: float | None = None) -> bool:
+        """Return whether the frame has to be inferred. If so, it becomes the new reference frame.
+
+        Args:
+            frame: The frame to compare with the reference one.
+            timestamp: Time the frame was grabbed at in seconds, the current monotonic time by default.
+        """
+        thumbnail = self._thumbnail(frame)
+        now = time.monotonic() if timestamp is None else timestamp
+        if (
+            self._reference is not None
+            and now - self._refreshed_at < self.refresh_interval
+            and self.change_ratio(thumbnail) <= self.ratio_threshold
+        ):
+            return False
+        self._reference = thumbnail
+        self._refreshed_at = now
+        return True
+
+    def change_ratio(self, thumbnail: np.ndarray) -> float:
+        """Return the fraction of pixels of the thumbnail which differ from the reference frame."""
+        if self._reference is None:
+            return 1.0
+        changed_pixels = cv2.absdiff(thumbnail, self._reference) > self.pixel_threshold
+        return float(np.count_nonzero(changed_pixels)) / changed_pixels.size
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        thumbnail = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:  # noqa: PLR2004
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(thumbnail, (3, 3), 0)
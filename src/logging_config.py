@@ -1,13 +1,101 @@
+import atexit
+import gzip
 import logging
+import os
+import queue
+import shutil
+import time
+from contextlib import suppress
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 from colorlog import ColoredFormatter
 
-from .settings import CONSOLE_LOG_LEVEL, FILE_LOG_LEVEL
+from .settings import (
+    CONSOLE_LOG_LEVEL,
+    FILE_LOG_LEVEL,
+    LOG_DEBUG_RATE,
+    LOG_FILE,
+    LOG_FILE_BACKUP_COUNT,
+    LOG_FILE_COMPRESSION,
+    LOG_FILE_MAX_BYTES,
+    LOG_QUEUE_SIZE,
+)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler which never blocks the caller: records are dropped while the queue is full.
+
+    The number of dropped records is reported by a warning once the queue has room again.
+    Unlike the base class, the messages are formatted by the listener thread, hence the arguments
+    of the logging calls must not be mutated afterwards.
+    """
+
+    def __init__(self, record_queue: queue.Queue[logging.LogRecord]) -> None:
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The traceback refers to the frames which may change, so it's formatted right away.
+        if record.exc_info:
+            return super().prepare(record)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped:
+                self.queue.put_nowait(
+                    logging.makeLogRecord(
+                        {
+                            "name": __name__,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "%d log records have been dropped because the logging queue was full",
+                            "args": (self.dropped,),
+                        }
+                    )
+                )
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """Let through at most `rate` debug records per second from the same line of code.
+
+    Every line has a token bucket of `rate` tokens refilled continuously, so a debug message
+    in a hot loop is sampled instead of flooding the logs. Records of higher levels always pass.
+    """
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+        self._buckets: dict[tuple[str, int], tuple[float, float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+def _gzip_rotator(source: str, destination: str) -> None:
+    with open(source, "rb") as source_file, gzip.open(destination, "wb") as destination_file:  # noqa: PTH123
+        shutil.copyfileobj(source_file, destination_file)
+    os.remove(source)  # noqa: PTH107
+
 
 logger = logging.getLogger()
 
-# Set the logging level for the logger to the lowest level you want to log to the console.
-logger.setLevel(CONSOLE_LOG_LEVEL)
+# Set the logging level for the logger to the lowest level you want to log to the console or the file.
+logger.setLevel(min(logging.getLevelName(CONSOLE_LOG_LEVEL), logging.getLevelName(FILE_LOG_LEVEL)))
 logging.getLogger("asyncio").setLevel(logging.WARNING)
 logging.getLogger("https").setLevel(logging.ERROR)
 logging.getLogger("faker").setLevel(logging.ERROR)
@@ -36,10 +124,34 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(CONSOLE_LOG_LEVEL)  # Set the level to the lowest level you want to print to the console.
 console_handler.setFormatter(console_formatter)
 
-# Create a FileHandler to log messages to a file
-file_handler = logging.FileHandler("spot-gazer.log")
+# Create a RotatingFileHandler to log messages to a file which is rotated once it exceeds the size limit.
+# The file is opened on the first record, so that a worker process can switch to its own file first.
+file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT, delay=True)
 file_handler.setLevel(FILE_LOG_LEVEL)  # Set the level to the lowest level you want to log to the file.
 file_handler.setFormatter(file_formatter)
+if LOG_FILE_COMPRESSION:
+    file_handler.namer = lambda name: f"{name}.gz"
+    file_handler.rotator = _gzip_rotator
+
+# Formatting and I/O are done by a background thread, so logging doesn't stall the event loop.
+log_queue: queue.Queue[logging.LogRecord] = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
+queue_handler.addFilter(DebugRateLimitFilter(LOG_DEBUG_RATE))
+queue_listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+queue_listener.start()
+logger.addHandler(queue_handler)
+
+
+def set_log_file(log_file: str | os.PathLike[str]) -> None:
+    """Log to another file, e.g. the worker processes of the supervisor which can't share one rotated file."""
+    with file_handler.lock:  # type: ignore[union-attr]
+        file_handler.close()
+        file_handler.baseFilename = os.path.abspath(log_file)  # noqa: PTH100
+
 
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+@atexit.register
+def _stop_queue_listener() -> None:
+    """Flush the queued records on exit."""
+    # The sentinel can't be queued if the queue is full, the remaining records are lost then.
+    with suppress(queue.Full):
+        queue_listener.stop()
@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from threading import Lock
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+# Upper bounds (in seconds) of the duration histogram buckets.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = "spotgazer"
+DESCRIPTIONS = {
+    "decode": "Seconds spent reading the latest frame of a stream.",
+    "preprocess": "Seconds spent cropping a frame and detecting its changes.",
+    "inference": "Seconds spent running a batch through the model.",
+    "detection": "Seconds a frame waits for its detections, including the batching.",
+    "upload": "Seconds spent uploading a batch of occupancy readings.",
+    "frames": "Frames processed.",
+    "inferred_frames": "Frames run through the model.",
+    "readings": "Occupancy readings uploaded or spooled.",
+    "unchanged_readings": "Occupancy readings dropped because they equal the last published reading.",
+    "token_refreshes": "Refreshes of the backend authentication tokens.",
+    "deactivated_streams": "Streams deactivated because they are broken.",
+    "captured_frames": "Frames captured with their detections for the offline replay.",
+    "dropped_captures": "Frames not captured because the capture writer fell behind.",
+    "skipped_runs": "Runs of the parking lot processing coalesced because they were overdue.",
+    "vehicles_detected": "Vehicles detected within the region of interest of a stream.",
+    "frame_stride": "Every how many runs of its parking lot the stream is processed.",
+    "inference_size": "Size the frames of the stream are resized to for the inference.",
+    "occupied_spots": "Occupied spots of a parking lot.",
+    "scheduling_lag_seconds": "Seconds between the time the parking lot processing was due and the time it started.",
+}
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, **extra_labels: str) -> str:
+    pairs = [*labels, *extra_labels.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Format the sample value exactly, `:g` would round e.g. a long-running counter to 6 digits."""
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class StageMetrics:
+    """Durations of the pipeline stages, counters and gauges, optionally labeled (e.g. by parking lot and stream).
+
+    Durations are aggregated into histograms per label set for the Prometheus exposition (see `render`).
+    Besides, the last `max_samples` durations of every stage are kept regardless of the labels,
+    so that the percentiles in `summary` describe the recent performance.
+
+    Recording costs a couple of dictionary lookups under a lock, so it is safe to do from the inference
+    and frame reading threads while the metrics are rendered. Values which are already tracked elsewhere
+    (e.g. the scheduling lags) are better collected at render time by the callbacks registered with
+    `add_collector`.
+
+    Usage:
+    ```python
+    with metrics.measure("decode", parking_lot_id=1, stream_id=2):
+        frame = reader.read()
+    metrics.increment("frames")
+    metrics.set_gauge("vehicles_detected", 5, parking_lot_id=1, stream_id=2)
+    print(metrics.summary())
+    print(metrics.render())
+    ```
+    """
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self.max_samples = max_samples
+        self._durations: defaultdict[str, deque[float]] = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self.counters: Counter[str] = Counter()
+        """Totals of the counters regardless of the labels."""
+        self._histograms: dict[tuple[str, Labels], list[float]] = {}
+        self._labeled_counters: Counter[tuple[str, Labels]] = Counter()
+        self._gauges: dict[tuple[str, Labels], float] = {}
+        self._collectors: list[Callable[[StageMetrics], None]] = []
+        self._lock = Lock()
+
+    @contextmanager
+    def measure(self, stage: str, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def observe(self, stage: str, duration: float, **labels: object) -> None:
+        key = (stage, tuple((name, str(value)) for name, value in labels.items()))
+        with self._lock:
+            self._durations[stage].append(duration)
+            # Bucket counts (non-cumulative), followed by the sum and the count.
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0.0] * (len(BUCKETS) + 3)
+            histogram[bisect_left(BUCKETS, duration)] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+
+    def increment(self, counter: str, value: int = 1, **labels: object) -> None:
+        key = (counter, tuple((name, str(label)) for name, label in labels.items()))
+        with self._lock:
+            self.counters[counter] += value
+            if labels:
+                self._labeled_counters[key] += value
+
+    def set_gauge(self, gauge: str, value: float, **labels: object) -> None:
+        key = (gauge, tuple((name, str(label)) for name, label in labels.items()))
+        with self._lock:
+            self._gauges[key] = value
+
+    def forget(self, **labels: object) -> None:
+        """Drop the labeled series of e.g. a released stream, so that they aren't exposed anymore."""
+        matched_labels = {(name, str(value)) for name, value in labels.items()}
+        with self._lock:
+            for series in (self._histograms, self._labeled_counters, self._gauges):
+                for key in [key for key in series if matched_labels <= set(key[1])]:
+                    del series[key]
+
+    def add_collector(self, collector: Callable[["StageMetrics"], None]) -> None:
+        """Register a callback which updates the metrics right before they are rendered."""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[["StageMetrics"], None]) -> None:
+        self._collectors.remove(collector)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Return the number of samples, the mean and the percentiles of every stage duration in seconds."""
+        with self._lock:
+            durations = {stage: list(stage_durations) for stage, stage_durations in self._durations.items()}
+        summary = {}
+        for stage, stage_durations in durations.items():
+            samples = np.array(stage_durations, dtype=np.float64)
+            if not samples.size:
+                continue
+            percentiles = np.percentile(samples, PERCENTILES)
+            summary[stage] = {
+                "count": samples.size,
+                "mean": float(samples.mean()),
+                **{f"p{q}": float(value) for q, value in zip(PERCENTILES, percentiles, strict=True)},
+            }
+        return summary
+
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        for collector in self._collectors:
+            collector(self)
+        lines: list[str] = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            labeled_counters = sorted(self._labeled_counters.items())
+            gauges = sorted(self._gauges.items())
+            totals = sorted(self.counters.items())
+
+        current_name = None
+        for (stage, labels), histogram in histograms:
+            name = f"{PREFIX}_{stage}_seconds"
+            if name != current_name:
+                current_name = name
+                lines += [f"# HELP {name} {DESCRIPTIONS.get(stage, stage)}", f"# TYPE {name} histogram"]
+            cumulative_count = 0.0
+            for upper_bound, count in zip((*BUCKETS, "+Inf"), histogram, strict=False):
+                cumulative_count += count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=str(upper_bound))} {int(cumulative_count)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram[-2]!r}")
+            lines.append(f"{name}_count{_format_labels(labels)} {int(histogram[-1])}")
+
+        # Counters without labeled series are exposed as totals.
+        counters = [((counter, ()), value) for counter, value in totals]
+        labeled_counter_names = {counter for (counter, _), _ in labeled_counters}
+        counters = [item for item in counters if item[0][0] not in labeled_counter_names] + labeled_counters
+        for metric_type, series, suffix in (("counter", counters, "_total"), ("gauge", gauges, "")):
+            current_name = None
+            for (metric, labels), value in sorted(series):
+                name = f"{PREFIX}_{metric}{suffix}"
+                if name != current_name:
+                    current_name = name
+                    lines += [f"# HELP {name} {DESCRIPTIONS.get(metric, metric)}", f"# TYPE {name} {metric_type}"]
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self.counters.clear()
+            self._histograms.clear()
+            self._labeled_counters.clear()
+            self._gauges.clear()
+
+
+metrics = StageMetrics()
+"""Metrics of the current process."""
@@ -0,0 +1,91 @@
+from aiohttp import web
+
+from .logging_config import logging
+from .metrics import StageMetrics, metrics
+from .profiler import SamplingProfiler
+from .settings import METRICS_HOST, METRICS_PORT, PROFILER_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricsServer:
+    """Local HTTP server exposing the worker metrics and controlling the sampling profiler.
+
+    Endpoints:
+    - `GET /metrics`: the metrics in the Prometheus text format.
+    - `POST /profiler/start?interval=0.01`: start (or restart) sampling the stacks of all threads.
+    - `GET /profiler`: the samples collected so far in the collapsed stack format.
+    - `POST /profiler/stop`: stop sampling and return the collected samples.
+
+    Usage:
+    ```python
+    server = MetricsServer(port=9100)
+    await server.start()
+    ...
+    await server.stop()
+    ```
+    """
+
+    def __init__(
+        self,
+        host: str = METRICS_HOST,
+        port: int = METRICS_PORT,
+        stage_metrics: StageMetrics = metrics,
+        profiler_interval: float = PROFILER_INTERVAL,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.metrics = stage_metrics
+        self.profiler = SamplingProfiler(profiler_interval)
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self._metrics)
+        self.app.router.add_get("/profiler", self._profile)
+        self.app.router.add_post("/profiler/start", self._start_profiler)
+        self.app.router.add_post("/profiler/stop", self._stop_profiler)
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        """Start serving unless the port is 0. Failing to bind the port doesn't stop the worker."""
+        if not self.port or self._runner is not None:
+            return
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError:
+            logger.exception("Can't serve the metrics on %s:%d", self.host, self.port)
+            await self.stop()
+            return
+        logger.info("Serving the metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        if self.profiler.is_running:
+            self.profiler.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _metrics(self, _: web.Request) -> web.Response:
+        return web.Response(body=self.metrics.render(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def _profile(self, _: web.Request) -> web.Response:
+        return web.Response(text=self.profiler.collapsed())
+
+    async def _start_profiler(self, request: web.Request) -> web.Response:
+        try:
+            interval = float(request.query.get("interval", self.profiler.interval))
+        except ValueError as exc:
+            raise web.HTTPBadRequest(text="The interval must be a number of seconds") from exc
+        if interval <= 0:
+            raise web.HTTPBadRequest(text="The interval must be positive")
+        if self.profiler.is_running:
+            self.profiler.stop()
+        self.profiler.interval = interval
+        self.profiler.start()
+        return web.Response(text="Profiler started\n")
+
+    async def _stop_profiler(self, _: web.Request) -> web.Response:
+        self.profiler.stop()
+        return web.Response(text=self.profiler.collapsed())
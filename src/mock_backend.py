@@ -0,0 +1,113 @@
+import hashlib
+import json
+import secrets
+import time
+from typing import Any
+
+from aiohttp import web
+from jwt import encode
+
+from .settings import OCCUPANCY_URL, TOKEN_REFRESH_URL, TOKEN_URL
+
+ACCESS_TOKEN_LIFETIME = 5 * 60
+REFRESH_TOKEN_LIFETIME = 24 * 60 * 60
+
+
+class MockBackend:
+    """Local stand-in for the SpotGazer backend, serving the given parking lots.
+
+    Implements the endpoints used by the worker: token obtaining and refreshing, video stream
+    sources listing (paginated, with ETags) and deactivation, and occupancy uploads (single readings or lists of them).
+    Uploaded readings are kept in `readings`.
+
+    Usage:
+    ```python
+    backend = MockBackend([{"parking_lot_id": 1, "processing_rate": 1, "streams": [...]}])
+    base_url = await backend.start()
+    ...
+    await backend.stop()
+    ```
+    """
+
+    def __init__(self, parking_lots: list[dict[str, Any]]) -> None:
+        self.parking_lots = parking_lots
+        self.readings: list[dict[str, Any]] = []
+        self._key = secrets.token_hex()
+        self.app = web.Application()
+        self.app.router.add_post(TOKEN_URL, self._obtain_tokens)
+        self.app.router.add_post(TOKEN_REFRESH_URL, self._refresh_token)
+        self.app.router.add_get("/api/video-stream-sources/", self._list_video_stream_sources)
+        self.app.router.add_patch("/api/video-stream-sources/{id}/", self._update_video_stream_source)
+        self.app.router.add_post(OCCUPANCY_URL, self._create_occupancy)
+        self._runner: web.AppRunner | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        _, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _token(self, token_type: str, lifetime: int) -> str:
+        payload = {"token_type": token_type, "exp": time.time() + lifetime, "jti": secrets.token_hex(8)}
+        return encode(payload, self._key, algorithm="HS256")
+
+    async def _obtain_tokens(self, _: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "access": self._token("access", ACCESS_TOKEN_LIFETIME),
+                "refresh": self._token("refresh", REFRESH_TOKEN_LIFETIME),
+            }
+        )
+
+    async def _refresh_token(self, _: web.Request) -> web.Response:
+        return web.json_response({"access": self._token("access", ACCESS_TOKEN_LIFETIME)})
+
+    async def _list_video_stream_sources(self, request: web.Request) -> web.Response:
+        limit = int(request.query.get("limit", 20))
+        offset = int(request.query.get("offset", 0))
+        active_only = request.query.get("active_only") == "1"
+        parking_lots = []
+        for parking_lot in self.parking_lots:
+            streams = [stream for stream in parking_lot["streams"] if stream["is_active"] or not active_only]
+            if streams:
+                parking_lots.append({**parking_lot, "streams": streams})
+        # A page holds as many parking lots as fit the limit of streams.
+        results = []
+        for parking_lot in parking_lots[offset:]:
+            if len(parking_lot["streams"]) > limit:
+                break
+            limit -= len(parking_lot["streams"])
+            results.append(parking_lot)
+        next_offset = offset + len(results)
+        next_url = str(request.url.update_query(offset=next_offset)) if next_offset < len(parking_lots) else None
+        # Every page has its own ETag. The lease time in the next URL changes with every request, so it isn't hashed.
+        content = json.dumps([results, next_url is not None], sort_keys=True)
+        etag = f'"{hashlib.sha1(content.encode()).hexdigest()}"'  # noqa: S324
+        if request.headers.get("If-None-Match") == etag:
+            raise web.HTTPNotModified(headers={"ETag": etag})
+        return web.json_response({"results": results, "next": next_url}, headers={"ETag": etag})
+
+    async def _update_video_stream_source(self, request: web.Request) -> web.Response:
+        id_ = int(request.match_info["id"])
+        data = await request.post()
+        for parking_lot in self.parking_lots:
+            for stream in parking_lot["streams"]:
+                if stream["id"] == id_:
+                    if "is_active" in data:
+                        stream["is_active"] = bool(int(data["is_active"]))  # type: ignore[arg-type]
+                    return web.json_response(stream)
+        raise web.HTTPNotFound
+
+    async def _create_occupancy(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        readings = payload if isinstance(payload, list) else [payload]
+        self.readings.extend(readings)
+        return web.json_response(payload, status=web.HTTPCreated.status_code)
@@ -0,0 +1,82 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import Literal
+
+from ultralytics import YOLO
+
+from .logging_config import logging
+from .settings import (
+    INFERENCE_BACKEND,
+    MODEL_CACHE_DIR,
+    MODEL_PRECISION,
+    YOLO_PREDICTION_PARAMETERS,
+)
+
+logger = logging.getLogger(__name__)
+
+Backend = Literal["pytorch", "onnx", "openvino"]
+Precision = Literal["fp32", "fp16", "int8"]
+
+# Suffixes the exported artifacts must have to be recognized by Ultralytics.
+ARTIFACT_SUFFIXES = {"onnx": ".onnx", "openvino": "_openvino_model"}
+
+
+def _file_digest(path: Path) -> str:
+    with path.open("rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+
+def load_model(  # noqa: PLR0913
+    model: str | Path,
+    task: str,
+    *,
+    backend: Backend = INFERENCE_BACKEND,  # type: ignore[assignment]
+    imgsz: int = YOLO_PREDICTION_PARAMETERS["imgsz"],  # type: ignore[assignment]
+    precision: Precision = MODEL_PRECISION,  # type: ignore[assignment]
+    cache_dir: Path = MODEL_CACHE_DIR,
+) -> YOLO:
+    """Load the model for the given inference backend, exporting it on first use.
+
+    The PyTorch checkpoint is loaded as is. For other backends the checkpoint is exported once
+    and the artifact is cached in `cache_dir` under a name derived from the checkpoint content,
+    the backend, the image size and the precision. Subsequent starts load the cached artifact
+    right away. The exported models accept batches of any size.
+
+    FP16 and INT8 precisions are only applied where the backend supports them on CPU
+    (e.g. OpenVINO), otherwise the export fails.
+    """
+    yolo = YOLO(model=model, task=task)
+    if backend == "pytorch":
+        return yolo
+
+    checkpoint = Path(yolo.ckpt_path or model)
+    key = hashlib.sha256(f"{_file_digest(checkpoint)}:{backend}:{imgsz}:{precision}".encode()).hexdigest()[:16]
+    artifact = cache_dir / f"{checkpoint.stem}-{key}{ARTIFACT_SUFFIXES[backend]}"
+    if artifact.exists():
+        logger.info("Loading the cached %s model %s", backend, artifact)
+        return YOLO(model=artifact, task=task)
+
+    logger.info("Exporting %s to %s with %s precision, this is done only once", checkpoint, backend, precision)
+    exported = Path(
+        yolo.export(
+            format=backend,
+            imgsz=imgsz,
+            half=precision == "fp16",
+            int8=precision == "int8",
+            dynamic=True,
+        )
+    )
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        # Several workers may export the same model at once, any of the finished exports will do.
+        os.rename(exported, artifact)  # noqa: PTH104
+    except OSError:
+        if not artifact.exists():
+            raise
+        if exported.is_dir():
+            shutil.rmtree(exported)
+        else:
+            exported.unlink()
+    return YOLO(model=artifact, task=task)
@@ -0,0 +1,241 @@
+import asyncio
+import time
+from collections.abc import Iterable
+from contextlib import suppress
+from datetime import UTC, datetime
+from http import HTTPStatus
+from typing import Any, cast
+
+from aiohttp import ClientError, ClientResponseError
+
+from .aiohttp_jwt_client import AiohttpJWTClient
+from .logging_config import logging
+from .metrics import metrics
+from .occupancy_spool import OccupancySpool
+from .settings import (
+    OCCUPANCY_BULK_URL,
+    OCCUPANCY_FLUSH_INTERVAL,
+    OCCUPANCY_FLUSH_SIZE,
+    OCCUPANCY_MAX_PARALLEL_UPLOADS,
+    OCCUPANCY_SPOOL_DRAIN_BACKOFF,
+    OCCUPANCY_SPOOL_DRAIN_BATCH_SIZE,
+    OCCUPANCY_SPOOL_DRAIN_RATE,
+    OCCUPANCY_SPOOL_MAX_DRAIN_BACKOFF,
+    OCCUPANCY_UNCHANGED_INTERVAL,
+    OCCUPANCY_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+BULK_UNSUPPORTED_STATUSES = {HTTPStatus.NOT_FOUND, HTTPStatus.METHOD_NOT_ALLOWED}
+
+
+class OccupancyPublisher:
+    """Buffer occupancy readings in memory and upload them in batches.
+
+    Only the latest reading of every parking lot is kept, older readings of the same parking lot
+    are superseded before they are sent. The buffer is flushed once it holds `flush_size`
+    readings or every `flush_interval` seconds, whatever comes first.
+
+    If `bulk_url` is set, the whole buffer is sent in a single request. Otherwise (or if the
+    backend doesn't provide the bulk endpoint) the readings are posted one by one, at most
+    `max_parallel_uploads` at a time.
+
+    Readings which fail to upload for any reason are kept for the next flush. If a `spool` is given, they are
+    written to it instead, and a background task replays the spool with an exponential backoff
+    and at most `drain_rate` readings per second once the backend is reachable again. Thus no
+    reading taken during a backend outage is lost, even if the worker is restarted.
+
+    Usage:
+    ```python
+    publisher = OccupancyPublisher(http_client)
+    publisher.start()
+    publisher.publish(parking_lot_id=1, occupied_spots=12)
+    await publisher.close()  # Flushes the remaining readings.
+    ```
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        http_client: AiohttpJWTClient,
+        *,
+        flush_size: int = OCCUPANCY_FLUSH_SIZE,
+        flush_interval: float = OCCUPANCY_FLUSH_INTERVAL,
+        bulk_url: str | None = OCCUPANCY_BULK_URL,
+        max_parallel_uploads: int = OCCUPANCY_MAX_PARALLEL_UPLOADS,
+        spool: OccupancySpool | None = None,
+        drain_batch_size: int = OCCUPANCY_SPOOL_DRAIN_BATCH_SIZE,
+        drain_rate: float = OCCUPANCY_SPOOL_DRAIN_RATE,
+        drain_backoff: float = OCCUPANCY_SPOOL_DRAIN_BACKOFF,
+        max_drain_backoff: float = OCCUPANCY_SPOOL_MAX_DRAIN_BACKOFF,
+        unchanged_interval: float = OCCUPANCY_UNCHANGED_INTERVAL,
+    ) -> None:
+        self.http_client = http_client
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.bulk_url = bulk_url
+        self._readings: dict[int, dict[str, Any]] = {}
+        self._flush_requested = asyncio.Event()
+        self._upload_semaphore = asyncio.Semaphore(max_parallel_uploads)
+        self.spool = spool
+        self.drain_batch_size = drain_batch_size
+        self.drain_rate = drain_rate
+        self.drain_backoff = drain_backoff
+        self.max_drain_backoff = max_drain_backoff
+        self.unchanged_interval = unchanged_interval
+        self._last_published: dict[int, tuple[tuple[int, list[dict[str, Any]] | None], float]] = {}
+        self._spooled = asyncio.Event()
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def publish(self, parking_lot_id: int, occupied_spots: int, spots: list[dict[str, Any]] | None = None) -> None:
+        """Buffer the reading, superseding the pending reading of the same parking lot, unless it's unchanged.
+
+        Args:
+            parking_lot_id: ID of the parking lot.
+            occupied_spots: Number of occupied spots of the parking lot.
+            spots: Occupancy of the individual spots, e.g. `[{"id": 1, "is_occupied": True}]`, if they are configured.
+        """
+        value = (occupied_spots, spots)
+        last_published = self._last_published.get(parking_lot_id)
+        now = time.monotonic()
+        if (
+            last_published is not None
+            and last_published[0] == value
+            and now - last_published[1] < self.unchanged_interval
+        ):
+            metrics.increment("unchanged_readings")
+            return
+        self._last_published[parking_lot_id] = (value, now)
+
+        reading = {
+            "parking_lot_id": parking_lot_id,
+            "occupied_spots": occupied_spots,
+            # Readings may be uploaded long after they were taken, e.g. when replayed from the spool.
+            "recorded_at": datetime.now(UTC).isoformat(),
+        }
+        if spots is not None:
+            reading["spots"] = spots
+        self._readings[parking_lot_id] = reading
+        if len(self._readings) >= self.flush_size:
+            self._flush_requested.set()
+
+    def start(self) -> None:
+        """Start flushing the buffer and draining the spool in the background."""
+        if not self._tasks:
+            self._tasks.append(asyncio.create_task(self._run()))
+            if self.spool is not None:
+                self._tasks.append(asyncio.create_task(self._drain_spool()))
+
+    async def close(self) -> None:
+        """Stop the background tasks and upload (or spool) the remaining readings."""
+        for task in self._tasks:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks.clear()
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Upload all buffered readings."""
+        self._flush_requested.clear()
+        readings, self._readings = self._readings, {}
+        if not readings:
+            return
+
+        with metrics.measure("upload"):
+            uploaded = await self._upload_readings(list(readings.values()))
+        metrics.increment("readings", len(readings))
+        failed_readings = [reading for reading, success in zip(readings.values(), uploaded, strict=True) if not success]
+        if not failed_readings:
+            return
+        logger.error("Failed to upload %d occupancy readings", len(failed_readings))
+        if self.spool is None:
+            self._requeue(failed_readings)
+            return
+        # Spooled readings are replayed in the background once the backend recovers.
+        try:
+            await asyncio.to_thread(self.spool.append, failed_readings)
+        except Exception:
+            logger.exception("Failed to spool %d occupancy readings, keeping them in memory", len(failed_readings))
+            self._requeue(failed_readings)
+        else:
+            self._spooled.set()
+
+    def _requeue(self, readings: Iterable[dict[str, Any]]) -> None:
+        """Keep the readings for the next flush unless they have been superseded in the meantime."""
+        for reading in readings:
+            self._readings.setdefault(reading["parking_lot_id"], reading)
+
+    async def _run(self) -> None:
+        while True:
+            with suppress(TimeoutError):
+                async with asyncio.timeout(self.flush_interval):
+                    await self._flush_requested.wait()
+            # A failed flush must not stop the uploads for good.
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to flush the occupancy readings")
+
+    async def _drain_spool(self) -> None:
+        """Replay the spooled readings, oldest first, backing off while the backend is unavailable."""
+        spool = cast("OccupancySpool", self.spool)
+        backoff = self.drain_backoff
+        while True:
+            # Clear the flag before peeking, so that readings spooled in the meantime aren't missed.
+            self._spooled.clear()
+            spooled_readings = await asyncio.to_thread(spool.peek, self.drain_batch_size)
+            if not spooled_readings:
+                await self._spooled.wait()
+                continue
+
+            uploaded = await self._upload_readings([reading for _, reading in spooled_readings])
+            uploaded_ids = [id_ for (id_, _), success in zip(spooled_readings, uploaded, strict=True) if success]
+            await asyncio.to_thread(spool.delete, uploaded_ids)
+            if len(uploaded_ids) < len(spooled_readings):
+                logger.warning("Replay of the occupancy spool failed, retrying in %.0f seconds", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_drain_backoff)
+                continue
+
+            logger.info("%d spooled occupancy readings have been replayed", len(uploaded_ids))
+            backoff = self.drain_backoff
+            # Limit the replay throughput to spare the recovering backend.
+            await asyncio.sleep(len(uploaded_ids) / self.drain_rate)
+
+    async def _upload_readings(self, readings: list[dict[str, Any]]) -> list[bool]:
+        """Upload the readings and return whether each of them has been uploaded successfully."""
+        if self.bulk_url:
+            try:
+                await self._upload_bulk(readings)
+            except Exception as exc:
+                # Besides the network errors, e.g. a token refresh may fail on an unexpected response.
+                if not (isinstance(exc, ClientResponseError) and exc.status in BULK_UNSUPPORTED_STATUSES):
+                    logger.exception("Failed to upload %d occupancy readings in bulk", len(readings))
+                    return [False] * len(readings)
+                logger.warning("Bulk occupancy endpoint is unavailable, falling back to single uploads")
+                self.bulk_url = None
+            else:
+                return [True] * len(readings)
+
+        results = await asyncio.gather(*(self._upload(reading) for reading in readings), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, ClientError | TimeoutError):
+                logger.error("Unexpected failure of an occupancy upload", exc_info=result)
+        return [not isinstance(result, Exception) for result in results]
+
+    async def _upload_bulk(self, readings: list[dict[str, Any]]) -> None:
+        response = await self.http_client.request_json(
+            self.bulk_url,  # type: ignore[arg-type]
+            method="post",
+            json=readings,
+            raise_for_status=True,
+        )
+        logger.debug(response)
+
+    async def _upload(self, reading: dict[str, Any]) -> None:
+        async with self._upload_semaphore:
+            occupancy = await self.http_client.request_json(
+                OCCUPANCY_URL, method="post", json=reading, raise_for_status=True
+            )
+        logger.debug(occupancy)
@@ -0,0 +1,51 @@
+from collections import deque
+
+import numpy as np
+
+from .settings import OCCUPANCY_HYSTERESIS, OCCUPANCY_SMOOTHING_WINDOW
+
+
+class OccupancySmoother:
+    """Temporal filter stabilizing the occupancy of a stream over its last `window` observations.
+
+    Detections jitter from frame to frame because of occlusions and confidences close to the
+    threshold. The filter suppresses the jitter:
+    - The number of vehicles is the median of the window, so a car missed (or a shadow detected)
+      in a minority of the frames doesn't change it.
+    - Every spot keeps its state until more than `hysteresis` of the window disagrees with it,
+      so a spot flickering around the majority doesn't flip back and forth.
+
+    A window of 1 disables the smoothing.
+
+    Usage:
+    ```python
+    smoother = OccupancySmoother(spots=len(geometry.spot_ids))
+    vehicles, spots_occupancy = smoother.update(*geometry.assign(boxes))
+    ```
+    """
+
+    def __init__(
+        self, spots: int = 0, window: int = OCCUPANCY_SMOOTHING_WINDOW, hysteresis: float = OCCUPANCY_HYSTERESIS
+    ) -> None:
+        self.window = window
+        self.hysteresis = hysteresis
+        self._vehicles: deque[int] = deque(maxlen=window)
+        self._spots_occupancy: deque[np.ndarray] = deque(maxlen=window)
+        self.vehicles = 0
+        """Current smoothed number of vehicles."""
+        self.spots_occupancy = np.zeros(spots, dtype=bool)
+        """Current smoothed occupancy of the spots."""
+
+    def update(self, vehicles: int, spots_occupancy: np.ndarray) -> tuple[int, np.ndarray]:
+        """Add the observation of the latest frame and return the smoothed one."""
+        self._vehicles.append(vehicles)
+        self._spots_occupancy.append(spots_occupancy)
+        if len(self._spots_occupancy) == 1:
+            # Start from the first observation rather than from empty spots.
+            self.spots_occupancy = spots_occupancy.copy()
+        else:
+            occupied_ratio = np.mean(self._spots_occupancy, axis=0)
+            disagreement = np.where(self.spots_occupancy, 1 - occupied_ratio, occupied_ratio)
+            self.spots_occupancy = self.spots_occupancy ^ (disagreement > self.hysteresis)
+        self.vehicles = int(np.median(self._vehicles))
+        return self.vehicles, self.spots_occupancy
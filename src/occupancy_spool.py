@@ -0,0 +1,77 @@
+import json
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+from threading import Lock
+from typing import Any
+
+from .logging_config import logging
+from .settings import OCCUPANCY_SPOOL_MAX_READINGS, OCCUPANCY_SPOOL_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class OccupancySpool:
+    """Append-only on-disk queue of occupancy readings which couldn't be uploaded.
+
+    Readings are stored in SQLite in the order they were spooled and survive process restarts.
+    Once more than `max_readings` readings are spooled, the oldest ones are discarded.
+
+    The methods are blocking, run them in a thread (e.g. with `asyncio.to_thread`)
+    when called from a coroutine.
+
+    Usage:
+    ```python
+    spool = OccupancySpool("occupancy-spool.sqlite3")
+    spool.append([{"parking_lot_id": 1, "occupied_spots": 12}])
+    for id_, reading in spool.peek(100):
+        ...
+    spool.delete([id_])
+    spool.close()
+    ```
+    """
+
+    def __init__(
+        self, path: str | Path = OCCUPANCY_SPOOL_PATH, max_readings: int = OCCUPANCY_SPOOL_MAX_READINGS
+    ) -> None:
+        self.path = path
+        self.max_readings = max_readings
+        self._lock = Lock()
+        # The connection is shared by the worker threads, the access is serialized with the lock.
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS readings (id INTEGER PRIMARY KEY AUTOINCREMENT, reading TEXT NOT NULL)"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def append(self, readings: Iterable[dict[str, Any]]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT INTO readings (reading) VALUES (?)", ((json.dumps(reading),) for reading in readings)
+            )
+            discarded = self._connection.execute(
+                "DELETE FROM readings WHERE id <= (SELECT MAX(id) FROM readings) - ?", (self.max_readings,)
+            ).rowcount
+        if discarded:
+            logger.warning("The occupancy spool is full, %d oldest readings have been discarded", discarded)
+
+    def peek(self, limit: int) -> list[tuple[int, dict[str, Any]]]:
+        """Return up to `limit` oldest readings along with their IDs without removing them."""
+        with self._lock:
+            rows = self._connection.execute("SELECT id, reading FROM readings ORDER BY id LIMIT ?", (limit,))
+            return [(id_, json.loads(reading)) for id_, reading in rows]
+
+    def delete(self, ids: Iterable[int]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany("DELETE FROM readings WHERE id = ?", ((id_,) for id_ in ids))
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,78 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+from .logging_config import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Statistical profiler sampling the call stacks of all threads of the process.
+
+    A background thread takes a snapshot of the stacks every `interval` seconds, so the overhead
+    is bounded by the sampling rate and nothing is instrumented. Samples are aggregated in the
+    collapsed stack format (`thread;outer;...;inner count`) understood by flame graph tools, e.g.
+    https://www.speedscope.app/ or `flamegraph.pl`.
+
+    Usage:
+    ```python
+    profiler = SamplingProfiler()
+    profiler.start()
+    ...
+    profiler.stop()
+    print(profiler.collapsed())
+    ```
+    """
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling from scratch."""
+        if self.is_running:
+            return
+        self.samples.clear()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, daemon=True, name="sampling-profiler")
+        self._thread.start()
+        logger.info("Sampling profiler started with a %.3f-second interval", self.interval)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            logger.info("Sampling profiler stopped after collecting %d samples", self.samples.total())
+
+    def collapsed(self) -> str:
+        """Return the samples in the collapsed stack format, the most frequent stacks first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def _sample(self) -> None:
+        own_thread_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            started_at = time.perf_counter()
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():  # noqa: SLF001
+                if thread_id == own_thread_id:
+                    continue
+                stack = []
+                current_frame = frame
+                while current_frame is not None:
+                    code = current_frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    current_frame = current_frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            # Don't let the sampling itself eat more than a fraction of the CPU.
+            if (elapsed := time.perf_counter() - started_at) > self.interval:
+                self._stopped.wait(elapsed)
@@ -0,0 +1,130 @@
+import time
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from .benchmark import current_commit
+from .capture import REPLAY_SCHEME, read_capture_metadata, read_captured_frames
+from .logging_config import logging
+from .metrics import metrics
+from .mock_backend import MockBackend
+from .resources import get_rss
+from .settings import REPLAY_MAX_SPEED_PROCESSING_RATE, YOLO_PREDICTION_PARAMETERS
+from .spot_gazer import SpotGazer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReplayConfig:
+    capture_dir: Path
+    """Directory the frames have been captured to, see `CaptureWriter`."""
+    realtime: bool = False
+    """Replay the frames at the pace they were captured at rather than as fast as possible."""
+    model: str = YOLO_PREDICTION_PARAMETERS["model"]  # type: ignore[assignment]
+
+
+def build_replay_parking_lots(capture_dir: Path, *, realtime: bool = False) -> list[dict[str, Any]]:
+    """Rebuild the parking lots of the captured streams with the streams replaying their captures."""
+    parking_lots: dict[int, dict[str, Any]] = {}
+    for stream_directory in sorted(path.parent for path in capture_dir.glob("*/stream.json")):
+        metadata = read_capture_metadata(stream_directory)
+        parking_lot = parking_lots.setdefault(
+            metadata["parking_lot_id"],
+            {
+                "parking_lot_id": metadata["parking_lot_id"],
+                "processing_rate": metadata["processing_rate"] if realtime else REPLAY_MAX_SPEED_PROCESSING_RATE,
+                "streams": [],
+            },
+        )
+        speed = "realtime" if realtime else "max"
+        parking_lot["streams"].append(
+            {
+                **metadata["stream"],
+                "stream_source": f"{REPLAY_SCHEME}{stream_directory.resolve()}?speed={speed}",
+                "is_active": True,
+                "in_use_until": None,
+            }
+        )
+    return list(parking_lots.values())
+
+
+def compare_captures(recorded_dir: Path, replayed_dir: Path) -> dict[str, Any]:
+    """Compare the detections of the replayed frames with the recorded ones.
+
+    Frames are matched by their stream and the time they were grabbed at. A frame has changed
+    if the number of its detections differs.
+    """
+    frames = changed_frames = absolute_difference = 0
+    for replayed_stream_directory in sorted(replayed_dir.glob("stream-*")):
+        recorded_stream_directory = recorded_dir / replayed_stream_directory.name
+        if not recorded_stream_directory.is_dir():
+            continue
+        recorded_boxes = {
+            frame.timestamp: len(frame.boxes) for frame in read_captured_frames(recorded_stream_directory)
+        }
+        for frame in read_captured_frames(replayed_stream_directory):
+            if (recorded_vehicles := recorded_boxes.get(frame.timestamp)) is None:
+                continue
+            difference = abs(len(frame.boxes) - recorded_vehicles)
+            frames += 1
+            changed_frames += bool(difference)
+            absolute_difference += difference
+    return {
+        "frames": frames,
+        "changed_frames": changed_frames,
+        "mean_absolute_difference": absolute_difference / frames if frames else 0.0,
+    }
+
+
+async def run_replay(config: ReplayConfig) -> dict[str, Any]:
+    """Replay the captured streams through the detection pipeline and return the performance and the comparison.
+
+    The replayed frames and their detections are captured again to be compared with the recorded ones.
+    The replay ends once all the captured frames have been processed.
+    """
+    parking_lots = build_replay_parking_lots(config.capture_dir, realtime=config.realtime)
+    streams = sum(len(parking_lot["streams"]) for parking_lot in parking_lots)
+    if not streams:
+        msg = f"No streams have been captured in {config.capture_dir}"
+        raise FileNotFoundError(msg)
+
+    with TemporaryDirectory(prefix="spot-gazer-replay-") as directory:
+        replayed_dir = Path(directory) / "capture"
+        backend = MockBackend(parking_lots)
+        base_url = await backend.start()
+        spot_gazer = SpotGazer(
+            config.model,
+            occupancy_spool_path=Path(directory) / "spool.sqlite3",
+            base_url=base_url,
+            metrics_port=0,
+            capture_dir=replayed_dir,
+            allow_replay=True,
+        )
+        metrics.reset()
+        started_at, cpu_started_at = time.perf_counter(), time.process_time()
+        try:
+            # The replayed streams end with their captures, then the detection stops.
+            await spot_gazer.start_detection(datetime.now(UTC), limit_streams=streams)
+        finally:
+            elapsed, cpu_time = time.perf_counter() - started_at, time.process_time() - cpu_started_at
+            await spot_gazer.stop_detection()
+            await backend.stop()
+
+        return {
+            "commit": current_commit(),
+            "created_at": datetime.now(UTC).isoformat(),
+            "config": {**asdict(config), "capture_dir": str(config.capture_dir)},
+            "streams": streams,
+            "elapsed": elapsed,
+            "frames": metrics.counters["frames"],
+            "frames_per_second": metrics.counters["frames"] / elapsed,
+            "inferred_frames_per_second": metrics.counters["inferred_frames"] / elapsed,
+            "uploaded_readings": len(backend.readings),
+            "stages": metrics.summary(),
+            "rss_bytes": get_rss(),
+            "cpu_percent": 100 * cpu_time / elapsed,
+            "detections": compare_captures(config.capture_dir, replayed_dir),
+        }
@@ -0,0 +1,26 @@
+import os
+import resource
+from pathlib import Path
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def get_rss() -> int:
+    """Return the resident set size of the current process in bytes.
+
+    Falls back to the peak RSS on systems without procfs.
+    """
+    try:
+        # The second field is the number of resident pages.
+        return int(Path("/proc/self/statm").read_text().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        # `ru_maxrss` is in kilobytes on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_cpu_load() -> float:
+    """Return the 1-minute load average of the node per CPU, i.e. about 1 once all CPUs are busy."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return 0.0
@@ -0,0 +1,98 @@
+from typing import Any
+
+import cv2
+import numpy as np
+
+NO_SPOT = -1
+
+
+def _to_pixels(polygon: list[list[float]], width: int, height: int) -> np.ndarray:
+    """Scale the polygon given in coordinates relative to the frame size (0..1) to pixels."""
+    return np.round(np.asarray(polygon, dtype=np.float32) * (width - 1, height - 1)).astype(np.int32)
+
+
+class StreamGeometry:
+    """Region of interest (ROI) and parking spots of a stream rasterized for a single frame resolution.
+
+    Polygons are given as lists of `[x, y]` points relative to the frame size, so the same
+    configuration fits any resolution of the stream. They are rasterized once on creation:
+    - The ROI mask hides non-parking zones, and frames are cropped to the ROI bounding box
+      before inference, so fewer pixels go through the model.
+    - The spot map holds the index of the parking spot every pixel belongs to, so detections
+      are assigned to spots with a single array lookup.
+    - The overlap mask marks the zones also covered by another camera of the parking lot.
+      Vehicles there are counted by the other camera only, so they aren't counted twice.
+      Spots seen by several cameras share their ID and are merged by the caller instead.
+
+    Usage:
+    ```python
+    geometry = StreamGeometry((720, 1280), roi=[[[0, 0.5], [1, 0.5], [1, 1], [0, 1]]], spots=spots)
+    cropped_frame = geometry.crop(frame)
+    occupancy = geometry.assign(boxes)  # Boxes detected on the cropped frame.
+    ```
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, int],
+        roi: list[list[list[float]]] | None = None,
+        spots: list[dict[str, Any]] | None = None,
+        overlap: list[list[list[float]]] | None = None,
+    ) -> None:
+        self.shape = shape
+        height, width = shape
+        self.roi_mask: np.ndarray | None = None
+        self.bbox = (0, 0, width, height)
+        if roi:
+            polygons = [_to_pixels(polygon, width, height) for polygon in roi]
+            self.roi_mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(self.roi_mask, polygons, 1)
+            x, y, w, h = cv2.boundingRect(np.concatenate(polygons))
+            self.bbox = (x, y, x + w, y + h)
+
+        spots = spots or []
+        self.spot_ids = [spot["id"] for spot in spots]
+        self.spot_map: np.ndarray | None = None
+        if spots:
+            self.spot_map = np.full(shape, NO_SPOT, dtype=np.int32)
+            for index, spot in enumerate(spots):
+                cv2.fillPoly(self.spot_map, [_to_pixels(spot["polygon"], width, height)], index)
+
+        self.overlap_mask: np.ndarray | None = None
+        if overlap:
+            self.overlap_mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(self.overlap_mask, [_to_pixels(polygon, width, height) for polygon in overlap], 1)
+
+        x0, y0, x1, y1 = self.bbox
+        self._cropped_roi_mask = None if self.roi_mask is None else self.roi_mask[y0:y1, x0:x1, None].astype(bool)
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """Crop the frame to the ROI bounding box and black out everything outside the ROI."""
+        x0, y0, x1, y1 = self.bbox
+        if self._cropped_roi_mask is None:
+            return frame[y0:y1, x0:x1]
+        return np.where(self._cropped_roi_mask, frame[y0:y1, x0:x1], 0).astype(frame.dtype, copy=False)
+
+    def assign(self, boxes: np.ndarray) -> tuple[int, np.ndarray]:
+        """Assign boxes detected on the cropped frame to the ROI and parking spots.
+
+        Args:
+            boxes: Array of shape (N, 4+) with `x1, y1, x2, y2` boxes in the cropped frame coordinates.
+
+        Returns:
+            The number of vehicles within the ROI but outside the overlap zones
+            and the boolean occupancy vector of the spots.
+        """
+        height, width = self.shape
+        x0, y0, _, _ = self.bbox
+        centers_x = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2 + x0).astype(np.intp), 0, width - 1)
+        centers_y = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2 + y0).astype(np.intp), 0, height - 1)
+
+        counted = np.ones(len(boxes), dtype=bool) if self.roi_mask is None else self.roi_mask[centers_y, centers_x] > 0
+        if self.overlap_mask is not None:
+            counted &= self.overlap_mask[centers_y, centers_x] == 0
+        occupancy = np.zeros(len(self.spot_ids), dtype=bool)
+        if self.spot_map is not None:
+            spot_indexes = self.spot_map[centers_y, centers_x]
+            occupancy[spot_indexes[spot_indexes != NO_SPOT]] = True
+        return int(counted.sum()), occupancy
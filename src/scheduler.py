@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from .logging_config import logging
+from .settings import SCHEDULER_MAX_CONCURRENT_JOBS
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_RATIO_CONJUGATE = 0.618033988749895
+
+
+@dataclass(order=True)
+class ScheduledJob:
+    due: float
+    key: Hashable = field(compare=False)
+    interval: float = field(compare=False)
+    job: Callable[[], Awaitable[None]] = field(compare=False)
+
+
+class DeadlineScheduler:
+    """Dispatch periodic jobs (e.g. parking lot processing) by their next due time.
+
+    Jobs are kept in a priority queue keyed by the monotonic time they are due at. At most
+    `max_concurrent_jobs` jobs run at once, which bounds the compute spent on inference.
+    The first runs of the jobs are spread over their intervals, so jobs with the same interval
+    don't hit the CPU at the same moment.
+
+    A job is never run concurrently with itself, nor with the job previously scheduled under
+    the same key: a job added while the removed one is still running starts after it. If a job
+    is overdue by more than its interval (because the previous run was slow or the compute budget
+    was exhausted), the missed runs are coalesced into a single one. The latest scheduling lag
+    of every job is available in `lags`.
+
+    Usage:
+    ```python
+    scheduler = DeadlineScheduler()
+    scheduler.add("parking-lot-1", 5, process_parking_lot)
+    await scheduler.run()  # Returns once all jobs have been removed.
+    ```
+    """
+
+    def __init__(self, max_concurrent_jobs: int = SCHEDULER_MAX_CONCURRENT_JOBS) -> None:
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.lags: dict[Hashable, float] = {}
+        """Seconds between the time each job was due and the time it was actually started."""
+        self.skipped_runs: dict[Hashable, int] = {}
+        self._queue: list[ScheduledJob] = []
+        self._jobs: dict[Hashable, ScheduledJob] = {}
+        self._running: dict[Hashable, asyncio.Task[None]] = {}
+        self._held: dict[Hashable, ScheduledJob] = {}
+        """Jobs added while the removed job with the same key is still running."""
+        self._semaphore = asyncio.Semaphore(max_concurrent_jobs)
+        self._wakeup = asyncio.Event()
+        self._added_jobs = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._jobs
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def add(self, key: Hashable, interval: float, job: Callable[[], Awaitable[None]]) -> None:
+        """Schedule the job to run every `interval` seconds. The first run is staggered within the interval."""
+        if key in self._jobs:
+            msg = f"Job {key!r} is already scheduled"
+            raise ValueError(msg)
+        # Low-discrepancy offsets keep the jobs evenly spread however many of them are added.
+        offset = (self._added_jobs * GOLDEN_RATIO_CONJUGATE) % 1 * interval
+        self._added_jobs += 1
+        scheduled_job = ScheduledJob(time.monotonic() + offset, key, interval, job)
+        self._jobs[key] = scheduled_job
+        self.skipped_runs[key] = 0
+        if key in self._running:
+            # E.g. the interval of the job has changed, the first run waits for the current one of the removed job.
+            self._held[key] = scheduled_job
+        else:
+            heapq.heappush(self._queue, scheduled_job)
+        self._wakeup.set()
+
+    def remove(self, key: Hashable) -> None:
+        """Unschedule the job. Its current run, if any, is not interrupted."""
+        # The queue entry is discarded lazily when it's popped.
+        self._jobs.pop(key, None)
+        self._held.pop(key, None)
+        self.lags.pop(key, None)
+        self.skipped_runs.pop(key, None)
+        self._wakeup.set()
+
+    async def run(self, *, stop_when_empty: bool = True) -> None:
+        """Dispatch jobs until none of them is left or forever if `stop_when_empty` is false."""
+        try:
+            while self._jobs or not stop_when_empty:
+                if not self._queue:
+                    # All jobs are running (or none is scheduled yet), wait for the queue to change.
+                    await self._wait_for_wakeup(None)
+                    continue
+
+                scheduled_job = self._queue[0]
+                if self._jobs.get(scheduled_job.key) is not scheduled_job:
+                    heapq.heappop(self._queue)
+                    continue
+
+                delay = scheduled_job.due - time.monotonic()
+                if delay > 0:
+                    await self._wait_for_wakeup(delay)
+                    continue
+
+                await self._semaphore.acquire()
+                heapq.heappop(self._queue)
+                if self._jobs.get(scheduled_job.key) is not scheduled_job:
+                    self._semaphore.release()
+                    continue
+                self._dispatch(scheduled_job)
+        finally:
+            for task in self._running.values():
+                task.cancel()
+
+    def _dispatch(self, scheduled_job: ScheduledJob) -> None:
+        lag = time.monotonic() - scheduled_job.due
+        self.lags[scheduled_job.key] = lag
+        if lag > scheduled_job.interval:
+            logger.warning("Job %s is %.2f seconds behind its schedule", scheduled_job.key, lag)
+
+        task = asyncio.create_task(scheduled_job.job())
+        self._running[scheduled_job.key] = task
+        task.add_done_callback(lambda task: self._reschedule(scheduled_job, task))
+
+    def _reschedule(self, scheduled_job: ScheduledJob, task: asyncio.Task[None]) -> None:
+        self._semaphore.release()
+        self._running.pop(scheduled_job.key, None)
+        if not task.cancelled() and (exc := task.exception()) is not None:
+            logger.error("Job %s failed", scheduled_job.key, exc_info=exc)
+
+        if (held_job := self._held.pop(scheduled_job.key, None)) is not None:
+            heapq.heappush(self._queue, held_job)
+        elif self._jobs.get(scheduled_job.key) is scheduled_job:
+            now = time.monotonic()
+            due = scheduled_job.due + scheduled_job.interval
+            if due < now:
+                # Coalesce the missed runs into the nearest one instead of running them back-to-back.
+                missed_runs = int((now - due) // scheduled_job.interval)
+                self.skipped_runs[scheduled_job.key] += missed_runs
+                due += missed_runs * scheduled_job.interval
+            next_job = ScheduledJob(due, scheduled_job.key, scheduled_job.interval, scheduled_job.job)
+            self._jobs[scheduled_job.key] = next_job
+            heapq.heappush(self._queue, next_job)
+        self._wakeup.set()
+
+    async def _wait_for_wakeup(self, delay: float | None) -> None:
+        """Wait until the queue changes or `delay` seconds pass."""
+        self._wakeup.clear()
+        with suppress(TimeoutError):
+            async with asyncio.timeout(delay):
+                await self._wakeup.wait()
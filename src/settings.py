@@ -1,5 +1,6 @@
 import os
 from datetime import timedelta
+from pathlib import Path
 
 CONFIDENCE = 0.25
 IOU = 0.7
@@ -17,7 +18,6 @@ YOLO_PREDICTION_PARAMETERS = {
     "model": "yolo11n.pt",
     "data": "/content/datasets/parking_dataset/data.yaml",
     "task": "detect",
-    "half": True,
     "conf": CONFIDENCE,
     "iou": IOU,
     "imgsz": 640,
@@ -25,22 +25,275 @@ YOLO_PREDICTION_PARAMETERS = {
     "classes": [CAR, MOTORCYCLE, TRUCK],
     "show_boxes": False,
     "verbose": False,
-    "vid_stride": 10,
 }
 
+# Supported values: pytorch, onnx, openvino. Models are exported for non-PyTorch backends on first use.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+MODEL_PRECISION = os.getenv("MODEL_PRECISION", "fp32")
+"""
+Precision of the exported model. Supported values: fp32, fp16, int8 (the last two depend on the backend).
+"""
+MODEL_CACHE_DIR = Path(os.getenv("MODEL_CACHE_DIR", ".model-cache"))
+
 STREAMS_USAGE_DURATION = timedelta(minutes=30)
+"""
+The duration of a stream lease, i.e. how long the streams are marked in use by the worker.
+"""
+STREAMS_LEASE_RENEWAL_INTERVAL = STREAMS_USAGE_DURATION / 3
+"""
+How often the leases are renewed, even if the listing of the video stream sources hasn't changed.
+"""
+STREAM_SOURCES_SYNC_INTERVAL = 30
+"""
+How often the worker polls the backend for new, changed and removed video stream sources
+and checks its memory usage (in seconds).
+Unchanged listings are answered with `304 Not Modified` when the backend supports ETags.
+"""
+STREAM_SOURCES_PAGE_SIZE = 50
+STREAM_CLAIM_STEP = 4
+"""
+Maximum number of streams leased on top of the running ones per sync, none while the worker is overloaded.
+"""
+WORKER_MAX_RSS = int(os.getenv("WORKER_MAX_RSS_MB", "4096")) * 2**20
+"""
+The worker is recycled once its resident memory exceeds the limit (in bytes).
+"""
+
+# Parking lots are sharded across worker processes, each with its own model.
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+"""
+With more than one worker process, a supervisor leases the streams and partitions them across the workers.
+"""
+WORKER_STATUS_INTERVAL = 5
+"""
+How often the worker receives its assignment and reports its status (in seconds) to the supervisor.
+"""
+SUPERVISOR_CHECK_INTERVAL = 1
+SUPERVISOR_MAX_WORKER_LAG = 5.0
+"""
+Parking lots are moved off the worker which falls behind its schedule by more seconds.
+"""
+SUPERVISOR_RESTART_BACKOFF = 5
+"""
+Seconds before a failed worker is restarted, doubled with every consecutive failure up to the maximum.
+"""
+SUPERVISOR_MAX_RESTART_BACKOFF = 300
+SUPERVISOR_MAX_WORKER_FAILURES = 12
+"""
+The supervisor stops once a worker fails that many times in a row without ever reporting its status.
+"""
+
 MAX_STREAMS = 10
 """
 The required processing power grows significantly with every new stream.
 """
 
+# Frames of all streams are inferred by a single shared model in batches.
+BATCH_MAX_SIZE = MAX_STREAMS
+BATCH_MAX_DELAY = 0.05
+"""
+Seconds to wait for more frames before running an incomplete batch.
+"""
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+"""
+Number of threads running batched inference. Batches are queued while all of them are busy.
+"""
+
+# Blocking frame reads are run in a thread pool.
+FRAME_READ_WORKERS = MAX_STREAMS
+FRAME_READ_TIMEOUT = 30
+"""
+Seconds to wait for a stream to be opened or to return a frame before it's considered broken.
+"""
+FRAME_MAX_AGE = 10
+"""
+Seconds after which the most recent frame of a live stream is considered stale, i.e. the stream has stalled.
+The stalled stream is skipped until its reader recovers it or reports it lost.
+"""
+FRAME_RETRIEVE_TIMEOUT = 1
+"""
+Seconds `StreamReader.read` waits for the frame being grabbed before it falls back to the last retrieved one.
+"""
+
+# Page URLs (e.g. YouTube) are resolved into direct media URLs which are cached across worker restarts.
+SOURCE_RESOLUTION_WORKERS = MAX_STREAMS
+SOURCE_RESOLUTION_TIMEOUT = 30
+SOURCE_CACHE_PATH = os.getenv("SOURCE_CACHE_PATH", "stream-sources-cache.json")
+SOURCE_CACHE_DEFAULT_TTL = 60 * 60
+"""
+Seconds a resolved URL is cached for when it doesn't carry its expiration time.
+"""
+SOURCE_CACHE_EXPIRY_MARGIN = 5 * 60
+"""
+Resolved URLs are refreshed this many seconds before their signature expires.
+"""
+
+# Frames which barely differ from the last inferred frame of the stream reuse its detections.
+CHANGE_DETECTION_ENABLED = os.getenv("CHANGE_DETECTION_ENABLED", "1") == "1"
+CHANGE_DETECTION_SIZE = (160, 90)
+"""
+Width and height the frames are downscaled to before the comparison.
+"""
+CHANGE_PIXEL_THRESHOLD = 25
+"""
+Minimum difference of the grayscale intensity for a pixel to be considered changed.
+"""
+CHANGE_RATIO_THRESHOLD = 0.005
+"""
+Minimum fraction of changed pixels for a frame to be inferred.
+"""
+CHANGE_FORCED_REFRESH_INTERVAL = 60
+"""
+Seconds after which a frame is inferred even if it hasn't changed.
+"""
+
+# The occupancy of every stream is smoothed over its latest frames before it's published.
+OCCUPANCY_SMOOTHING_WINDOW = int(os.getenv("OCCUPANCY_SMOOTHING_WINDOW", "3"))
+"""
+Number of the latest observations the median and the hysteresis are applied to, 1 disables the smoothing.
+"""
+OCCUPANCY_HYSTERESIS = 0.5
+"""
+Fraction of the window which has to disagree with the state of a spot for the spot to flip.
+"""
+
+# The frame stride and the inference size of every stream are adjusted to the load and the scene activity.
+ADAPTIVE_CONTROL_ENABLED = os.getenv("ADAPTIVE_CONTROL_ENABLED", "1") == "1"
+ADAPTIVE_MAX_STRIDE = int(os.getenv("ADAPTIVE_MAX_STRIDE", "4"))
+"""
+A stream with the stride N is processed on every N-th run of its parking lot, reusing the last detections in between.
+"""
+ADAPTIVE_IMGSZ_LEVELS = (320, 480, YOLO_PREDICTION_PARAMETERS["imgsz"])
+"""
+Inference sizes (multiples of 32) a stream can switch between, the largest one is used by default.
+"""
+ADAPTIVE_ADJUST_INTERVAL = 30
+"""
+Minimum seconds between two adjustments of a stream, so that the effect of the last one can be observed.
+"""
+ADAPTIVE_HIGH_LOAD = 0.9
+ADAPTIVE_LOW_LOAD = 0.6
+"""
+The load is the larger of the scheduling lag relative to the processing interval and the CPU load average per CPU.
+Streams are degraded above the high watermark and restored below the low one.
+"""
+ADAPTIVE_ACTIVE_CHURN = 0.2
+"""
+Fraction of the recent observations in which the detections changed, above which the scene is considered active.
+"""
+
+# Streams with `"tiled": true` in their source are inferred in overlapping tiles, e.g. 4K wide-angle cameras.
+TILE_SIZE = int(os.getenv("TILE_SIZE", "1280"))
+"""
+Side of the square tiles in pixels of the frame, a stream source may override it with `tile_size`.
+"""
+TILE_OVERLAP = 0.2
+"""
+Minimum fraction of a tile shared with its neighbours, so that vehicles cut by a border are entirely in some tile.
+"""
+TILE_FULL_FRAME = True
+"""
+Infer the whole frame along with the tiles to detect the near vehicles larger than a tile.
+"""
+TILE_MERGE_THRESHOLD = 0.5
+"""
+Minimum intersection over the smaller box for detections of different tiles to be merged into one.
+"""
+
+SCHEDULER_MAX_CONCURRENT_JOBS = int(os.getenv("SCHEDULER_MAX_CONCURRENT_JOBS", str(MAX_STREAMS)))
+"""
+Maximum number of parking lots processed at the same time, i.e. the global compute budget.
+Overdue parking lots wait for a free slot and their missed runs are coalesced.
+"""
+
+# Metrics of the worker are served on the local HTTP endpoint, set the port to 0 to disable it.
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+"""
+With several worker processes, the worker N serves its metrics on `METRICS_PORT + N`.
+"""
+PROFILER_INTERVAL = 0.01
+"""
+Default seconds between the stack samples of the profiler, which is toggled through the metrics endpoint.
+"""
+
+# Sampled frames of every stream are captured along with their detections to be replayed offline.
+CAPTURE_DIR = os.getenv("CAPTURE_DIR") or None
+"""
+Directory the frames are captured to, the capture is disabled if it's not set.
+"""
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_MB", "1024")) * 2**20
+"""
+The oldest segments are deleted once the captured frames of all streams take more disk space (in bytes).
+"""
+CAPTURE_SEGMENT_BYTES = 16 * 2**20
+CAPTURE_SAMPLE_INTERVAL = float(os.getenv("CAPTURE_SAMPLE_INTERVAL", "0"))
+"""
+Minimum seconds between two captured frames of a stream, 0 captures every processed frame.
+"""
+CAPTURE_JPEG_QUALITY = 90
+CAPTURE_QUEUE_SIZE = 64
+"""
+Frames are encoded and written by a background thread. Once the queue is full, new frames are dropped.
+"""
+REPLAY_MAX_SPEED_PROCESSING_RATE = 0.001
+"""
+Processing interval of the replayed parking lots (in seconds) at the maximum speed, i.e. as fast as possible.
+"""
+
 # Set separate global logging level for console and file.
 # Supported values: DEBUG, INFO, WARNING, ERROR, CRITICAL.
 CONSOLE_LOG_LEVEL = os.getenv("CONSOLE_LOG_LEVEL", "DEBUG")
-FILE_LOG_LEVEL = "DEBUG" if __debug__ else os.getenv("FILE_LOG_LEVEL", "WARNING")
+FILE_LOG_LEVEL = os.getenv("FILE_LOG_LEVEL", "WARNING")
+LOG_FILE = os.getenv("LOG_FILE", "spot-gazer.log")
+LOG_FILE_MAX_BYTES = 10 * 2**20
+LOG_FILE_BACKUP_COUNT = 5
+LOG_FILE_COMPRESSION = os.getenv("LOG_FILE_COMPRESSION", "1") == "1"
+"""
+Rotated log files are compressed with gzip.
+"""
+LOG_QUEUE_SIZE = 10_000
+"""
+Records are handled by a background thread. Once the queue is full, new records are dropped rather than blocking.
+"""
+LOG_DEBUG_RATE = 10
+"""
+Maximum number of debug records per second emitted from the same line of code, the excess is dropped.
+"""
 
 SPOTGAZER_BASE_URL = os.environ["SPOTGAZER_BASE_URL"]
 SERVICE_USERNAME = os.environ["SERVICE_USERNAME"]
 SERVICE_PASSWORD = os.environ["SERVICE_PASSWORD"]
 TOKEN_URL = "/api/token/"  # noqa: S105
 TOKEN_REFRESH_URL = "/api/token/refresh/"  # noqa: S105
+OCCUPANCY_URL = "/api/occupancy/"
+HTTP_CONNECTION_LIMIT = 10
+"""
+Maximum number of simultaneous connections to the backend.
+"""
+
+# Occupancy readings are buffered and uploaded in batches.
+OCCUPANCY_FLUSH_SIZE = MAX_STREAMS
+OCCUPANCY_FLUSH_INTERVAL = 1.0
+OCCUPANCY_BULK_URL = os.getenv("OCCUPANCY_BULK_URL")
+"""
+Backend endpoint accepting a list of occupancy readings at once. Readings are uploaded one by one if it's not set.
+"""
+OCCUPANCY_MAX_PARALLEL_UPLOADS = HTTP_CONNECTION_LIMIT
+
+OCCUPANCY_UNCHANGED_INTERVAL = int(os.getenv("OCCUPANCY_UNCHANGED_INTERVAL", "300"))
+"""
+Readings equal to the last published reading of the parking lot are dropped, except once every this many seconds.
+Set to 0 to publish every reading.
+"""
+
+# Readings which failed to upload are spooled to disk and replayed once the backend recovers.
+OCCUPANCY_SPOOL_PATH = os.getenv("OCCUPANCY_SPOOL_PATH", "occupancy-spool.sqlite3")
+OCCUPANCY_SPOOL_MAX_READINGS = 100_000
+OCCUPANCY_SPOOL_DRAIN_BATCH_SIZE = 100
+OCCUPANCY_SPOOL_DRAIN_RATE = 50
+"""
+Maximum number of spooled readings replayed per second.
+"""
+OCCUPANCY_SPOOL_DRAIN_BACKOFF = 1
+OCCUPANCY_SPOOL_MAX_DRAIN_BACKOFF = 60
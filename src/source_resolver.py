@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+from ultralytics.data.loaders import get_best_youtube_url
+from yt_dlp.utils import DownloadError
+
+from .logging_config import logging
+from .settings import (
+    SOURCE_CACHE_DEFAULT_TTL,
+    SOURCE_CACHE_EXPIRY_MARGIN,
+    SOURCE_CACHE_PATH,
+    SOURCE_RESOLUTION_TIMEOUT,
+    SOURCE_RESOLUTION_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Signed media URLs carry their expiration UNIX time, e.g. `...&expire=1700000000&...` or `.../expire/1700000000/...`.
+EXPIRE_PATTERN = re.compile(r"[/?&]expire[/=](\d+)")
+
+
+def needs_resolution(source: str) -> bool:
+    """Return whether the source is a page URL which can't be opened by OpenCV as is."""
+    return "youtube" in source or "youtu.be" in source
+
+
+class ResolvedSource(NamedTuple):
+    url: str
+    expires_at: float
+    """UNIX time after which the URL has to be resolved again."""
+
+
+class SourceResolver:
+    """Resolve stream sources into URLs which can be opened by OpenCV.
+
+    Resolving a YouTube page takes several network round-trips, so the resolution runs in a thread
+    pool with a timeout and doesn't block the event loop, and concurrent resolutions of the same
+    source share a single call. Resolved URLs are cached until shortly before their signature
+    expires (or for `default_ttl` seconds if the URL doesn't tell) and the cache is persisted to
+    `cache_path`, so restarted workers don't resolve their streams again.
+
+    Sources which don't need a resolution are returned as is.
+
+    Usage:
+    ```python
+    resolver = SourceResolver()
+    url = await resolver.resolve("https://www.youtube.com/watch?v=LcSaBafrb-w")
+    # The cached URL may have expired before its time, e.g. the capture fails to open it.
+    url = await resolver.resolve("https://www.youtube.com/watch?v=LcSaBafrb-w", refresh=True)
+    resolver.close()
+    ```
+    """
+
+    def __init__(
+        self,
+        *,
+        cache_path: str | Path | None = SOURCE_CACHE_PATH,
+        timeout: float = SOURCE_RESOLUTION_TIMEOUT,
+        workers: int = SOURCE_RESOLUTION_WORKERS,
+        default_ttl: float = SOURCE_CACHE_DEFAULT_TTL,
+        expiry_margin: float = SOURCE_CACHE_EXPIRY_MARGIN,
+    ) -> None:
+        self.cache_path = None if cache_path is None else Path(cache_path)
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.expiry_margin = expiry_margin
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="source-resolver")
+        # Resolutions are also requested by the stream reader threads, hence the lock.
+        self._lock = Lock()
+        self._cache = self._load_cache()
+        self._pending: dict[tuple[str, bool], asyncio.Future[str]] = {}
+
+    def cached(self, source: str) -> str | None:
+        """Return the cached URL of the source unless it has expired."""
+        resolved = self._cache.get(source)
+        if resolved is None or resolved.expires_at <= time.time():
+            return None
+        return resolved.url
+
+    async def resolve(self, source: str, *, refresh: bool = False) -> str:
+        """Return the URL to open the source with.
+
+        Raises:
+            ConnectionError: The source can't be resolved.
+            TimeoutError: The resolution takes longer than `timeout` seconds.
+        """
+        if not needs_resolution(source):
+            return source
+        if not refresh and (url := self.cached(source)) is not None:
+            return url
+
+        key = (source, refresh)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = asyncio.wrap_future(
+                self._executor.submit(self.resolve_blocking, source, refresh=refresh)
+            )
+            pending.add_done_callback(partial(self._forget_pending, key))
+        # A timed out waiter doesn't cancel the resolution for the others.
+        return await asyncio.wait_for(asyncio.shield(pending), self.timeout)
+
+    def resolve_blocking(self, source: str, *, refresh: bool = False) -> str:
+        """Blocking version of `resolve` without the timeout, safe to call from any thread."""
+        if not needs_resolution(source):
+            return source
+        with self._lock:
+            if not refresh and (url := self.cached(source)) is not None:
+                return url
+
+        try:
+            url = get_best_youtube_url(source, method="yt-dlp")
+        except DownloadError as exc:
+            msg = f"Failed to resolve {source}"
+            raise ConnectionError(msg) from exc
+        if url is None:
+            msg = f"No suitable stream found at {source}"
+            raise ConnectionError(msg)
+
+        with self._lock:
+            self._cache[source] = ResolvedSource(url, self._expires_at(url))
+            self._save_cache()
+        logger.debug("Resolved %s", source)
+        return url
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _forget_pending(self, key: tuple[str, bool], future: asyncio.Future[str]) -> None:
+        self._pending.pop(key, None)
+        # Every waiter may have timed out, retrieve the exception so it isn't reported as unhandled.
+        if not future.cancelled():
+            future.exception()
+
+    def _expires_at(self, url: str) -> float:
+        if (match := EXPIRE_PATTERN.search(url)) is not None:
+            return int(match.group(1)) - self.expiry_margin
+        return time.time() + self.default_ttl
+
+    def _load_cache(self) -> dict[str, ResolvedSource]:
+        if self.cache_path is None or not self.cache_path.exists():
+            return {}
+        try:
+            entries = json.loads(self.cache_path.read_text())
+            now = time.time()
+            return {
+                source: resolved
+                for source, entry in entries.items()
+                if (resolved := ResolvedSource(*entry)).expires_at > now
+            }
+        except (ValueError, TypeError):
+            logger.warning("The stream sources cache %s is corrupted, ignoring it", self.cache_path)
+            return {}
+
+    def _save_cache(self) -> None:
+        if self.cache_path is None:
+            return
+        now = time.time()
+        entries = {source: resolved for source, resolved in self._cache.items() if resolved.expires_at > now}
+        # Several workers may share the cache, so it's replaced atomically.
+        temporary_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+        try:
+            temporary_path.write_text(json.dumps(entries))
+            temporary_path.replace(self.cache_path)
+        except OSError:
+            logger.exception("Failed to save the stream sources cache %s", self.cache_path)
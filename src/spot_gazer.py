@@ -1,132 +1,600 @@
 import asyncio
-from datetime import datetime
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from multiprocessing.connection import Connection
 from pathlib import Path
-from typing import Any, cast
+from typing import Any, ParamSpec, TypeVar, cast
 
-from ultralytics import YOLO
-from ultralytics.data.loaders import get_best_youtube_url
+import numpy as np
+from aiohttp import ClientError
 from ultralytics.utils import SETTINGS
-from yt_dlp.utils import DownloadError
 
+from .adaptive_controller import AdaptiveController
 from .aiohttp_jwt_client import AiohttpJWTClient
+from .batch_predictor import BatchPredictor
+from .capture import REPLAY_SCHEME, CaptureWriter, open_replay
+from .change_detector import ChangeDetector
 from .logging_config import logging
+from .metrics import StageMetrics, metrics
+from .metrics_server import MetricsServer
+from .occupancy_publisher import OccupancyPublisher
+from .occupancy_smoother import OccupancySmoother
+from .occupancy_spool import OccupancySpool
+from .resources import get_cpu_load, get_rss
+from .roi import StreamGeometry
+from .scheduler import DeadlineScheduler
 from .settings import (
+    ADAPTIVE_HIGH_LOAD,
+    CAPTURE_DIR,
+    CHANGE_DETECTION_ENABLED,
+    FRAME_MAX_AGE,
+    FRAME_READ_TIMEOUT,
+    FRAME_READ_WORKERS,
+    HTTP_CONNECTION_LIMIT,
+    MAX_STREAMS,
+    METRICS_PORT,
+    OCCUPANCY_SPOOL_PATH,
     SERVICE_PASSWORD,
     SERVICE_USERNAME,
     SPOTGAZER_BASE_URL,
+    STREAM_CLAIM_STEP,
+    STREAM_SOURCES_SYNC_INTERVAL,
+    STREAMS_LEASE_RENEWAL_INTERVAL,
+    STREAMS_USAGE_DURATION,
+    TILE_SIZE,
     TOKEN_REFRESH_URL,
     TOKEN_URL,
+    WORKER_MAX_RSS,
+    WORKER_STATUS_INTERVAL,
     YOLO_PREDICTION_PARAMETERS,
 )
+from .source_resolver import SourceResolver
+from .stream_reader import StreamReader
+from .stream_sources import StreamSourceSync, fetch_video_stream_sources
+from .tiling import TileLayout
 
 SETTINGS.update({"sync": False})  # Prevent sync analytics and crashes with Ultralytics HUB (Google Analytics).
 logger = logging.getLogger(__name__)
 
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+LEASE_FIELDS = {"in_use_until"}
+"""Fields of a stream source which change with every lease renewal rather than with its configuration."""
+
 
 class NoVideoStreamsAvailableError(Exception): ...
 
 
+class StaleFrameError(Exception): ...
+
+
 class SpotGazer:
     """Detect parking spot occupancy in concurrent mode."""
 
-    def __init__(
+    def __init__(  # noqa: PLR0913, PLR0917
         self,
         model: str | Path = YOLO_PREDICTION_PARAMETERS["model"],  # type: ignore[assignment]
         task: str = YOLO_PREDICTION_PARAMETERS["task"],
+        occupancy_spool_path: str | Path = OCCUPANCY_SPOOL_PATH,
+        base_url: str = SPOTGAZER_BASE_URL,
+        metrics_port: int = METRICS_PORT,
+        capture_dir: str | Path | None = CAPTURE_DIR,
+        *,
+        allow_replay: bool = False,
     ) -> None:
-        self._model = model
-        self._task = task
+        self.batch_predictor = BatchPredictor(model, task)
+        # Warm up the model before any stream is attached.
+        self.batch_predictor.warmup()
         self.http_client = AiohttpJWTClient(
             username=SERVICE_USERNAME,
             password=SERVICE_PASSWORD,
             api_token_url=TOKEN_URL,
             api_token_refresh_url=TOKEN_REFRESH_URL,
-            base_url=SPOTGAZER_BASE_URL,
+            base_url=base_url,
+            connection_limit=HTTP_CONNECTION_LIMIT,
         )
-        self._yolo_models: list[YOLO] = []
-        self._gathered_tasks = []
+        # Page URLs of the streams are resolved concurrently, off the event loop.
+        self.source_resolver = SourceResolver()
+        self.occupancy_spool = OccupancySpool(occupancy_spool_path)
+        self.occupancy_publisher = OccupancyPublisher(self.http_client, spool=self.occupancy_spool)
+        # Sampled frames are captured with their detections to be replayed offline, see `CaptureWriter`.
+        self.capture_writer = None if capture_dir is None else CaptureWriter(capture_dir)
+        # Only the replay opens the `replay://` stream sources, the backend mustn't point the worker at local paths.
+        self.allow_replay = allow_replay
+        self._parking_lots: dict[int, dict[str, Any]] = {}
+        # Frame decoding and stream opening block, so they are kept off the event loop.
+        self._frame_reader_executor = ThreadPoolExecutor(FRAME_READ_WORKERS, thread_name_prefix="frame-reader")
+        self.scheduler = DeadlineScheduler()
+        self.metrics_server = MetricsServer(port=metrics_port)
+        # The scheduling state is read when the metrics are scraped rather than on every run.
+        metrics.add_collector(self._collect_scheduling_metrics)
 
     async def start_detection(self, mark_streams_in_use_until: datetime, limit_streams: int = 20) -> None:
-        """Start separate asynchronous task for each parking lot. One parking lot can have several camera streams."""
-        video_stream_sources = await self.http_client.request_json(
-            "/api/video-stream-sources/",
-            params={
-                "active_only": int(True),
-                "limit": limit_streams,
-                "mark_in_use_until": mark_streams_in_use_until.isoformat(),
-            },
+        """Schedule processing of each parking lot. One parking lot can have several camera streams.
+
+        Parking lots are processed every `processing_rate` seconds by the shared `DeadlineScheduler`
+        until none of them has an active stream left.
+        """
+        parking_lot_video_streams = await fetch_video_stream_sources(
+            self.http_client, mark_streams_in_use_until, limit_streams
         )
-        parking_lot_video_streams: list[dict[str, Any]] = video_stream_sources["results"]
         if not parking_lot_video_streams:
             raise NoVideoStreamsAvailableError
 
         logger.info("Occupancy detection of %d parking lots has been started!", len(parking_lot_video_streams))
-        self._gathered_tasks = cast(
-            "list[asyncio.Future]",
-            await asyncio.gather(
-                *(self._detect_parking_occupancy(parking_streams) for parking_streams in parking_lot_video_streams),
-            ),
+        await self._sync_parking_lots(parking_lot_video_streams)
+        self.occupancy_publisher.start()
+        await self.metrics_server.start()
+        await self.scheduler.run()
+
+    async def run_detection(
+        self,
+        limit_streams: int = MAX_STREAMS,
+        *,
+        lease_duration: timedelta = STREAMS_USAGE_DURATION,
+        lease_renewal_interval: timedelta = STREAMS_LEASE_RENEWAL_INTERVAL,
+        max_rss: int = WORKER_MAX_RSS,
+        claim_step: int = STREAM_CLAIM_STEP,
+    ) -> None:
+        """Detect the occupancy continuously until the worker uses more than `max_rss` bytes of memory.
+
+        The video stream sources are polled every `STREAM_SOURCES_SYNC_INTERVAL` seconds and
+        their leases are renewed every `lease_renewal_interval` (see `StreamSourceSync`). Whenever
+        the listing changes, the running parking lots are compared against it: new streams are
+        started, streams which are no longer assigned to the worker are released, reconfigured
+        streams are updated in place and the rest keep running untouched. Hence the model and
+        the streams are loaded only once per worker. At most `claim_step` new streams are leased
+        per poll, up to the measured capacity of the worker (see `_stream_capacity`).
+        """
+        stream_source_sync = StreamSourceSync(
+            self.http_client, lease_duration=lease_duration, lease_renewal_interval=lease_renewal_interval
         )
 
+        async def sync_stream_sources() -> bool:
+            try:
+                parking_lot_video_streams = await stream_source_sync.poll(
+                    self._stream_capacity(limit_streams, claim_step)
+                )
+            except (ClientError, TimeoutError):
+                logger.exception("Failed to sync the video stream sources")
+            else:
+                if parking_lot_video_streams is not None:
+                    await self._sync_parking_lots(parking_lot_video_streams)
+            return True
+
+        await self._run_until_recycled(sync_stream_sources, STREAM_SOURCES_SYNC_INTERVAL, max_rss)
+
+    async def run_assigned_detection(self, connection: Connection, max_rss: int = WORKER_MAX_RSS) -> None:
+        """Detect the occupancy of the parking lots assigned by the supervisor through the connection.
+
+        Every message received is the full list of the parking lots assigned to the worker, which is
+        synced like in `run_detection` (`None` stops the worker). The worker reports its scheduling
+        lag and memory usage back every `WORKER_STATUS_INTERVAL` seconds.
+        """
+
+        async def sync_assignment() -> bool:
+            while connection.poll():
+                parking_lot_video_streams = connection.recv()
+                if parking_lot_video_streams is None:
+                    return False
+                try:
+                    await self._sync_parking_lots(parking_lot_video_streams)
+                except (ClientError, TimeoutError):
+                    # The worker keeps running, the next assignment sent by the supervisor is synced again.
+                    logger.exception("Failed to sync the assigned parking lots")
+            connection.send(
+                {
+                    "lag": max(self.scheduler.lags.values(), default=0.0),
+                    "skipped_runs": sum(self.scheduler.skipped_runs.values()),
+                    "rss": get_rss(),
+                }
+            )
+            return True
+
+        await self._run_until_recycled(sync_assignment, WORKER_STATUS_INTERVAL, max_rss)
+
+    async def _run_until_recycled(
+        self, sync: Callable[[], Awaitable[bool]], sync_interval: float, max_rss: int
+    ) -> None:
+        """Run the scheduler and call `sync` every `sync_interval` seconds.
+
+        Returns once `sync` returns false or the worker exceeds the memory limit.
+        """
+        self.occupancy_publisher.start()
+        await self.metrics_server.start()
+        scheduler = asyncio.create_task(self.scheduler.run(stop_when_empty=False))
+        try:
+            while not scheduler.done():
+                if not await sync():
+                    return
+                if (rss := get_rss()) > max_rss:
+                    logger.warning("Worker memory usage of %d MiB exceeds the limit, recycling", rss // 2**20)
+                    return
+                await asyncio.wait({scheduler}, timeout=sync_interval)
+            # Propagate the scheduler failure, if any.
+            scheduler.result()
+        finally:
+            scheduler.cancel()
+
     async def stop_detection(self) -> None:
-        # Terminate all video stream loaders.
-        (yolo.predictor.dataset.close() for yolo in self._yolo_models)  # type: ignore[reportOptionalMemberAccess]
-        self._yolo_models.clear()
-        (task.cancel() for task in self._gathered_tasks)
-        self._gathered_tasks.clear()
+        # Terminate all video stream readers.
+        for parking_lot_id in list(self._parking_lots):
+            self._release_parking_lot(parking_lot_id)
+        self._frame_reader_executor.shutdown(wait=False, cancel_futures=True)
+        self.source_resolver.close()
+        await self.metrics_server.stop()
+        metrics.remove_collector(self._collect_scheduling_metrics)
+        self.batch_predictor.close()
+        await self.occupancy_publisher.close()
+        self.occupancy_spool.close()
+        if self.capture_writer is not None:
+            self.capture_writer.close()
         await self.http_client.close()
         logger.info("Detection stopped!")
 
-    async def _deactivate_broken_stream(self, id_: int) -> None:
-        video_stream = await self.http_client.request_json(
-            f"/api/video-stream-sources/{id_}/", method="patch", data={"is_active": int(False)}
+    async def _sync_parking_lots(self, parking_lot_video_streams: list[dict[str, Any]]) -> None:
+        """Bring the running parking lots in line with the fetched ones."""
+        fetched_parking_lots = {
+            parking_streams["parking_lot_id"]: parking_streams for parking_streams in parking_lot_video_streams
+        }
+        for parking_lot_id in self._parking_lots.keys() - fetched_parking_lots.keys():
+            logger.info("Parking lot ID %d is no longer assigned to the worker", parking_lot_id)
+            self._release_parking_lot(parking_lot_id)
+        await asyncio.gather(
+            *(self._sync_parking_lot(parking_streams) for parking_streams in fetched_parking_lots.values())
         )
+
+    async def _sync_parking_lot(self, parking_streams: dict[str, Any]) -> None:
+        parking_lot_id = parking_streams["parking_lot_id"]
+        parking_lot = self._parking_lots.get(parking_lot_id)
+        if parking_lot is None:
+            logger.info("Determining the occupancy of parking lot ID %d", parking_lot_id)
+            parking_lot = self._parking_lots[parking_lot_id] = {**parking_streams, "active_streams": []}
+        active_streams: list[dict[str, Any]] = parking_lot["active_streams"]
+
+        fetched_streams = {stream["id"]: stream for stream in parking_streams["streams"]}
+        for stream in list(active_streams):
+            fetched_stream = fetched_streams.get(stream["id"])
+            if fetched_stream is None or fetched_stream["stream_source"] != stream["stream_source"]:
+                logger.info("Releasing stream ID %s of parking lot ID %d", stream["id"], parking_lot_id)
+                active_streams.remove(stream)
+                self._release_stream(stream)
+            elif any(stream.get(key) != value for key, value in fetched_stream.items() if key not in LEASE_FIELDS):
+                # E.g. the ROI or the spots have changed, the stream keeps running with the new configuration.
+                logger.info("Reconfiguring stream ID %s of parking lot ID %d", stream["id"], parking_lot_id)
+                stream.update(fetched_stream)
+                stream["controller"] = AdaptiveController.from_stream(stream)
+                stream["reconfigured"] = True
+
+        active_stream_ids = {stream["id"] for stream in active_streams}
+        new_streams = [stream for stream in parking_streams["streams"] if stream["id"] not in active_stream_ids]
+        for stream in new_streams:
+            # Used to label the metrics of the stream.
+            stream["parking_lot_id"] = parking_lot_id
+            stream["controller"] = AdaptiveController.from_stream(stream)
+            stream["capture"] = self.capture_writer is not None
+        active_streams.extend(await self._open_streams(new_streams))
+        parking_lot["streams"] = parking_streams["streams"]
+
+        if parking_lot["processing_rate"] != parking_streams["processing_rate"]:
+            parking_lot["processing_rate"] = parking_streams["processing_rate"]
+            self.scheduler.remove(parking_lot_id)
+        if not active_streams:
+            logger.warning("No active streams on parking lot ID %d", parking_lot_id)
+            self.scheduler.remove(parking_lot_id)
+        elif parking_lot_id not in self.scheduler:
+            self.scheduler.add(
+                parking_lot_id, parking_lot["processing_rate"], partial(self._detect_parking_occupancy, parking_lot)
+            )
+
+    def _release_parking_lot(self, parking_lot_id: int) -> None:
+        self.scheduler.remove(parking_lot_id)
+        parking_lot = self._parking_lots.pop(parking_lot_id)
+        for stream in parking_lot["active_streams"]:
+            self._release_stream(stream)
+        parking_lot["active_streams"].clear()
+        metrics.forget(parking_lot_id=parking_lot_id)
+
+    def _release_stream(self, stream: dict[str, Any]) -> None:
+        stream_reader: StreamReader = stream.pop("reader")
+        metrics.forget(stream_id=stream["id"])
+        # Closing doesn't wait for the reading thread, so a hung source doesn't block the event loop.
+        stream_reader.close()
+
+    async def _deactivate_broken_stream(self, stream: dict[str, Any]) -> None:
+        metrics.increment("deactivated_streams", parking_lot_id=stream["parking_lot_id"])
+        try:
+            video_stream = await self.http_client.request_json(
+                f"/api/video-stream-sources/{stream['id']}/", method="patch", data={"is_active": int(False)}
+            )
+        except (ClientError, TimeoutError):
+            # The stream is opened again (and deactivated, if it's still broken) once it's fetched again.
+            logger.exception("Failed to deactivate stream ID %s", stream["id"])
+            return
         logger.debug(video_stream)
 
-    async def _detect_parking_occupancy(self, parking_streams: dict[str, Any]) -> None:
-        logger.info("Determining the occupancy of parking lot ID %d", parking_streams["parking_lot_id"])
-        active_streams = []
-        for stream in parking_streams["streams"]:
-            if "youtube" in stream["stream_source"]:
-                try:
-                    stream["stream_source"] = get_best_youtube_url(stream["stream_source"], method="yt-dlp")
-                except DownloadError:
-                    logger.exception("Can't get best YouTube URL of stream ID %s", stream["id"])
-                    await self._deactivate_broken_stream(stream["id"])
-                    continue
-
-            # Initialize predictor. Pass `show=True` to display the stream.
-            yolo = YOLO(model=self._model, task=self._task)
-            self._yolo_models.append(yolo)
-            stream["predictor"] = yolo.predict(
-                source=stream["stream_source"], stream=True, **YOLO_PREDICTION_PARAMETERS
+    async def _detect_vehicles(self, stream: dict[str, Any], frame: np.ndarray) -> np.ndarray:
+        controller: AdaptiveController = stream["controller"]
+        tile_layout: TileLayout | None = stream.get("tile_layout")
+        with metrics.measure("detection", parking_lot_id=stream["parking_lot_id"], stream_id=stream["id"]):
+            if tile_layout is None:
+                return await self.batch_predictor.detect_vehicles(frame, imgsz=controller.imgsz)
+            # The tiles are gathered into the same batch by the shared model.
+            tile_boxes = await asyncio.gather(
+                *(
+                    self.batch_predictor.detect_vehicles(tile, imgsz=controller.imgsz)
+                    for tile in tile_layout.split(frame)
+                )
             )
-            active_streams.append(stream)
+            return tile_layout.merge(tile_boxes)
 
-        # Continuously process frames from the video streams.
-        while True:
-            if not active_streams:
-                logger.warning("No active streams left on parking lot ID %d", parking_streams["parking_lot_id"])
-                break
+    @staticmethod
+    def _adjust_stream(stream: dict[str, Any], vehicles: int, spots_occupancy: np.ndarray, load: float) -> None:
+        """Feed the latest detections of the stream to its controller and adjust the stride and the inference size."""
+        controller: AdaptiveController = stream["controller"]
+        previous_detections = stream.get("detections")
+        controller.observe(
+            has_changed=previous_detections is not None
+            and (previous_detections[0] != vehicles or not np.array_equal(previous_detections[1], spots_occupancy))
+        )
+        stream["detections"] = (vehicles, spots_occupancy)
+        controller.adjust(load)
+        labels = {"parking_lot_id": stream["parking_lot_id"], "stream_id": stream["id"]}
+        metrics.set_gauge("frame_stride", controller.stride, **labels)
+        metrics.set_gauge("inference_size", controller.imgsz, **labels)
 
-            detected_vehicles = 0
-            for stream in active_streams:
-                try:
-                    # NOTE: Sometimes the video steam may become unavailable.
-                    # In this case, there is a potential risk of an even loop blockage.
-                    # Stay tuned for this! It's possible to use signals with alarm to cancel such a coroutine.
-                    detected_vehicles += len(next(stream["predictor"]))
-                except (StopIteration, ConnectionError):
-                    logger.exception("Unexpected inference stop of stream ID %s", stream["id"])
-                    await self._deactivate_broken_stream(stream["id"])
-                    active_streams.remove(stream)
-                    break
+    def _capture_frames(self, parking_streams: dict[str, Any], due_streams: list[dict[str, Any]]) -> None:
+        """Hand the frames read for the capture over to the capture writer along with their detections."""
+        if self.capture_writer is None:
+            return
+        for stream in due_streams:
+            if (captured_frame := stream.pop("captured_frame", None)) is not None:
+                self.capture_writer.write(parking_streams, stream, *captured_frame, stream["boxes"])
+
+    def _stream_capacity(self, limit_streams: int, claim_step: int = STREAM_CLAIM_STEP) -> int:
+        """Return the number of streams the worker can lease at most.
+
+        The running streams are kept. Up to `claim_step` more are leased on every sync unless
+        some parking lot falls behind its schedule or the node runs out of CPU, so the worker grows
+        its share step by step and the rest of the streams are left to the other workers.
+        """
+        running_streams = sum(len(parking_lot["active_streams"]) for parking_lot in self._parking_lots.values())
+        lag_load = max(
+            (
+                self.scheduler.lags.get(parking_lot_id, 0.0) / parking_lot["processing_rate"]
+                for parking_lot_id, parking_lot in self._parking_lots.items()
+            ),
+            default=0.0,
+        )
+        if max(lag_load, get_cpu_load()) > ADAPTIVE_HIGH_LOAD:
+            return max(running_streams, 1)
+        return min(limit_streams, running_streams + claim_step)
+
+    def _collect_scheduling_metrics(self, stage_metrics: StageMetrics) -> None:
+        for parking_lot_id, lag in list(self.scheduler.lags.items()):
+            stage_metrics.set_gauge("scheduling_lag_seconds", lag, parking_lot_id=parking_lot_id)
+        for parking_lot_id, skipped_runs in list(self.scheduler.skipped_runs.items()):
+            stage_metrics.set_gauge("skipped_runs", skipped_runs, parking_lot_id=parking_lot_id)
+
+    async def _open_streams(self, streams: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Open the streams concurrently and return the usable ones."""
+        opened = await asyncio.gather(*(self._open_stream(stream) for stream in streams), return_exceptions=True)
+        opened_streams = []
+        for stream, is_opened in zip(streams, opened, strict=True):
+            if is_opened is True:
+                opened_streams.append(stream)
+                continue
+            if isinstance(is_opened, BaseException):
+                logger.error("Failed to open stream ID %s", stream["id"], exc_info=is_opened)
+            # A stream which failed after its reader was opened must not leak the reader.
+            if "reader" in stream:
+                self._release_stream(stream)
+        return opened_streams
+
+    async def _open_stream(self, stream: dict[str, Any]) -> bool:
+        """Open the stream reader and return whether the stream is usable. Broken streams are deactivated."""
+        stream_source = stream["stream_source"]
+        # The reader refreshes the resolved URL on its own once the stream is lost, e.g. the URL has expired.
+        refresh_source = partial(self.source_resolver.resolve_blocking, stream_source, refresh=True)
+        try:
+            url = await self.source_resolver.resolve(stream_source)
+            # Frames are only read here. The inference is done in batches by the shared model.
+            try:
+                stream["reader"] = await self._start_reader(url, refresh_source)
+            except ConnectionError:
+                if url == stream_source:
+                    raise
+                logger.warning("Can't open the resolved URL of stream ID %s, resolving it again", stream["id"])
+                url = await self.source_resolver.resolve(stream_source, refresh=True)
+                stream["reader"] = await self._start_reader(url, refresh_source)
+        except (ConnectionError, TimeoutError):
+            logger.exception("Can't open stream ID %s", stream["id"])
+            await self._deactivate_broken_stream(stream)
+            return False
+        return True
+
+    async def _detect_parking_occupancy(self, parking_streams: dict[str, Any]) -> None:
+        """Process the latest frames of the parking lot streams once. Called by the scheduler."""
+        parking_lot_id = parking_streams["parking_lot_id"]
+        # The streams may be synced while the frames are processed, hence a copy.
+        active_streams: list[dict[str, Any]] = list(parking_streams["active_streams"])
+        # Streams sampled with a stride reuse their last detections on the runs they skip.
+        due_streams = [stream for stream in active_streams if stream["controller"].is_due() or "boxes" not in stream]
+        # Streams are read concurrently, so a stalled camera delays only its own parking lot.
+        # Only the most recent frame of each stream is decoded, the rest are dropped by the readers.
+        frames = await asyncio.gather(
+            *(self._run_frame_reader(_read_latest_frame, stream) for stream in due_streams),
+            return_exceptions=True,
+        )
+        broken_streams = [
+            stream
+            for stream, frame in zip(due_streams, frames, strict=True)
+            if frame is None or (isinstance(frame, Exception) and not isinstance(frame, StaleFrameError))
+        ]
+        for stream in broken_streams:
+            if stream not in parking_streams["active_streams"]:
+                continue  # Already released by the sync.
+            logger.error("Unexpected inference stop of stream ID %s", stream["id"])
+            # Stop the reading thread so that a hung source releases the executor worker.
+            parking_streams["active_streams"].remove(stream)
+            self._release_stream(stream)
+            await self._deactivate_broken_stream(stream)
+        if not parking_streams["active_streams"]:
+            logger.warning("No active streams left on parking lot ID %d", parking_lot_id)
+            self.scheduler.remove(parking_lot_id)
+        if broken_streams:
+            return
+        # A stalled stream is being recovered by its reader, it's deactivated only once the reader reports it lost.
+        # Meanwhile it's skipped like by its stride, unless it hasn't got any detections to reuse yet.
+        if any(
+            isinstance(frame, StaleFrameError) and "boxes" not in stream
+            for stream, frame in zip(due_streams, frames, strict=True)
+        ):
+            return
+        read_frames = cast(
+            "list[tuple[dict[str, Any], tuple[np.ndarray, bool]]]",
+            [
+                (stream, frame)
+                for stream, frame in zip(due_streams, frames, strict=True)
+                if not isinstance(frame, StaleFrameError)
+            ],
+        )
+        due_streams = [stream for stream, _ in read_frames]
+
+        # Static frames reuse the last detections, the rest are inferred. Frames of other parking lots
+        # are gathered into the same batch by the shared model.
+        streams_to_infer = [
+            (stream, frame) for stream, (frame, has_changed) in read_frames if has_changed or "boxes" not in stream
+        ]
+        detected_boxes = await asyncio.gather(
+            *(self._detect_vehicles(stream, frame) for stream, frame in streams_to_infer)
+        )
+        for (stream, _), boxes in zip(streams_to_infer, detected_boxes, strict=True):
+            stream["boxes"] = boxes
+        self._capture_frames(parking_streams, due_streams)
+        metrics.increment("frames", len(due_streams), parking_lot_id=parking_lot_id)
+
+        # The streams of a parking lot are degraded once it falls behind its schedule or the node runs out of CPU.
+        load = max(self.scheduler.lags.get(parking_lot_id, 0.0) / parking_streams["processing_rate"], get_cpu_load())
+        due_stream_ids = {stream["id"] for stream in due_streams}
+        detected_vehicles = 0
+        spots: dict[int, bool] = {}
+        for stream in active_streams:
+            geometry: StreamGeometry = stream["geometry"]
+            vehicles, spots_occupancy = geometry.assign(stream["boxes"])
+            metrics.set_gauge(
+                "vehicles_detected", vehicles, parking_lot_id=stream["parking_lot_id"], stream_id=stream["id"]
+            )
+            smoother: OccupancySmoother = stream["smoother"]
+            if stream["id"] in due_stream_ids:
+                self._adjust_stream(stream, vehicles, spots_occupancy, load)
+                vehicles, spots_occupancy = smoother.update(vehicles, spots_occupancy)
             else:
-                occupancy = await self.http_client.request_json(
-                    "/api/occupancy/",
-                    method="post",
-                    data={"parking_lot_id": parking_streams["parking_lot_id"], "occupied_spots": detected_vehicles},
-                )
-                logger.debug(occupancy)
-                # Sleep for the specified processing rate before processing the next frame
-                await asyncio.sleep(parking_streams["processing_rate"])
+                # The reused detections of a skipped stream aren't a new observation, they would fill
+                # the smoothing window with copies of the last one.
+                vehicles, spots_occupancy = smoother.vehicles, smoother.spots_occupancy
+            detected_vehicles += vehicles
+            # A spot seen by several cameras is occupied if any of them sees a vehicle there,
+            # e.g. the vehicle may be occluded from one of the viewpoints.
+            for spot_id, is_occupied in zip(geometry.spot_ids, spots_occupancy, strict=True):
+                spots[spot_id] = spots.get(spot_id, False) or bool(is_occupied)
+        # Parking lots with configured spots report the occupied spots rather than the number of vehicles.
+        occupied_spots = sum(spots.values()) if spots else detected_vehicles
+        metrics.set_gauge("occupied_spots", occupied_spots, parking_lot_id=parking_lot_id)
+        # The reading is uploaded in the background together with readings of other parking lots,
+        # provided it differs from the last published one.
+        self.occupancy_publisher.publish(
+            parking_lot_id,
+            occupied_spots,
+            spots=[{"id": spot_id, "is_occupied": is_occupied} for spot_id, is_occupied in spots.items()] or None,
+        )
+
+    async def _run_frame_reader(self, func: Callable[P, T], *args: P.args, **kwargs: P.kwargs) -> T:
+        """Run a blocking stream operation in the frame reader pool, limited by `FRAME_READ_TIMEOUT`."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self._frame_reader_executor, partial(func, *args, **kwargs)), FRAME_READ_TIMEOUT
+        )
+
+    async def _start_reader(self, url: str, refresh_source: Callable[[], str]) -> StreamReader:
+        """Open the reader of the stream URL in the frame reader pool, limited by `FRAME_READ_TIMEOUT`."""
+        loop = asyncio.get_running_loop()
+        opening = loop.run_in_executor(
+            self._frame_reader_executor,
+            partial(_open_reader, url, refresh_source, allow_replay=self.allow_replay),
+        )
+        try:
+            return await asyncio.wait_for(asyncio.shield(opening), FRAME_READ_TIMEOUT)
+        except (TimeoutError, asyncio.CancelledError):
+            # The opening can't be interrupted, a reader opened after all is closed instead of leaking its thread.
+            opening.add_done_callback(_close_late_reader)
+            raise
+
+
+def _close_late_reader(opening: asyncio.Future[StreamReader]) -> None:
+    if not opening.cancelled() and opening.exception() is None:
+        opening.result().close()
+
+
+def _open_reader(url: str, refresh_source: Callable[[], str], *, allow_replay: bool = False) -> StreamReader:
+    """Open the reader of the stream URL, `replay://` URLs replay the frames captured for a stream.
+
+    Raises:
+        ConnectionError: The URL replays a capture but `allow_replay` isn't set. Otherwise the backend
+            could make the worker open any local path.
+    """
+    if url.startswith(REPLAY_SCHEME):
+        if not allow_replay:
+            msg = f"Captures are only replayed by the replay, can't open {url}"
+            raise ConnectionError(msg)
+        return cast("StreamReader", open_replay(url))
+    return StreamReader(url, refresh_source=refresh_source)
+
+
+def _read_latest_frame(stream: dict[str, Any]) -> tuple[np.ndarray, bool] | None:
+    """Return the latest frame of the stream cropped to its ROI and whether it has changed since the last inference.
+
+    `None` is returned if the stream has ended or is lost.
+
+    Raises:
+        StaleFrameError: The latest frame is older than `FRAME_MAX_AGE`, i.e. the stream has stalled.
+    """
+    stream_reader: StreamReader = stream["reader"]
+    labels = {"parking_lot_id": stream["parking_lot_id"], "stream_id": stream["id"]}
+    with metrics.measure("decode", **labels):
+        frame = stream_reader.read()
+    if frame is None:
+        return None
+    if frame.age > FRAME_MAX_AGE:
+        logger.warning("The latest frame of %s is %.1f seconds old", stream_reader.source, frame.age)
+        msg = f"Stream ID {stream['id']} has stalled"
+        raise StaleFrameError(msg)
+    if stream.get("capture"):
+        # The full frame is captured, so that the replay goes through the same preprocessing.
+        stream["captured_frame"] = (frame.captured_at or time.time() - frame.age, frame.image)
+
+    with metrics.measure("preprocess", **labels):
+        # The geometry is rasterized once per stream resolution.
+        geometry: StreamGeometry | None = stream.get("geometry")
+        # A reconfigured stream is rasterized again as well.
+        if stream.pop("reconfigured", False) or geometry is None or geometry.shape != frame.image.shape[:2]:
+            geometry = stream["geometry"] = StreamGeometry(
+                frame.image.shape[:2], stream.get("roi"), stream.get("spots"), stream.get("overlap")
+            )
+            stream["change_detector"] = ChangeDetector() if CHANGE_DETECTION_ENABLED else None
+            stream["smoother"] = OccupancySmoother(len(geometry.spot_ids))
+            x0, y0, x1, y1 = geometry.bbox
+            stream["tile_layout"] = (
+                TileLayout((y1 - y0, x1 - x0), stream.get("tile_size") or TILE_SIZE) if stream.get("tiled") else None
+            )
+            # The detections of the previous resolution don't fit the new geometry.
+            stream.pop("boxes", None)
+        cropped_image = geometry.crop(frame.image)
+
+        change_detector: ChangeDetector | None = stream["change_detector"]
+        return cropped_image, change_detector is None or change_detector.should_infer(cropped_image, frame.captured_at)
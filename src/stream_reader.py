@@ -0,0 +1,179 @@
+import time
+from collections.abc import Callable
+from threading import Condition, Event, Thread
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from .logging_config import logging
+from .settings import FRAME_RETRIEVE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class Frame(NamedTuple):
+    image: np.ndarray
+    age: float
+    """Seconds passed since the frame was grabbed from the source."""
+    captured_at: float | None = None
+    """UNIX time the frame was originally grabbed at, if it's replayed from a capture."""
+
+
+class StreamReader:
+    """Own a video capture and keep only the most recent frame of the stream.
+
+    A background thread continuously grabs frames from the source, so the capture never falls
+    behind the live stream. Grabbed frames are only converted into images when `read` asks for
+    them, hence frames superseded before anyone asks are dropped without the colour conversion
+    and copying done by `cv2.VideoCapture.retrieve`.
+
+    The capture is used by the grabbing thread alone and the lock only guards the handoff of
+    the frames, so a source hanging in `grab` blocks neither `read` nor `close`. `read` waits at
+    most `retrieve_timeout` seconds for the frame being grabbed and otherwise returns the last
+    retrieved frame, whose age then tells the stall.
+
+    Finite sources (e.g. local video files) are grabbed at their native frame rate to emulate
+    a live stream. A live stream which stops responding is reopened once. If that fails and
+    `refresh_source` is given, the stream is reopened with the URL it returns, e.g. a freshly
+    signed URL when the previous one has expired.
+
+    Usage:
+    ```python
+    reader = StreamReader("rtsp://example.org/stream")
+    frame = reader.read()
+    if frame is not None:
+        print(frame.image.shape, frame.age)
+    reader.close()
+    ```
+    """
+
+    def __init__(
+        self,
+        source: str | int,
+        *,
+        fallback_fps: float = 30,
+        refresh_source: Callable[[], str] | None = None,
+        retrieve_timeout: float = FRAME_RETRIEVE_TIMEOUT,
+    ) -> None:
+        self.source = source
+        self.refresh_source = refresh_source
+        self.retrieve_timeout = retrieve_timeout
+        self._capture = cv2.VideoCapture(source)
+        if not self._capture.isOpened():
+            msg = f"Failed to open {source}"
+            raise ConnectionError(msg)
+
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if 0 < fps < 1000 else fallback_fps  # noqa: PLR2004
+        self.is_live = self._capture.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+
+        self._condition = Condition()
+        self._stopped = Event()
+        self._grabbed_at: float | None = None
+        """Time the latest frame was grabbed at, `None` once the stream has ended."""
+        self._frame: np.ndarray | None = None
+        """Image of the latest grabbed frame, `None` until it's retrieved."""
+        self._retrieved: tuple[np.ndarray, float] | None = None
+        """Last retrieved image and the time it was grabbed at."""
+        self._retrieve_requested = True
+        # Guarantee the first frame.
+        self._grab()
+        if self._frame is None:
+            self._capture.release()
+            msg = f"Failed to read images from {source}"
+            raise ConnectionError(msg)
+
+        self._thread = Thread(target=self._update, daemon=True, name=f"stream-reader-{source}")
+        self._thread.start()
+
+    @property
+    def is_running(self) -> bool:
+        return not self._stopped.is_set()
+
+    def read(self) -> Frame | None:
+        """Return the most recent frame or `None` if the stream has ended."""
+        with self._condition:
+            if self._grabbed_at is not None and self._frame is None:
+                # The grabbing thread retrieves the next frame it grabs.
+                self._retrieve_requested = True
+                self._condition.wait_for(
+                    lambda: self._grabbed_at is None or self._frame is not None, self.retrieve_timeout
+                )
+            if self._grabbed_at is None or self._retrieved is None:
+                return None
+            image, grabbed_at = self._retrieved
+            return Frame(image, time.monotonic() - grabbed_at)
+
+    def close(self) -> None:
+        """Stop the grabbing thread, which releases the capture once its current grab returns."""
+        self._stopped.set()
+        with self._condition:
+            self._grabbed_at = None
+            self._frame = None
+            self._retrieved = None
+            self._condition.notify_all()
+
+    def _grab(self) -> bool:
+        if not self._capture.grab():
+            return False
+        grabbed_at = time.monotonic()
+        image = None
+        if self._retrieve_requested:
+            success, image = self._capture.retrieve()
+            if not success:
+                image = None
+        with self._condition:
+            if self._stopped.is_set():
+                return False
+            self._grabbed_at = grabbed_at
+            # The previously retrieved image is stale from now on.
+            self._frame = image
+            if image is not None:
+                self._retrieved = (image, grabbed_at)
+                self._retrieve_requested = False
+                self._condition.notify_all()
+        return True
+
+    def _update(self) -> None:
+        frame_interval = 1 / self.fps
+        while not self._stopped.is_set():
+            if self._grab():
+                if not self.is_live:
+                    self._stopped.wait(frame_interval)
+                continue
+            if self._stopped.is_set():
+                break
+
+            if not self.is_live:
+                logger.info("Stream %s has ended", self.source)
+                break
+            logger.warning("Stream %s is unresponsive, reopening it", self.source)
+            if not self._reopen(self.source) and not self._reopen_refreshed():
+                logger.error("Stream %s is lost", self.source)
+                break
+        self._stopped.set()
+        with self._condition:
+            self._grabbed_at = None
+            self._frame = None
+            self._retrieved = None
+            self._condition.notify_all()
+        self._capture.release()
+
+    def _reopen(self, source: str | int) -> bool:
+        self._capture.open(source)  # type: ignore[call-overload]
+        return self._grab()
+
+    def _reopen_refreshed(self) -> bool:
+        if self.refresh_source is None:
+            return False
+        try:
+            source = self.refresh_source()
+        except (ConnectionError, TimeoutError):
+            logger.exception("Can't refresh the source of stream %s", self.source)
+            return False
+        logger.info("Reopening stream %s with the refreshed source", self.source)
+        if not self._reopen(source):
+            return False
+        self.source = source
+        return True
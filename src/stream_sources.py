@@ -0,0 +1,138 @@
+import time
+from copy import deepcopy
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from typing import Any, cast
+
+from .aiohttp_jwt_client import AiohttpJWTClient, json_loads
+from .logging_config import logging
+from .metrics import metrics
+from .settings import STREAM_SOURCES_PAGE_SIZE, STREAMS_LEASE_RENEWAL_INTERVAL, STREAMS_USAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+VIDEO_STREAM_SOURCES_URL = "/api/video-stream-sources/"
+
+
+Page = tuple[str | None, dict[str, Any]]
+"""ETag of a page of the listing (if the backend provides it) and its content."""
+
+
+async def _fetch_pages(
+    http_client: AiohttpJWTClient,
+    mark_streams_in_use_until: datetime,
+    limit_streams: int,
+    page_size: int,
+    cached_pages: list[Page] | None = None,
+) -> tuple[list[dict[str, Any]] | None, list[Page]]:
+    """Page through the active video stream sources until `limit_streams` streams are leased.
+
+    Every page is limited to the streams left to lease and starts at the number of parking lots
+    received so far. If the `cached_pages` of the last listing are given, every page is requested
+    conditionally with its ETag and the unchanged pages are reused. `None` is returned instead
+    of the parking lots if no page has changed.
+
+    Returns:
+        The parking lots with their streams and the pages of the listing to be cached.
+    """
+    cached_pages = cached_pages or []
+    parking_lots: list[dict[str, Any]] = []
+    pages: list[Page] = []
+    streams = 0
+    changed = not cached_pages
+    while streams < limit_streams:
+        params = {
+            "active_only": int(True),
+            "limit": min(page_size, limit_streams - streams),
+            "offset": len(parking_lots),
+            "mark_in_use_until": mark_streams_in_use_until.isoformat(),
+        }
+        cached_page = cached_pages[len(pages)] if len(pages) < len(cached_pages) else None
+        headers = {"If-None-Match": cached_page[0]} if cached_page and cached_page[0] else {}
+        async with http_client.request(VIDEO_STREAM_SOURCES_URL, params=params, headers=headers) as response:
+            if headers and response.status == HTTPStatus.NOT_MODIFIED:
+                page = cast("Page", cached_page)
+            else:
+                response.raise_for_status()
+                page = (response.headers.get("ETag"), await response.json(loads=json_loads))
+                changed = True
+        pages.append(page)
+        results = page[1]["results"]
+        # The parking lots are modified by the caller, the cached pages must stay intact.
+        parking_lots += deepcopy(results)
+        streams += sum(len(parking_lot["streams"]) for parking_lot in results)
+        if not page[1].get("next") or not results:
+            break
+    # The listing has changed as well if it has lost its last pages.
+    changed |= len(pages) != len(cached_pages)
+    return parking_lots if changed else None, pages
+
+
+async def fetch_video_stream_sources(
+    http_client: AiohttpJWTClient,
+    mark_streams_in_use_until: datetime,
+    limit_streams: int,
+    page_size: int = STREAM_SOURCES_PAGE_SIZE,
+) -> list[dict[str, Any]]:
+    """Fetch the active video stream sources grouped by parking lots and lease them until the given time."""
+    parking_lots, _ = await _fetch_pages(http_client, mark_streams_in_use_until, limit_streams, page_size)
+    return cast("list[dict[str, Any]]", parking_lots)
+
+
+class StreamSourceSync:
+    """Poll the backend for the video stream sources leased by the worker.
+
+    Polls are cheap, so new cameras are picked up within a polling interval instead of a lease
+    renewal interval: every page of the listing is requested with the ETag it had in the last
+    listing, and the backend answers `304 Not Modified` for the pages which haven't changed. Hence
+    the backend has to provide an ETag for every page. The listing is requested unconditionally
+    (and thus the leases are renewed) every `lease_renewal_interval` or once the number of streams
+    to lease changes, e.g. because the worker has gained or lost capacity.
+
+    Usage:
+    ```python
+    stream_source_sync = StreamSourceSync(http_client)
+    while True:
+        parking_lots = await stream_source_sync.poll(limit_streams=10)
+        if parking_lots is not None:
+            ...  # Apply the changes.
+        await asyncio.sleep(STREAM_SOURCES_SYNC_INTERVAL)
+    ```
+    """
+
+    def __init__(
+        self,
+        http_client: AiohttpJWTClient,
+        *,
+        page_size: int = STREAM_SOURCES_PAGE_SIZE,
+        lease_duration: timedelta = STREAMS_USAGE_DURATION,
+        lease_renewal_interval: timedelta = STREAMS_LEASE_RENEWAL_INTERVAL,
+    ) -> None:
+        self.http_client = http_client
+        self.page_size = page_size
+        self.lease_duration = lease_duration
+        self.lease_renewal_interval = lease_renewal_interval
+        self._pages: list[Page] = []
+        self._limit_streams: int | None = None
+        self._renewal_due = 0.0
+
+    async def poll(self, limit_streams: int) -> list[dict[str, Any]] | None:
+        """Return the leased parking lots with their streams, or `None` if the listing hasn't changed."""
+        renew = time.monotonic() >= self._renewal_due or limit_streams != self._limit_streams
+        parking_lots, pages = await _fetch_pages(
+            self.http_client,
+            datetime.now(UTC) + self.lease_duration,
+            limit_streams,
+            self.page_size,
+            cached_pages=None if renew else self._pages,
+        )
+        if parking_lots is None:
+            metrics.increment("stream_source_polls", result="unchanged")
+            return None
+
+        metrics.increment("stream_source_polls", result="renewed" if renew else "changed")
+        self._pages = pages
+        self._limit_streams = limit_streams
+        self._renewal_due = time.monotonic() + self.lease_renewal_interval.total_seconds()
+        logger.debug("%d parking lots are leased until the next renewal", len(parking_lots))
+        return parking_lots
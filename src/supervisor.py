@@ -0,0 +1,350 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections.abc import Collection
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import Any
+
+import torch
+from aiohttp import ClientError
+
+from .aiohttp_jwt_client import AiohttpJWTClient
+from .logging_config import logging, set_log_file
+from .resources import get_cpu_load
+from .settings import (
+    ADAPTIVE_HIGH_LOAD,
+    HTTP_CONNECTION_LIMIT,
+    LOG_FILE,
+    MAX_STREAMS,
+    METRICS_PORT,
+    OCCUPANCY_SPOOL_PATH,
+    SERVICE_PASSWORD,
+    SERVICE_USERNAME,
+    SPOTGAZER_BASE_URL,
+    STREAM_CLAIM_STEP,
+    STREAM_SOURCES_SYNC_INTERVAL,
+    SUPERVISOR_CHECK_INTERVAL,
+    SUPERVISOR_MAX_RESTART_BACKOFF,
+    SUPERVISOR_MAX_WORKER_FAILURES,
+    SUPERVISOR_MAX_WORKER_LAG,
+    SUPERVISOR_RESTART_BACKOFF,
+    TOKEN_REFRESH_URL,
+    TOKEN_URL,
+    WORKER_PROCESSES,
+)
+from .spot_gazer import SpotGazer
+from .stream_sources import StreamSourceSync
+
+logger = logging.getLogger(__name__)
+
+
+def parking_lot_cost(parking_streams: dict[str, Any]) -> float:
+    """Estimate the compute cost of the parking lot as the number of frames inferred per second."""
+    return len(parking_streams["streams"]) / parking_streams["processing_rate"]
+
+
+def assign_parking_lots(
+    parking_lot_video_streams: list[dict[str, Any]],
+    assignment: dict[int, int],
+    workers: int,
+    unavailable: Collection[int] = (),
+) -> dict[int, int]:
+    """Assign parking lots to workers so that the workers get roughly equal costs.
+
+    Parking lots already present in `assignment` stay with their workers to avoid restarting
+    their streams, the rest are assigned to the least loaded workers, most expensive first.
+    The `unavailable` workers (e.g. waiting to be restarted) get no parking lots unless all are.
+
+    Returns:
+        Mapping of parking lot IDs to worker indexes.
+    """
+    loads = [float("inf") if worker in unavailable else 0.0 for worker in range(workers)]
+    new_assignment: dict[int, int] = {}
+    unassigned = []
+    for parking_streams in parking_lot_video_streams:
+        parking_lot_id = parking_streams["parking_lot_id"]
+        worker = assignment.get(parking_lot_id)
+        if worker is not None and worker < workers and worker not in unavailable:
+            new_assignment[parking_lot_id] = worker
+            loads[worker] += parking_lot_cost(parking_streams)
+        else:
+            unassigned.append(parking_streams)
+
+    for parking_streams in sorted(unassigned, key=parking_lot_cost, reverse=True):
+        worker = loads.index(min(loads))
+        new_assignment[parking_streams["parking_lot_id"]] = worker
+        loads[worker] += parking_lot_cost(parking_streams)
+    return new_assignment
+
+
+def run_worker(
+    connection: Connection, torch_threads: int, occupancy_spool_path: Path, metrics_port: int, log_file: Path
+) -> None:
+    """Entry point of a worker process."""
+    set_log_file(log_file)
+    # Every worker would use all cores otherwise, which oversubscribes the CPU.
+    torch.set_num_threads(torch_threads)
+
+    async def run() -> None:
+        spot_gazer = SpotGazer(occupancy_spool_path=occupancy_spool_path, metrics_port=metrics_port)
+        try:
+            await spot_gazer.run_assigned_detection(connection)
+        finally:
+            await spot_gazer.stop_detection()
+
+    asyncio.run(run())
+
+
+def _worker_path(path: str | Path, index: int) -> Path:
+    path = Path(path)
+    return path.with_name(f"{path.stem}-{index}{path.suffix}")
+
+
+class WorkerFailureError(Exception): ...
+
+
+@dataclass
+class Worker:
+    process: BaseProcess
+    connection: Connection
+    status: dict[str, Any] = field(default_factory=dict)
+    sender: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(1, thread_name_prefix="worker-sender")
+    )
+    """Sends the messages in order off the event loop."""
+
+    def send(self, message: list[dict[str, Any]] | None) -> None:
+        """Queue the message to the worker, a worker which doesn't drain its pipe mustn't stall the supervisor."""
+        self.sender.submit(self._send, message)
+
+    def close(self) -> None:
+        """Drop the queued messages and close the pipe once the worker process has exited."""
+        # The message being sent fails as soon as the process is gone.
+        self.sender.shutdown(cancel_futures=True)
+        self.connection.close()
+
+    def _send(self, message: list[dict[str, Any]] | None) -> None:
+        try:
+            self.connection.send(message)
+        except (BrokenPipeError, OSError):
+            logger.warning("Can't send a message to worker process %s", self.process.pid)
+
+
+class Supervisor:
+    """Shard the parking lots across several worker processes, each with its own model.
+
+    The supervisor is the only one who fetches (and leases) the video stream sources. The parking
+    lots are partitioned across the workers by their estimated cost (see `parking_lot_cost`) and
+    every worker gets the list of its parking lots through a pipe. The partition is rebalanced when:
+    - the polled listing of the video stream sources changes (see `StreamSourceSync`);
+    - a worker dies (or is recycled), its parking lots are moved to the other workers;
+      a failed worker is restarted with an exponential backoff and the supervisor stops with
+      `WorkerFailureError` once a worker fails `SUPERVISOR_MAX_WORKER_FAILURES` times in a row;
+    - a worker falls behind its schedule by more than `SUPERVISOR_MAX_WORKER_LAG` seconds,
+      its cheapest parking lot is moved to the least loaded worker.
+
+    The number of streams leased per poll grows with the workers which keep up with their schedule
+    (see `_stream_capacity`), up to `limit_streams`.
+
+    Usage:
+    ```python
+    await Supervisor(workers=4).run()
+    ```
+    """
+
+    def __init__(self, workers: int = WORKER_PROCESSES, limit_streams: int | None = None) -> None:
+        self.workers_number = workers
+        self.limit_streams = limit_streams or MAX_STREAMS * workers
+        self.http_client = AiohttpJWTClient(
+            username=SERVICE_USERNAME,
+            password=SERVICE_PASSWORD,
+            api_token_url=TOKEN_URL,
+            api_token_refresh_url=TOKEN_REFRESH_URL,
+            base_url=SPOTGAZER_BASE_URL,
+            connection_limit=HTTP_CONNECTION_LIMIT,
+        )
+        # Forking a process with loaded PyTorch isn't safe.
+        self._context = multiprocessing.get_context("spawn")
+        self._torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        self._workers: list[Worker] = []
+        self._parking_lots: list[dict[str, Any]] = []
+        self._assignment: dict[int, int] = {}
+        self._failures = [0] * workers
+        """Consecutive failures of every worker which haven't been followed by a status report."""
+        self._restart_due: dict[int, float] = {}
+        """Time the workers waiting for their restart are due to be restarted at."""
+
+    async def run(self) -> None:
+        """Supervise the workers forever."""
+        self._workers = [self._start_worker(index) for index in range(self.workers_number)]
+        stream_source_sync = StreamSourceSync(self.http_client)
+        sync_due = time.monotonic()
+        try:
+            while True:
+                rebalance = self._check_workers()
+                if time.monotonic() >= sync_due:
+                    sync_due = time.monotonic() + STREAM_SOURCES_SYNC_INTERVAL
+                    try:
+                        parking_lots = await stream_source_sync.poll(self._stream_capacity())
+                    except (ClientError, TimeoutError):
+                        logger.exception("Failed to sync the video stream sources")
+                    else:
+                        if parking_lots is not None:
+                            self._parking_lots = parking_lots
+                            rebalance = True
+                if rebalance:
+                    self._rebalance()
+                await asyncio.sleep(SUPERVISOR_CHECK_INTERVAL)
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.send(None)
+        for worker in self._workers:
+            await asyncio.to_thread(worker.process.join, 30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            await asyncio.to_thread(worker.close)
+        self._workers.clear()
+        await self.http_client.close()
+
+    def _start_worker(self, index: int) -> Worker:
+        # Every worker replays its own spool, so the same readings aren't uploaded twice.
+        spool_path = _worker_path(OCCUPANCY_SPOOL_PATH, index)
+        # The workers would truncate each other's records by rotating the same log file.
+        log_file = _worker_path(LOG_FILE, index)
+        connection, worker_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=run_worker,
+            args=(worker_connection, self._torch_threads, spool_path, METRICS_PORT and METRICS_PORT + index, log_file),
+            daemon=True,
+        )
+        process.start()
+        worker_connection.close()
+        return Worker(process, connection)
+
+    def _check_workers(self) -> bool:
+        """Collect the workers statuses, restart dead workers and return whether a rebalance is needed.
+
+        Raises:
+            WorkerFailureError: A worker has failed `SUPERVISOR_MAX_WORKER_FAILURES` times in a row.
+        """
+        rebalance = False
+        now = time.monotonic()
+        for index, worker in enumerate(self._workers):
+            if (restart_due := self._restart_due.get(index)) is not None:
+                if now >= restart_due:
+                    del self._restart_due[index]
+                    self._workers[index] = self._start_worker(index)
+                    rebalance = True
+                continue
+
+            try:
+                while worker.connection.poll():
+                    worker.status = worker.connection.recv()
+            except (EOFError, OSError):
+                pass
+            if worker.status:
+                # The worker has started successfully.
+                self._failures[index] = 0
+
+            if not worker.process.is_alive():
+                worker.close()
+                restart_delay = self._restart_delay(index, worker.process.exitcode)
+                if restart_delay:
+                    self._restart_due[index] = now + restart_delay
+                else:
+                    self._workers[index] = self._start_worker(index)
+                # Move the parking lots to the other workers, the new one gets some during the rebalance.
+                self._assignment = {
+                    parking_lot_id: assigned_worker
+                    for parking_lot_id, assigned_worker in self._assignment.items()
+                    if assigned_worker != index
+                }
+                rebalance = True
+            elif worker.status.get("lag", 0) > SUPERVISOR_MAX_WORKER_LAG:
+                rebalance |= self._offload(index)
+        return rebalance
+
+    def _restart_delay(self, index: int, exitcode: int | None) -> float:
+        """Return the seconds to wait before restarting the exited worker, counting its failures."""
+        if exitcode == 0:
+            logger.info("Worker %d has been recycled, restarting", index)
+            self._failures[index] = 0
+            return 0
+        self._failures[index] += 1
+        if self._failures[index] >= SUPERVISOR_MAX_WORKER_FAILURES:
+            logger.error("Worker %d has failed %d times in a row, giving up", index, self._failures[index])
+            msg = f"Worker {index} keeps failing, the last exit code is {exitcode}"
+            raise WorkerFailureError(msg)
+        delay = min(SUPERVISOR_RESTART_BACKOFF * 2 ** (self._failures[index] - 1), SUPERVISOR_MAX_RESTART_BACKOFF)
+        logger.warning("Worker %d has exited with code %s, restarting in %.0f seconds", index, exitcode, delay)
+        return delay
+
+    def _stream_capacity(self, claim_step: int = STREAM_CLAIM_STEP) -> int:
+        """Return the number of streams the workers can lease at most.
+
+        Like `SpotGazer._stream_capacity`, the running streams are kept. Up to `claim_step` more are
+        leased on every sync for every running worker which keeps up with its schedule, none while
+        the node runs out of CPU.
+        """
+        running_streams = sum(len(parking_streams["streams"]) for parking_streams in self._parking_lots)
+        if get_cpu_load() > ADAPTIVE_HIGH_LOAD:
+            return max(running_streams, 1)
+        keeping_up = sum(
+            index not in self._restart_due and worker.status.get("lag", 0) <= SUPERVISOR_MAX_WORKER_LAG
+            for index, worker in enumerate(self._workers)
+        )
+        return min(self.limit_streams, max(running_streams + keeping_up * claim_step, 1))
+
+    def _offload(self, index: int) -> bool:
+        """Move the cheapest parking lot of the lagging worker to the least loaded one."""
+        parking_lots = [
+            parking_streams
+            for parking_streams in self._parking_lots
+            if self._assignment.get(parking_streams["parking_lot_id"]) == index
+        ]
+        if len(parking_lots) < 2:  # noqa: PLR2004
+            return False
+
+        loads = [0.0] * self.workers_number
+        for parking_streams in self._parking_lots:
+            if (worker := self._assignment.get(parking_streams["parking_lot_id"])) is not None:
+                loads[worker] += parking_lot_cost(parking_streams)
+        loads[index] = float("inf")
+        for unavailable in self._restart_due:
+            loads[unavailable] = float("inf")
+        if min(loads) == float("inf"):
+            return False
+        cheapest = min(parking_lots, key=parking_lot_cost)
+        target = loads.index(min(loads))
+        logger.warning(
+            "Worker %d is falling behind, moving parking lot ID %d to worker %d",
+            index,
+            cheapest["parking_lot_id"],
+            target,
+        )
+        self._assignment[cheapest["parking_lot_id"]] = target
+        # Give the worker time to catch up before it's judged again.
+        self._workers[index].status.clear()
+        return True
+
+    def _rebalance(self) -> None:
+        self._assignment = assign_parking_lots(
+            self._parking_lots, self._assignment, self.workers_number, unavailable=self._restart_due.keys()
+        )
+        for index, worker in enumerate(self._workers):
+            if index in self._restart_due:
+                continue
+            parking_lots = [
+                parking_streams
+                for parking_streams in self._parking_lots
+                if self._assignment[parking_streams["parking_lot_id"]] == index
+            ]
+            worker.send(parking_lots)
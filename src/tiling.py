@@ -0,0 +1,95 @@
+import math
+
+import numpy as np
+
+from .settings import TILE_FULL_FRAME, TILE_MERGE_THRESHOLD, TILE_OVERLAP, TILE_SIZE
+
+
+def _tile_origins(length: int, tile_size: int, overlap: float) -> np.ndarray:
+    """Return the start offsets of the tiles covering `length` pixels, evenly spread with at least `overlap`."""
+    if length <= tile_size:
+        return np.zeros(1, dtype=np.intp)
+    tiles = math.ceil((length - tile_size) / (tile_size * (1 - overlap))) + 1
+    return np.round(np.linspace(0, length - tile_size, tiles)).astype(np.intp)
+
+
+class TileLayout:
+    """Overlapping tiles covering a frame of a given resolution, for detecting small distant vehicles.
+
+    Downscaling a 4K frame to the inference size makes distant cars a few pixels wide. Instead,
+    the frame is split into `tile_size` squares overlapping by `overlap` of their size, which
+    are inferred in the same batch, so every vehicle is seen at a much higher resolution. With
+    `full_frame`, the whole frame is inferred as well to catch the near vehicles larger than a tile.
+
+    The layout is computed once per stream resolution. The detections of all tiles are shifted
+    to the frame coordinates and the duplicates of the vehicles cut by the tile borders are
+    suppressed by `merge`.
+
+    Usage:
+    ```python
+    layout = TileLayout(frame.shape[:2])
+    tile_boxes = await asyncio.gather(*(predictor.detect_vehicles(tile) for tile in layout.split(frame)))
+    boxes = layout.merge(tile_boxes)
+    ```
+    """
+
+    def __init__(
+        self,
+        shape: tuple[int, int],
+        tile_size: int = TILE_SIZE,
+        overlap: float = TILE_OVERLAP,
+        *,
+        full_frame: bool = TILE_FULL_FRAME,
+    ) -> None:
+        self.shape = shape
+        height, width = shape
+        xs, ys = np.meshgrid(_tile_origins(width, tile_size, overlap), _tile_origins(height, tile_size, overlap))
+        origins = np.stack((xs.ravel(), ys.ravel()), axis=1)
+        self.tiles = np.concatenate(
+            (origins, np.minimum(origins + tile_size, (width, height))), axis=1
+        )  # `x0, y0, x1, y1` of every tile.
+        if full_frame and len(self.tiles) > 1:
+            self.tiles = np.concatenate((self.tiles, [[0, 0, width, height]]))
+        self._offsets = np.concatenate((self.tiles[:, :2], self.tiles[:, :2]), axis=1).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def split(self, frame: np.ndarray) -> list[np.ndarray]:
+        """Return views of the tiles of the frame."""
+        return [frame[y0:y1, x0:x1] for x0, y0, x1, y1 in self.tiles]
+
+    def merge(self, tile_boxes: list[np.ndarray], threshold: float = TILE_MERGE_THRESHOLD) -> np.ndarray:
+        """Shift the detections of the tiles to the frame coordinates and suppress the cross-tile duplicates.
+
+        Args:
+            tile_boxes: Arrays of shape (N, 5) with `x1, y1, x2, y2, confidence` rows, one per tile.
+            threshold: Minimum intersection over the smaller box for two boxes to be the same vehicle.
+                The smaller area is used because a vehicle cut by a tile border yields a partial box.
+
+        Returns:
+            Array of shape (N, 5) with the merged detections, the most confident first.
+        """
+        boxes = np.concatenate([boxes[:, :5] for boxes in tile_boxes]) if tile_boxes else np.empty((0, 5))
+        if len(boxes) == 0:
+            return boxes.astype(np.float32)
+        tile_indexes = np.repeat(np.arange(len(tile_boxes)), [len(boxes) for boxes in tile_boxes])
+        boxes[:, :4] += np.repeat(self._offsets[: len(tile_boxes)], [len(boxes) for boxes in tile_boxes], axis=0)
+
+        order = np.argsort(-boxes[:, 4], kind="stable")
+        boxes, tile_indexes = boxes[order], tile_indexes[order]
+        top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+        bottom_right = np.minimum(boxes[:, None, 2:4], boxes[None, :, 2:4])
+        intersections = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+        areas = np.prod(boxes[:, 2:4] - boxes[:, :2], axis=1)
+        overlaps = intersections / np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-6)
+        # A box is a duplicate if a more confident box of another tile covers it. The detections within
+        # a tile have already been suppressed by the model.
+        duplicates = np.triu((overlaps > threshold) & (tile_indexes[:, None] != tile_indexes[None, :]), k=1)
+        # Greedily from the most confident box, only the kept boxes suppress their duplicates, so a box
+        # covered by a suppressed one is still kept.
+        keep = np.ones(len(boxes), dtype=bool)
+        for index in np.flatnonzero(duplicates.any(axis=1)):
+            if keep[index]:
+                keep &= ~duplicates[index]
+        return boxes[keep].astype(np.float32)
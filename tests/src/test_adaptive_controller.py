@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+from src.adaptive_controller import AdaptiveController
+
+HIGH_LOAD = 1.5
+MEDIUM_LOAD = 0.75
+LOW_LOAD = 0.1
+
+
+def make_controller(**kwargs: int) -> AdaptiveController:
+    return AdaptiveController(imgsz_levels=(320, 480, 640), max_stride=3, adjust_interval=0, **kwargs)
+
+
+def observe(controller: AdaptiveController, *, has_changed: bool, times: int = 20) -> None:
+    for _ in range(times):
+        controller.observe(has_changed=has_changed)
+
+
+class TestAdaptiveController:
+    def test_stride_skips_runs(self) -> None:
+        controller = make_controller()
+        controller.stride = 3
+        assert [controller.is_due() for _ in range(6)] == [False, False, True, False, False, True]
+
+    def test_quiet_scene_is_sampled_less_often(self) -> None:
+        controller = make_controller()
+        observe(controller, has_changed=False)
+        for _ in range(5):
+            controller.adjust(MEDIUM_LOAD)
+        assert (controller.stride, controller.imgsz) == (3, 640)
+
+    def test_active_scene_is_inferred_at_lower_resolution_under_load(self) -> None:
+        controller = make_controller()
+        observe(controller, has_changed=True)
+        controller.adjust(HIGH_LOAD)
+        controller.adjust(HIGH_LOAD)
+        assert (controller.stride, controller.imgsz) == (1, 320)
+        # Once the resolution can't go lower, the stride is increased.
+        controller.adjust(HIGH_LOAD)
+        assert (controller.stride, controller.imgsz) == (2, 320)
+
+    def test_active_scene_is_restored_with_headroom(self) -> None:
+        controller = make_controller()
+        controller.stride, controller.level = 3, 0
+        observe(controller, has_changed=True)
+        for _ in range(2):
+            controller.adjust(LOW_LOAD)
+        assert (controller.stride, controller.imgsz) == (1, 320)
+        for _ in range(2):
+            controller.adjust(LOW_LOAD)
+        assert (controller.stride, controller.imgsz) == (1, 640)
+
+    def test_adjustments_are_rate_limited(self) -> None:
+        controller = AdaptiveController(adjust_interval=60)
+        controller.adjust(HIGH_LOAD)
+        assert (controller.stride, controller.level) == (1, len(controller.imgsz_levels) - 1)
+
+    def test_stream_overrides_bounds(self) -> None:
+        controller = AdaptiveController.from_stream({"min_stride": 2, "max_stride": 2, "max_imgsz": 480})
+        assert (controller.min_stride, controller.max_stride) == (2, 2)
+        assert controller.imgsz == 480
+        assert max(controller.imgsz_levels) == 480
+
+    def test_stream_bounds_outside_levels(self) -> None:
+        controller = AdaptiveController.from_stream({"min_imgsz": 416, "max_imgsz": 1280})
+        assert controller.imgsz_levels == [416, 480, 640, 1280]
+        assert controller.imgsz == 1280
+
+    def test_disabled_control_pins_stream(self) -> None:
+        with patch("src.adaptive_controller.ADAPTIVE_CONTROL_ENABLED", new=False):
+            controller = AdaptiveController.from_stream({})
+        assert controller.max_stride == 1
+        assert len(controller.imgsz_levels) == 1
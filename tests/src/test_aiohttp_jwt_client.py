@@ -1,9 +1,11 @@
+import asyncio
 from collections.abc import AsyncIterator
 from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
 from typing import Any
 
 import pytest
-from aiohttp import web
+from aiohttp import ClientResponseError, web
 from aiohttp.pytest_plugin import AiohttpClient
 from aiohttp.test_utils import TestClient
 from faker import Faker
@@ -74,6 +76,21 @@ async def test_client(
     return await aiohttp_client(app)
 
 
+async def make_jwt_client(aiohttp_client: AiohttpClient, app: web.Application) -> AiohttpJWTClient:
+    test_client = await aiohttp_client(app)
+    client = AiohttpJWTClient(
+        username=fake.user_name(),
+        password=fake.password(),
+        api_token_url=TOKEN_URL,
+        api_token_refresh_url=TOKEN_REFRESH_URL,
+    )
+    await client.session.close()
+    # Share the default headers so the test server receives the authorization header.
+    test_client.headers = test_client.session.headers  # type: ignore[reportAttributeAccessIssue]
+    client.session = test_client  # type: ignore[reportAttributeAccessIssue]
+    return client
+
+
 @pytest.fixture
 async def aiohttp_jwt_client(test_client: TestClient) -> AsyncIterator[AiohttpJWTClient]:
     client = AiohttpJWTClient(
@@ -121,3 +138,68 @@ class TestAiohttpJWTClient:
         await aiohttp_jwt_client.refresh_tokens()
         assert aiohttp_jwt_client._AiohttpJWTClient__access_token != access_token  # type: ignore[reportAttributeAccessIssue]
         assert aiohttp_jwt_client._access_token_expiration != access_token_expiration
+
+    async def test_concurrent_requests_share_single_refresh(
+        self, aiohttp_client: AiohttpClient, auth_tokens: dict[str, str]
+    ) -> None:
+        token_requests = 0
+
+        async def token_handler(_: web.Request) -> web.Response:
+            nonlocal token_requests
+            token_requests += 1
+            await asyncio.sleep(0.01)
+            return web.json_response(auth_tokens)
+
+        async def data_handler(request: web.Request) -> web.Response:
+            return web.json_response({"authorization": request.headers["Authorization"]})
+
+        app = web.Application()
+        app.router.add_post(TOKEN_URL, token_handler)
+        app.router.add_get("/api/", data_handler)
+        client = await make_jwt_client(aiohttp_client, app)
+
+        responses = await asyncio.gather(*(client.request_json("/api/") for _ in range(10)))
+
+        assert token_requests == 1
+        assert all(response == {"authorization": f"Bearer {auth_tokens['access']}"} for response in responses)
+        # The access token is refreshed in the background before it expires.
+        assert client._background_refresh is not None
+        await client.close()
+        assert client._background_refresh is None
+
+    async def test_unauthorized_request_is_retried_once(
+        self, aiohttp_client: AiohttpClient, auth_tokens: dict[str, str]
+    ) -> None:
+        token_refresh_requests = 0
+        unauthorized_responses = 1
+
+        async def token_handler(_: web.Request) -> web.Response:
+            return web.json_response(auth_tokens)
+
+        async def token_refresh_handler(_: web.Request) -> web.Response:
+            nonlocal token_refresh_requests
+            token_refresh_requests += 1
+            return web.json_response({"access": auth_tokens["access"]})
+
+        async def data_handler(_: web.Request) -> web.Response:
+            nonlocal unauthorized_responses
+            if unauthorized_responses > 0:
+                unauthorized_responses -= 1
+                return web.json_response({}, status=HTTPStatus.UNAUTHORIZED)
+            return web.json_response({"results": []})
+
+        app = web.Application()
+        app.router.add_post(TOKEN_URL, token_handler)
+        app.router.add_post(TOKEN_REFRESH_URL, token_refresh_handler)
+        app.router.add_get("/api/", data_handler)
+        client = await make_jwt_client(aiohttp_client, app)
+
+        assert await client.request_json("/api/") == {"results": []}
+        assert token_refresh_requests == 1
+
+        # The second rejection in a row is returned to the caller.
+        unauthorized_responses = 2
+        with pytest.raises(ClientResponseError):
+            await client.request_json("/api/", raise_for_status=True)
+        assert token_refresh_requests == 2
+        await client.close()
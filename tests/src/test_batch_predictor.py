@@ -0,0 +1,68 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pytest
+from faker import Faker
+
+from src.batch_predictor import BatchPredictor
+
+
+@pytest.fixture
+def batch_predictor() -> BatchPredictor:
+    with patch("src.batch_predictor.load_model"):
+        return BatchPredictor(max_batch_size=4, max_batch_delay=0.01)
+
+
+def make_frame() -> np.ndarray:
+    return np.zeros((48, 64, 3), dtype=np.uint8)
+
+
+def make_results(frames: list[np.ndarray], vehicles: int) -> list[MagicMock]:
+    """Simulate Ultralytics results with the given number of detected vehicles per frame."""
+    results = [MagicMock() for _ in frames]
+    for result in results:
+        result.boxes.data.__getitem__.return_value.cpu.return_value.numpy.return_value = np.zeros(
+            (vehicles, 5), dtype=np.float32
+        )
+    return results
+
+
+class TestBatchPredictor:
+    async def test_detect_vehicles_batches_concurrent_frames(self, batch_predictor: BatchPredictor) -> None:
+        batch_predictor.yolo.predict = MagicMock(side_effect=lambda source, **_: make_results(source, 2))
+
+        frames_number = batch_predictor.max_batch_size - 1
+
+        detected_boxes = await asyncio.gather(
+            *(batch_predictor.detect_vehicles(make_frame()) for _ in range(frames_number))
+        )
+
+        assert [len(boxes) for boxes in detected_boxes] == [2] * frames_number
+        # All frames submitted within the batch delay are inferred by a single call.
+        batch_predictor.yolo.predict.assert_called_once()
+        assert len(batch_predictor.yolo.predict.call_args.kwargs["source"]) == frames_number
+
+    async def test_detect_vehicles_flushes_full_batch(self, batch_predictor: BatchPredictor, faker: Faker) -> None:
+        frames_number = batch_predictor.max_batch_size * faker.pyint(min_value=2, max_value=4)
+        batch_predictor.yolo.predict = MagicMock(side_effect=lambda source, **_: make_results(source, 0))
+
+        await asyncio.gather(*(batch_predictor.detect_vehicles(make_frame()) for _ in range(frames_number)))
+
+        assert batch_predictor.yolo.predict.call_count == frames_number // batch_predictor.max_batch_size
+
+    async def test_frames_are_batched_per_inference_size(self, batch_predictor: BatchPredictor) -> None:
+        batch_predictor.yolo.predict = MagicMock(side_effect=lambda source, **_: make_results(source, 1))
+
+        await asyncio.gather(*(batch_predictor.detect_vehicles(make_frame(), imgsz=imgsz) for imgsz in (320, 640, 320)))
+
+        batch_sizes = {
+            call.kwargs["imgsz"]: len(call.kwargs["source"]) for call in batch_predictor.yolo.predict.call_args_list
+        }
+        assert batch_sizes == {320: 2, 640: 1}
+
+    async def test_detect_vehicles_propagates_inference_error(self, batch_predictor: BatchPredictor) -> None:
+        batch_predictor.yolo.predict = MagicMock(side_effect=RuntimeError)
+
+        with pytest.raises(RuntimeError):
+            await batch_predictor.detect_vehicles(make_frame())
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import cv2
+import pytest
+from faker import Faker
+
+from src.aiohttp_jwt_client import AiohttpJWTClient
+from src.benchmark import BenchmarkConfig, build_parking_lots, compare_reports, generate_video
+from src.mock_backend import MockBackend
+from src.settings import OCCUPANCY_URL, TOKEN_REFRESH_URL, TOKEN_URL
+
+
+class TestBenchmark:
+    def test_build_parking_lots(self) -> None:
+        parking_lots = build_parking_lots(BenchmarkConfig(streams=5, parking_lots=2), ["a.avi", "b.avi"])
+
+        assert [len(parking_lot["streams"]) for parking_lot in parking_lots] == [3, 2]
+        streams = [stream for parking_lot in parking_lots for stream in parking_lot["streams"]]
+        assert [stream["id"] for stream in streams] == [1, 3, 5, 2, 4]
+        assert [stream["stream_source"] for stream in streams] == ["a.avi", "a.avi", "a.avi", "b.avi", "b.avi"]
+
+    def test_generate_video(self, tmp_path: Path) -> None:
+        video = generate_video(tmp_path / "synthetic.avi", duration=1, resolution=(320, 180), fps=10)
+
+        capture = cv2.VideoCapture(str(video))
+        assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 10
+        success, frame = capture.read()
+        assert success
+        assert frame.shape == (180, 320, 3)
+        capture.release()
+
+    def test_compare_reports(self) -> None:
+        baseline = {
+            "frames_per_second": 10,
+            "cpu_percent": 100,
+            "rss_bytes": 100,
+            "stages": {"inference": {"p50": 0.1, "p99": 0.2}},
+        }
+        report = {
+            "frames_per_second": 12,
+            "cpu_percent": 50,
+            "rss_bytes": 100,
+            "stages": {"inference": {"p50": 0.05, "p99": 0.2}, "upload": {"p50": 0.01, "p99": 0.02}},
+        }
+
+        assert compare_reports(baseline, report) == pytest.approx(
+            {
+                "frames_per_second": 0.2,
+                "cpu_percent": -0.5,
+                "rss_bytes": 0,
+                "inference_p50": -0.5,
+                "inference_p99": 0,
+            }
+        )
+
+
+class TestMockBackend:
+    async def test_endpoints(self, faker: Faker) -> None:
+        backend = MockBackend(build_parking_lots(BenchmarkConfig(streams=3, parking_lots=2), ["a.avi"]))
+        base_url = await backend.start()
+        client = AiohttpJWTClient(
+            username=faker.user_name(),
+            password=faker.password(),
+            api_token_url=TOKEN_URL,
+            api_token_refresh_url=TOKEN_REFRESH_URL,
+            base_url=base_url,
+        )
+        try:
+            sources = await client.request_json("/api/video-stream-sources/", params={"active_only": 1, "limit": 2})
+            # The parking lot which doesn't fit the limit is left for the next page.
+            assert [parking_lot["parking_lot_id"] for parking_lot in sources["results"]] == [1]
+
+            await client.request_json("/api/video-stream-sources/1/", method="patch", data={"is_active": 0})
+            sources = await client.request_json("/api/video-stream-sources/", params={"active_only": 1})
+            assert [stream["id"] for parking_lot in sources["results"] for stream in parking_lot["streams"]] == [3, 2]
+
+            reading = {"parking_lot_id": 1, "occupied_spots": 4}
+            await client.request_json(OCCUPANCY_URL, method="post", json=reading, raise_for_status=True)
+            await client.request_json(OCCUPANCY_URL, method="post", json=[reading, reading], raise_for_status=True)
+            assert backend.readings == [reading] * 3
+        finally:
+            await client.close()
+            await backend.stop()
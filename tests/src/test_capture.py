@@ -0,0 +1,130 @@
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from faker import Faker
+
+from src.capture import CaptureWriter, ReplayReader, open_replay, read_capture_metadata, read_captured_frames
+from src.replay import build_replay_parking_lots, compare_captures
+from src.settings import REPLAY_MAX_SPEED_PROCESSING_RATE
+
+
+@pytest.fixture
+def parking_lot(faker: Faker) -> dict[str, Any]:
+    return {
+        "parking_lot_id": faker.pyint(),
+        "processing_rate": faker.pyint(min_value=1, max_value=3),
+        "streams": [{"id": faker.pyint(), "stream_source": faker.url(), "roi": None, "in_use_until": None}],
+    }
+
+
+def capture(
+    directory: Path, parking_lot: dict[str, Any], frames: int, boxes: np.ndarray | None = None, **kwargs: float
+) -> None:
+    capture_writer = CaptureWriter(directory, **kwargs)
+    for index in range(frames):
+        image = np.full((48, 64, 3), index % 6 * 40, dtype=np.uint8)
+        frame_boxes = np.array([[1, 2, 3, 4, 0.5]] * index, dtype=np.float32).reshape(-1, 5) if boxes is None else boxes
+        capture_writer.write(parking_lot, parking_lot["streams"][0], 1000.0 + index, image, frame_boxes)
+    capture_writer.close()
+
+
+class TestCaptureWriter:
+    def test_captured_frames_are_read_back(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 4)
+
+        stream = parking_lot["streams"][0]
+        stream_directory = tmp_path / f"stream-{stream['id']}"
+        frames = list(read_captured_frames(stream_directory))
+        assert [frame.timestamp for frame in frames] == [1000, 1001, 1002, 1003]
+        assert [len(frame.boxes) for frame in frames] == [0, 1, 2, 3]
+        assert frames[1].boxes.tolist() == np.float32([[1, 2, 3, 4, 0.5]]).tolist()
+        # The frames are lossily compressed.
+        assert np.abs(frames[2].decode().astype(int) - 80).max() <= 2
+        metadata = read_capture_metadata(stream_directory)
+        assert metadata["parking_lot_id"] == parking_lot["parking_lot_id"]
+        assert metadata["stream"] == {key: value for key, value in stream.items() if key != "in_use_until"}
+
+    def test_frames_are_sampled(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 5, sample_interval=2)
+
+        (stream_directory,) = tmp_path.iterdir()
+        assert [frame.timestamp for frame in read_captured_frames(stream_directory)] == [1000, 1002, 1004]
+
+    def test_oldest_segments_are_evicted(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        boxes = np.zeros((100, 5), dtype=np.float32)
+        capture(tmp_path, parking_lot, 10, boxes, segment_bytes=4000, max_bytes=8000)
+
+        (stream_directory,) = tmp_path.iterdir()
+        assert sum(segment.stat().st_size for segment in stream_directory.glob("*.seg")) <= 8000
+        timestamps = [frame.timestamp for frame in read_captured_frames(stream_directory)]
+        assert timestamps == list(range(1010 - len(timestamps), 1010))
+
+    def test_frames_are_dropped_when_queue_is_full(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        with patch("src.capture.metrics") as metrics, patch.object(CaptureWriter, "_run"):
+            capture_writer = CaptureWriter(tmp_path, queue_size=1)
+            image, boxes = np.zeros((48, 64, 3), dtype=np.uint8), np.empty((0, 5), dtype=np.float32)
+            for timestamp in range(3):
+                capture_writer.write(parking_lot, parking_lot["streams"][0], timestamp, image, boxes)
+        assert metrics.increment.call_count == 2
+        metrics.increment.assert_called_with("dropped_captures")
+
+    def test_truncated_record_is_skipped(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 3)
+        (segment,) = tmp_path.glob("*/*.seg")
+        segment.write_bytes(segment.read_bytes()[:-10])
+
+        assert len(list(read_captured_frames(segment.parent))) == 2
+
+
+class TestReplayReader:
+    def test_max_speed_replays_every_frame(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 3)
+        (stream_directory,) = tmp_path.iterdir()
+
+        reader = open_replay(f"replay://{stream_directory}?speed=max")
+        frames = [reader.read() for _ in range(4)]
+        reader.close()
+
+        assert [frame and frame.captured_at for frame in frames] == [1000, 1001, 1002, None]
+        assert all(frame.age == 0 for frame in frames[:3])  # type: ignore[union-attr]
+
+    def test_realtime_replays_latest_frame(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 3)
+        (stream_directory,) = tmp_path.iterdir()
+
+        reader = open_replay(f"replay://{stream_directory}")
+        with patch("src.capture.time.monotonic", side_effect=[0, 0.5, 2.5, 3]):
+            frames = [reader.read() for _ in range(4)]
+
+        assert [frame and frame.captured_at for frame in frames] == [1000, 1000, 1002, None]
+
+    def test_empty_capture_fails_to_open(self, tmp_path: Path) -> None:
+        with pytest.raises(ConnectionError):
+            ReplayReader(tmp_path)
+
+
+class TestReplay:
+    def test_build_replay_parking_lots(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path, parking_lot, 1)
+
+        (replayed_parking_lot,) = build_replay_parking_lots(tmp_path)
+
+        assert replayed_parking_lot["parking_lot_id"] == parking_lot["parking_lot_id"]
+        assert replayed_parking_lot["processing_rate"] == REPLAY_MAX_SPEED_PROCESSING_RATE
+        (stream,) = replayed_parking_lot["streams"]
+        assert stream["id"] == parking_lot["streams"][0]["id"]
+        assert stream["stream_source"].startswith("replay://")
+        assert stream["stream_source"].endswith("?speed=max")
+
+    def test_compare_captures(self, tmp_path: Path, parking_lot: dict[str, Any]) -> None:
+        capture(tmp_path / "recorded", parking_lot, 4)
+        capture(tmp_path / "replayed", parking_lot, 4, np.array([[1, 2, 3, 4, 0.5]], dtype=np.float32))
+
+        assert compare_captures(tmp_path / "recorded", tmp_path / "replayed") == {
+            "frames": 4,
+            "changed_frames": 3,
+            "mean_absolute_difference": (1 + 0 + 1 + 2) / 4,
+        }
@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+
+from src.change_detector import ChangeDetector
+
+
+def make_frame(brightness: int = 100) -> np.ndarray:
+    return np.full((360, 640, 3), brightness, dtype=np.uint8)
+
+
+class TestChangeDetector:
+    def test_static_frames_are_skipped(self) -> None:
+        change_detector = ChangeDetector()
+        assert change_detector.should_infer(make_frame())
+        assert not change_detector.should_infer(make_frame())
+        # Sensor noise doesn't count as a change.
+        noise = np.random.default_rng(0).integers(0, 5, size=(360, 640, 3), dtype=np.uint8)
+        assert not change_detector.should_infer(make_frame() + noise)
+
+    def test_arrival_is_detected(self) -> None:
+        change_detector = ChangeDetector()
+        frame = make_frame()
+        change_detector.should_infer(frame)
+
+        frame_with_car = frame.copy()
+        frame_with_car[100:140, 200:280] = 220
+        assert change_detector.should_infer(frame_with_car)
+        # The changed frame has become the new reference.
+        assert not change_detector.should_infer(frame_with_car)
+
+    def test_forced_refresh(self) -> None:
+        change_detector = ChangeDetector(refresh_interval=0.01)
+        change_detector.should_infer(make_frame())
+        time.sleep(0.02)
+        assert change_detector.should_infer(make_frame())
+
+    def test_forced_refresh_by_frame_timestamps(self) -> None:
+        change_detector = ChangeDetector(refresh_interval=10)
+        change_detector.should_infer(make_frame(), timestamp=1000)
+        assert not change_detector.should_infer(make_frame(), timestamp=1009)
+        assert change_detector.should_infer(make_frame(), timestamp=1010)
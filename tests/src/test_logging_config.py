@@ -0,0 +1,91 @@
+import gzip
+import logging
+import queue
+import sys
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from unittest.mock import patch
+
+from src.logging_config import DebugRateLimitFilter, DroppingQueueHandler, _gzip_rotator, set_log_file
+
+
+def make_record(level: int = logging.DEBUG, lineno: int = 1) -> logging.LogRecord:
+    return logging.LogRecord(__name__, level, __file__, lineno, "Message %s", ("argument",), None)
+
+
+class TestDroppingQueueHandler:
+    def test_full_queue(self) -> None:
+        record_queue: queue.Queue[logging.LogRecord] = queue.Queue(2)
+        handler = DroppingQueueHandler(record_queue)
+        for _ in range(4):
+            handler.handle(make_record())
+        assert handler.dropped == 2
+
+        record_queue.get_nowait()
+        record_queue.get_nowait()
+        record = make_record()
+        handler.handle(record)
+
+        # The drop is reported before the next record.
+        report = record_queue.get_nowait()
+        assert report.levelno == logging.WARNING
+        assert report.getMessage() == "2 log records have been dropped because the logging queue was full"
+        assert record_queue.get_nowait() is record
+        assert handler.dropped == 0
+
+    def test_message_is_formatted_by_listener(self) -> None:
+        record_queue: queue.Queue[logging.LogRecord] = queue.Queue()
+        handler = DroppingQueueHandler(record_queue)
+        record = make_record()
+        handler.handle(record)
+        assert record_queue.get_nowait().args == ("argument",)
+
+        try:
+            raise ValueError  # noqa: TRY301
+        except ValueError:
+            record = logging.LogRecord(__name__, logging.ERROR, __file__, 1, "Failed", (), sys.exc_info())
+        handler.handle(record)
+        queued_record = record_queue.get_nowait()
+        assert queued_record.exc_info is None
+        assert "ValueError" in queued_record.getMessage()
+
+
+class TestDebugRateLimitFilter:
+    def test_rate_limit(self) -> None:
+        rate_limit_filter = DebugRateLimitFilter(rate=2)
+        with patch("src.logging_config.time.monotonic", return_value=100.0) as monotonic:
+            assert [rate_limit_filter.filter(make_record()) for _ in range(3)] == [True, True, False]
+            # Other lines and levels aren't affected.
+            assert rate_limit_filter.filter(make_record(lineno=2))
+            assert rate_limit_filter.filter(make_record(logging.INFO))
+
+            monotonic.return_value = 100.5
+            assert [rate_limit_filter.filter(make_record()) for _ in range(2)] == [True, False]
+
+
+def test_compressed_rotation(tmp_path: Path) -> None:
+    log_file = tmp_path / "spot-gazer.log"
+    handler = RotatingFileHandler(log_file, maxBytes=100, backupCount=2)
+    handler.namer = lambda name: f"{name}.gz"
+    handler.rotator = _gzip_rotator
+    for index in range(30):
+        handler.emit(make_record(logging.WARNING, lineno=index))
+    handler.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "spot-gazer.log",
+        "spot-gazer.log.1.gz",
+        "spot-gazer.log.2.gz",
+    ]
+    assert b"Message argument" in gzip.decompress((tmp_path / "spot-gazer.log.1.gz").read_bytes())
+
+
+def test_set_log_file(tmp_path: Path) -> None:
+    handler = RotatingFileHandler(tmp_path / "spot-gazer.log", delay=True)
+    with patch("src.logging_config.file_handler", handler):
+        set_log_file(tmp_path / "spot-gazer-1.log")
+    handler.emit(make_record(logging.WARNING))
+    handler.close()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["spot-gazer-1.log"]
+    assert "Message argument" in (tmp_path / "spot-gazer-1.log").read_text()
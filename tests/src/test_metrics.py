@@ -0,0 +1,148 @@
+import time
+from threading import Event, Thread
+
+import pytest
+from aiohttp.pytest_plugin import AiohttpClient
+
+from src.metrics import StageMetrics
+from src.metrics_server import MetricsServer
+from src.profiler import SamplingProfiler
+
+
+class TestStageMetrics:
+    def test_summary(self) -> None:
+        stage_metrics = StageMetrics(max_samples=100)
+        for duration in range(1, 201):
+            stage_metrics.observe("inference", duration / 1000)
+        with stage_metrics.measure("decode"):
+            pass
+        stage_metrics.increment("frames", 3)
+
+        summary = stage_metrics.summary()
+
+        # Only the recent samples are kept.
+        assert summary["inference"]["count"] == 100
+        assert summary["inference"]["p50"] == pytest.approx(0.1505)
+        assert summary["decode"]["count"] == 1
+        assert stage_metrics.counters["frames"] == 3
+
+        stage_metrics.reset()
+        assert stage_metrics.summary() == {}
+        assert not stage_metrics.counters
+
+    def test_render(self) -> None:
+        stage_metrics = StageMetrics()
+        stage_metrics.observe("decode", 0.003, parking_lot_id=1, stream_id=2)
+        stage_metrics.observe("decode", 20, parking_lot_id=1, stream_id=2)
+        stage_metrics.increment("frames", 2)
+        stage_metrics.increment("token_refreshes", kind="login")
+        stage_metrics.set_gauge("vehicles_detected", 4, parking_lot_id=1, stream_id=2)
+        stage_metrics.add_collector(lambda collected: collected.set_gauge("scheduling_lag_seconds", 0.5))
+
+        lines = stage_metrics.render().splitlines()
+
+        assert "# TYPE spotgazer_decode_seconds histogram" in lines
+        assert 'spotgazer_decode_seconds_bucket{parking_lot_id="1",stream_id="2",le="0.0025"} 0' in lines
+        assert 'spotgazer_decode_seconds_bucket{parking_lot_id="1",stream_id="2",le="0.005"} 1' in lines
+        assert 'spotgazer_decode_seconds_bucket{parking_lot_id="1",stream_id="2",le="+Inf"} 2' in lines
+        assert 'spotgazer_decode_seconds_count{parking_lot_id="1",stream_id="2"} 2' in lines
+        assert "# TYPE spotgazer_frames_total counter" in lines
+        assert "spotgazer_frames_total 2" in lines
+        assert 'spotgazer_token_refreshes_total{kind="login"} 1' in lines
+        assert 'spotgazer_vehicles_detected{parking_lot_id="1",stream_id="2"} 4' in lines
+        assert "spotgazer_scheduling_lag_seconds 0.5" in lines
+
+    def test_render_exact_values(self) -> None:
+        stage_metrics = StageMetrics()
+        stage_metrics.increment("frames", 1_234_567)
+        stage_metrics.set_gauge("skipped_runs", 2**33 + 1)
+        stage_metrics.set_gauge("scheduling_lag_seconds", 1234.5678)
+        stage_metrics.observe("decode", 0.1234567)
+
+        lines = stage_metrics.render().splitlines()
+
+        # Large counts aren't rounded, otherwise the counter stalls for `rate()`.
+        assert "spotgazer_frames_total 1234567" in lines
+        assert "spotgazer_skipped_runs 8589934593" in lines
+        assert "spotgazer_scheduling_lag_seconds 1234.5678" in lines
+        assert "spotgazer_decode_seconds_sum 0.1234567" in lines
+        assert "spotgazer_decode_seconds_count 1" in lines
+
+    def test_forget(self) -> None:
+        stage_metrics = StageMetrics()
+        stage_metrics.observe("decode", 0.1, parking_lot_id=1, stream_id=2)
+        stage_metrics.observe("decode", 0.1, parking_lot_id=3, stream_id=4)
+        stage_metrics.set_gauge("occupied_spots", 4, parking_lot_id=1)
+
+        stage_metrics.forget(parking_lot_id=1)
+
+        rendered = stage_metrics.render()
+        assert 'parking_lot_id="1"' not in rendered
+        assert 'parking_lot_id="3"' in rendered
+        # The released series don't affect the recent durations.
+        assert stage_metrics.summary()["decode"]["count"] == 2
+
+    def test_concurrent_recording(self) -> None:
+        stage_metrics = StageMetrics()
+
+        def record(stream_id: int) -> None:
+            for index in range(1000):
+                stage_metrics.increment("frames", stream_id=stream_id)
+                stage_metrics.set_gauge("vehicles_detected", index, stream_id=stream_id, index=index)
+
+        threads = [Thread(target=record, args=(stream_id,)) for stream_id in range(4)]
+        for thread in threads:
+            thread.start()
+        # Rendering doesn't fail on the series being added meanwhile.
+        while any(thread.is_alive() for thread in threads):
+            stage_metrics.render()
+        for thread in threads:
+            thread.join()
+
+        assert stage_metrics.counters["frames"] == 4000
+        assert 'spotgazer_frames_total{stream_id="3"} 1000' in stage_metrics.render().splitlines()
+
+
+class TestSamplingProfiler:
+    def test_samples_all_threads(self) -> None:
+        stopped = Event()
+
+        def busy_loop() -> None:
+            while not stopped.is_set():
+                sum(range(1000))
+
+        thread = Thread(target=busy_loop, name="busy-thread")
+        thread.start()
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        time.sleep(0.1)
+        profiler.stop()
+        stopped.set()
+        thread.join()
+
+        assert not profiler.is_running
+        assert profiler.samples
+        assert any(stack.startswith("busy-thread;") and "busy_loop" in stack for stack in profiler.samples)
+        stack, count = profiler.collapsed().splitlines()[0].rsplit(" ", 1)
+        assert profiler.samples[stack] == int(count)
+
+
+class TestMetricsServer:
+    async def test_endpoints(self, aiohttp_client: AiohttpClient) -> None:
+        stage_metrics = StageMetrics()
+        stage_metrics.increment("frames")
+        server = MetricsServer(stage_metrics=stage_metrics)
+        client = await aiohttp_client(server.app)
+
+        response = await client.get("/metrics")
+        assert response.content_type == "text/plain"
+        assert "spotgazer_frames_total 1" in await response.text()
+
+        assert (await client.post("/profiler/start", params={"interval": "0"})).status == 400
+        assert (await client.post("/profiler/start", params={"interval": "0.001"})).status == 200
+        assert server.profiler.is_running
+        time.sleep(0.05)  # noqa: ASYNC251 Block the event loop, so that the profiler catches it.
+        response = await client.post("/profiler/stop")
+        assert not server.profiler.is_running
+        assert "test_endpoints" in await response.text()
+        await server.stop()
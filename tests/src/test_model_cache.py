@@ -0,0 +1,55 @@
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.model_cache import load_model
+
+
+@pytest.fixture
+def checkpoint(tmp_path: Path) -> Path:
+    path = tmp_path / "yolo11n.pt"
+    path.write_bytes(b"weights")
+    return path
+
+
+def make_yolo(checkpoint: Path) -> MagicMock:
+    def export(**_: object) -> str:
+        exported = checkpoint.with_suffix(".onnx")
+        exported.write_bytes(b"exported")
+        return str(exported)
+
+    yolo = MagicMock(ckpt_path=str(checkpoint))
+    yolo.export.side_effect = export
+    return yolo
+
+
+class TestLoadModel:
+    def test_pytorch_backend_loads_checkpoint(self, checkpoint: Path, tmp_path: Path) -> None:
+        with patch("src.model_cache.YOLO") as yolo:
+            load_model(checkpoint, "detect", backend="pytorch", cache_dir=tmp_path / "cache")
+        yolo.assert_called_once_with(model=checkpoint, task="detect")
+        yolo.return_value.export.assert_not_called()
+
+    def test_exported_model_is_cached(self, checkpoint: Path, tmp_path: Path) -> None:
+        cache_dir = tmp_path / "cache"
+        with patch("src.model_cache.YOLO", side_effect=lambda **_: make_yolo(checkpoint)) as yolo:
+            load_model(checkpoint, "detect", backend="onnx", imgsz=640, cache_dir=cache_dir)
+            (artifact,) = cache_dir.iterdir()
+            assert artifact.suffix == ".onnx"
+            assert yolo.call_args.kwargs["model"] == artifact
+
+            yolo.reset_mock()
+            load_model(checkpoint, "detect", backend="onnx", imgsz=640, cache_dir=cache_dir)
+            # The cached artifact is loaded without exporting the model again.
+            assert yolo.call_count == 2
+            assert yolo.call_args.kwargs["model"] == artifact
+
+    def test_cache_key_depends_on_export_parameters(self, checkpoint: Path, tmp_path: Path) -> None:
+        cache_dir = tmp_path / "cache"
+        with patch("src.model_cache.YOLO", side_effect=lambda **_: make_yolo(checkpoint)):
+            load_model(checkpoint, "detect", backend="onnx", imgsz=640, cache_dir=cache_dir)
+            load_model(checkpoint, "detect", backend="onnx", imgsz=320, cache_dir=cache_dir)
+            checkpoint.write_bytes(b"fine-tuned weights")
+            load_model(checkpoint, "detect", backend="onnx", imgsz=640, cache_dir=cache_dir)
+        assert len(list(cache_dir.iterdir())) == 3
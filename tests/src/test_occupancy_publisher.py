@@ -0,0 +1,202 @@
+import asyncio
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from aiohttp import ClientConnectionError, ClientResponseError
+from faker import Faker
+
+from src.occupancy_publisher import OccupancyPublisher
+from src.occupancy_spool import OccupancySpool
+from src.settings import OCCUPANCY_URL
+
+BULK_URL = "/api/occupancy/bulk/"
+
+
+@pytest.fixture
+def http_client() -> MagicMock:
+    client = MagicMock()
+    client.request_json = AsyncMock(return_value={})
+    return client
+
+
+@pytest.fixture
+def spool(tmp_path: Path) -> Iterator[OccupancySpool]:
+    spool = OccupancySpool(tmp_path / "spool.sqlite3")
+    yield spool
+    spool.close()
+
+
+def uploaded_readings(http_client: MagicMock) -> list[dict[str, Any]]:
+    """Return the uploaded single readings without their timestamps."""
+    return [
+        {key: value for key, value in call.kwargs["json"].items() if key != "recorded_at"}
+        for call in http_client.request_json.await_args_list
+        if call.args[0] == OCCUPANCY_URL
+    ]
+
+
+class TestOccupancyPublisher:
+    async def test_flush_sends_latest_reading_per_parking_lot(self, http_client: MagicMock, faker: Faker) -> None:
+        publisher = OccupancyPublisher(http_client, bulk_url=None)
+        parking_lot_id = faker.pyint()
+        for occupied_spots in range(3):
+            publisher.publish(parking_lot_id, occupied_spots)
+        await publisher.flush()
+
+        http_client.request_json.assert_awaited_once()
+        assert uploaded_readings(http_client) == [{"parking_lot_id": parking_lot_id, "occupied_spots": 2}]
+        assert "recorded_at" in http_client.request_json.await_args.kwargs["json"]
+
+    async def test_flush_in_bulk(self, http_client: MagicMock) -> None:
+        publisher = OccupancyPublisher(http_client, bulk_url=BULK_URL)
+        publisher.publish(1, 10)
+        publisher.publish(2, 20)
+        await publisher.flush()
+
+        http_client.request_json.assert_awaited_once()
+        assert http_client.request_json.await_args.args == (BULK_URL,)
+        assert [reading["parking_lot_id"] for reading in http_client.request_json.await_args.kwargs["json"]] == [1, 2]
+
+    async def test_flush_falls_back_to_single_uploads(self, http_client: MagicMock) -> None:
+        not_found = ClientResponseError(MagicMock(), (), status=404)
+        http_client.request_json.side_effect = [not_found, {}, {}]
+        publisher = OccupancyPublisher(http_client, bulk_url=BULK_URL)
+        publisher.publish(1, 10)
+        publisher.publish(2, 20)
+        await publisher.flush()
+
+        assert publisher.bulk_url is None
+        assert http_client.request_json.await_count == 3
+        assert len(uploaded_readings(http_client)) == 2
+
+    async def test_failed_readings_are_kept_unless_superseded(self, http_client: MagicMock) -> None:
+        http_client.request_json.side_effect = ClientConnectionError
+        publisher = OccupancyPublisher(http_client, bulk_url=None)
+        publisher.publish(1, 10)
+        publisher.publish(2, 20)
+        await publisher.flush()
+        publisher.publish(2, 21)
+
+        http_client.request_json.side_effect = None
+        http_client.request_json.reset_mock()
+        await publisher.flush()
+        assert uploaded_readings(http_client) == [
+            {"parking_lot_id": 1, "occupied_spots": 10},
+            {"parking_lot_id": 2, "occupied_spots": 21},
+        ]
+
+    async def test_readings_are_kept_on_unexpected_failure(self, http_client: MagicMock) -> None:
+        # E.g. the token refresh has got an error page instead of the tokens.
+        http_client.request_json.side_effect = KeyError("access")
+        publisher = OccupancyPublisher(http_client, bulk_url=BULK_URL)
+        publisher.publish(1, 10)
+        await publisher.flush()
+
+        http_client.request_json.side_effect = None
+        await publisher.flush()
+        assert http_client.request_json.await_args.kwargs["json"][0]["occupied_spots"] == 10
+
+    async def test_readings_are_kept_if_spooling_fails(self, http_client: MagicMock, spool: OccupancySpool) -> None:
+        http_client.request_json.side_effect = ClientConnectionError
+        publisher = OccupancyPublisher(http_client, bulk_url=None, spool=spool)
+        publisher.publish(1, 10)
+        with patch.object(spool, "append", side_effect=sqlite3.OperationalError("disk I/O error")):
+            await publisher.flush()
+
+        http_client.request_json.side_effect = None
+        await publisher.flush()
+        assert uploaded_readings(http_client)[-1] == {"parking_lot_id": 1, "occupied_spots": 10}
+
+    async def test_background_flush_survives_failures(self, http_client: MagicMock) -> None:
+        publisher = OccupancyPublisher(http_client, flush_interval=0.01, bulk_url=None)
+        flush = AsyncMock(side_effect=lambda: None if flush.await_count > 1 else 1 / 0)
+        with patch.object(publisher, "flush", flush):
+            publisher.start()
+            await asyncio.sleep(0.05)
+            assert flush.await_count >= 2
+            assert not publisher._tasks[0].done()
+        await publisher.close()
+
+    async def test_size_threshold_triggers_flush(self, http_client: MagicMock) -> None:
+        publisher = OccupancyPublisher(http_client, flush_size=2, flush_interval=60, bulk_url=None)
+        publisher.start()
+        publisher.publish(1, 10)
+        publisher.publish(2, 20)
+        await asyncio.sleep(0.05)
+
+        # The readings are uploaded long before the flush interval passes.
+        assert http_client.request_json.await_count == 2
+        await publisher.close()
+
+    async def test_unchanged_readings_are_dropped(self, http_client: MagicMock) -> None:
+        publisher = OccupancyPublisher(http_client, bulk_url=None, unchanged_interval=60)
+        spots = [{"id": 1, "is_occupied": True}]
+        for _ in range(3):
+            publisher.publish(1, 1, spots=spots)
+            await publisher.flush()
+        publisher.publish(1, 0, spots=[{"id": 1, "is_occupied": False}])
+        await publisher.flush()
+
+        assert [reading["occupied_spots"] for reading in uploaded_readings(http_client)] == [1, 0]
+
+    async def test_unchanged_reading_is_republished_after_interval(self, http_client: MagicMock) -> None:
+        publisher = OccupancyPublisher(http_client, bulk_url=None, unchanged_interval=0.01)
+        publisher.publish(1, 5)
+        await publisher.flush()
+        await asyncio.sleep(0.02)
+        publisher.publish(1, 5)
+        await publisher.flush()
+
+        assert http_client.request_json.await_count == 2
+
+    async def test_failed_readings_are_spooled_and_replayed(
+        self, http_client: MagicMock, spool: OccupancySpool
+    ) -> None:
+        http_client.request_json.side_effect = ClientConnectionError
+        publisher = OccupancyPublisher(http_client, bulk_url=None, spool=spool, drain_backoff=0.01)
+        publisher.start()
+        for occupied_spots in range(3):
+            publisher.publish(1, occupied_spots)
+            await publisher.flush()
+        assert len(spool) == 3
+
+        # The backend has recovered.
+        http_client.request_json.side_effect = None
+        http_client.request_json.reset_mock()
+        await asyncio.sleep(0.1)
+        await publisher.close()
+
+        assert len(spool) == 0
+        assert uploaded_readings(http_client) == [
+            {"parking_lot_id": 1, "occupied_spots": occupied_spots} for occupied_spots in range(3)
+        ]
+
+
+class TestOccupancySpool:
+    def test_append_peek_delete(self, spool: OccupancySpool) -> None:
+        spool.append([{"parking_lot_id": 1}, {"parking_lot_id": 2}])
+        spooled_readings = spool.peek(10)
+        assert [reading for _, reading in spooled_readings] == [{"parking_lot_id": 1}, {"parking_lot_id": 2}]
+
+        spool.delete([spooled_readings[0][0]])
+        assert [reading for _, reading in spool.peek(10)] == [{"parking_lot_id": 2}]
+
+    def test_spool_survives_reopening(self, tmp_path: Path) -> None:
+        path = tmp_path / "spool.sqlite3"
+        spool = OccupancySpool(path)
+        spool.append([{"parking_lot_id": 1}])
+        spool.close()
+
+        spool = OccupancySpool(path)
+        assert len(spool) == 1
+        spool.close()
+
+    def test_oldest_readings_are_discarded(self, tmp_path: Path) -> None:
+        spool = OccupancySpool(tmp_path / "spool.sqlite3", max_readings=2)
+        spool.append([{"parking_lot_id": id_} for id_ in range(3)])
+        assert [reading for _, reading in spool.peek(10)] == [{"parking_lot_id": 1}, {"parking_lot_id": 2}]
+        spool.close()
@@ -0,0 +1,25 @@
+import numpy as np
+
+from src.occupancy_smoother import OccupancySmoother
+
+
+class TestOccupancySmoother:
+    def test_vehicles_jitter_is_suppressed(self) -> None:
+        smoother = OccupancySmoother(window=3)
+        no_spots = np.zeros(0, dtype=bool)
+        smoothed_vehicles = [smoother.update(vehicles, no_spots)[0] for vehicles in (5, 5, 4, 5, 6, 5, 3, 3)]
+        assert smoothed_vehicles == [5, 5, 5, 5, 5, 5, 5, 3]
+
+    def test_spot_flips_once_the_majority_disagrees(self) -> None:
+        smoother = OccupancySmoother(spots=2, window=3)
+        observations = [[True, False], [False, False], [True, True], [True, True], [False, True]]
+        smoothed_occupancy = [smoother.update(0, np.array(spots))[1].tolist() for spots in observations]
+        # The first spot ignores the missed detections, the second one waits for a confirmation.
+        assert smoothed_occupancy == [[True, False], [True, False], [True, False], [True, True], [True, True]]
+
+    def test_window_of_one_disables_smoothing(self) -> None:
+        smoother = OccupancySmoother(spots=1, window=1)
+        for vehicles, is_occupied in ((3, True), (1, False), (4, True)):
+            smoothed_vehicles, spots_occupancy = smoother.update(vehicles, np.array([is_occupied]))
+            assert smoothed_vehicles == vehicles
+            assert spots_occupancy.tolist() == [is_occupied]
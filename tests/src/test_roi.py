@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.roi import StreamGeometry
+
+SHAPE = (100, 200)
+LOWER_HALF = [[[0, 0.5], [1, 0.5], [1, 1], [0, 1]]]
+SPOTS = [
+    {"id": 11, "polygon": [[0, 0.5], [0.5, 0.5], [0.5, 1], [0, 1]]},
+    {"id": 12, "polygon": [[0.5, 0.5], [1, 0.5], [1, 1], [0.5, 1]]},
+]
+
+
+class TestStreamGeometry:
+    def test_crop_to_roi(self) -> None:
+        geometry = StreamGeometry(SHAPE, roi=[[[0.25, 0.5], [0.75, 0.5], [0.5, 1]]])
+        frame = np.full((*SHAPE, 3), 255, dtype=np.uint8)
+
+        cropped_frame = geometry.crop(frame)
+
+        x0, y0, x1, y1 = geometry.bbox
+        assert cropped_frame.shape == (y1 - y0, x1 - x0, 3)
+        assert cropped_frame.shape[0] < SHAPE[0]
+        assert cropped_frame.shape[1] < SHAPE[1]
+        # The corners of the bounding box lie outside the triangle and are blacked out.
+        assert not cropped_frame[-1, 0].any()
+        assert cropped_frame[0, cropped_frame.shape[1] // 2].all()
+
+    def test_crop_without_roi(self) -> None:
+        geometry = StreamGeometry(SHAPE)
+        frame = np.ones((*SHAPE, 3), dtype=np.uint8)
+        assert geometry.crop(frame).shape == frame.shape
+
+    def test_assign(self) -> None:
+        geometry = StreamGeometry(SHAPE, roi=LOWER_HALF, spots=SPOTS)
+        x0, y0, _, _ = geometry.bbox
+        # Boxes are relative to the cropped frame: one car per spot and one car outside the ROI.
+        boxes = np.array(
+            [
+                [10, 60, 30, 80],
+                [140, 60, 160, 80],
+                [150, 10, 170, 20],
+            ],
+            dtype=np.float32,
+        ) - [x0, y0, x0, y0]
+
+        vehicles, occupancy = geometry.assign(boxes)
+
+        assert vehicles == 2
+        assert geometry.spot_ids == [11, 12]
+        assert occupancy.tolist() == [True, True]
+
+    def test_assign_without_detections(self) -> None:
+        geometry = StreamGeometry(SHAPE, roi=LOWER_HALF, spots=SPOTS)
+        vehicles, occupancy = geometry.assign(np.empty((0, 4), dtype=np.float32))
+        assert vehicles == 0
+        assert occupancy.tolist() == [False, False]
+
+    def test_vehicles_in_overlap_zone_are_not_counted(self) -> None:
+        # The right half is also covered by another camera of the parking lot.
+        geometry = StreamGeometry(SHAPE, spots=SPOTS, overlap=[[[0.5, 0], [1, 0], [1, 1], [0.5, 1]]])
+        boxes = np.array([[10, 60, 30, 80], [140, 60, 160, 80]], dtype=np.float32)
+
+        vehicles, occupancy = geometry.assign(boxes)
+
+        assert vehicles == 1
+        # Spots are still assigned, they are merged with the other camera by their IDs.
+        assert occupancy.tolist() == [True, True]
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from itertools import pairwise
+
+from src.scheduler import DeadlineScheduler
+
+INTERVAL = 0.05
+
+
+class TestDeadlineScheduler:
+    async def test_run_until_jobs_removed(self) -> None:
+        scheduler = DeadlineScheduler()
+        runs: list[float] = []
+
+        async def job() -> None:
+            runs.append(time.monotonic())
+            if len(runs) == 3:
+                scheduler.remove("parking-lot")
+
+        scheduler.add("parking-lot", INTERVAL, job)
+        await asyncio.wait_for(scheduler.run(), 1)
+
+        assert len(runs) == 3
+        assert "parking-lot" not in scheduler
+        # The runs follow the interval instead of running back-to-back.
+        assert runs[-1] - runs[0] >= 2 * INTERVAL * 0.9
+
+    async def test_first_runs_are_staggered(self) -> None:
+        scheduler = DeadlineScheduler()
+        started: dict[int, float] = {}
+
+        def make_job(key: int):  # noqa: ANN202
+            async def job() -> None:
+                started[key] = time.monotonic()
+                scheduler.remove(key)
+
+            return job
+
+        for key in range(4):
+            scheduler.add(key, INTERVAL * 4, make_job(key))
+        await asyncio.wait_for(scheduler.run(), 1)
+
+        start_times = sorted(started.values())
+        assert min(b - a for a, b in pairwise(start_times)) >= INTERVAL * 0.5
+
+    async def test_concurrency_budget_and_coalescing(self) -> None:
+        scheduler = DeadlineScheduler(max_concurrent_jobs=1)
+        running = 0
+        max_running = 0
+        runs = 0
+        skipped_runs = 0
+
+        async def slow_job() -> None:
+            nonlocal running, max_running, runs, skipped_runs
+            running += 1
+            max_running = max(max_running, running)
+            # The job takes several intervals, so the missed runs are coalesced.
+            await asyncio.sleep(INTERVAL * 3.5)
+            running -= 1
+            runs += 1
+            if runs == 2:
+                skipped_runs = scheduler.skipped_runs["slow"]
+                scheduler.remove("slow")
+                scheduler.remove("fast")
+
+        async def fast_job() -> None:
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            running -= 1
+
+        scheduler.add("slow", INTERVAL, slow_job)
+        scheduler.add("fast", INTERVAL, fast_job)
+        await asyncio.wait_for(scheduler.run(), 2)
+
+        assert max_running == 1
+        assert runs == 2
+        assert skipped_runs >= 2
+
+    async def test_lags_are_reported(self) -> None:
+        scheduler = DeadlineScheduler()
+        lags: list[float] = []
+
+        async def job() -> None:
+            lags.append(scheduler.lags["parking-lot"])
+            scheduler.remove("parking-lot")
+
+        scheduler.add("parking-lot", INTERVAL, job)
+        await asyncio.wait_for(scheduler.run(), 1)
+
+        assert len(lags) == 1
+        assert 0 <= lags[0] < INTERVAL
+        # Removed jobs aren't reported anymore.
+        assert "parking-lot" not in scheduler.lags
+
+    async def test_readded_job_waits_for_removed_run(self) -> None:
+        scheduler = DeadlineScheduler()
+        events: list[str] = []
+        release = asyncio.Event()
+
+        async def old_job() -> None:
+            events.append("old started")
+            # The interval changes while the job is running.
+            scheduler.remove("parking-lot")
+            scheduler.add("parking-lot", INTERVAL / 10, new_job)
+            await release.wait()
+            events.append("old finished")
+
+        async def new_job() -> None:
+            events.append("new started")
+            scheduler.remove("parking-lot")
+
+        scheduler.add("parking-lot", INTERVAL, old_job)
+        scheduler_run = asyncio.create_task(scheduler.run())
+        await asyncio.sleep(INTERVAL * 2)
+        assert events == ["old started"]
+
+        release.set()
+        await asyncio.wait_for(scheduler_run, 1)
+        assert events == ["old started", "old finished", "new started"]
@@ -0,0 +1,88 @@
+import asyncio
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from faker import Faker
+from yt_dlp.utils import DownloadError
+
+from src.source_resolver import SourceResolver
+
+YOUTUBE_URL = "https://www.youtube.com/watch?v=LcSaBafrb-w"
+
+
+def signed_url(expire: float) -> str:
+    return f"https://rr1.googlevideo.com/videoplayback?expire={int(expire)}&sig=abc"
+
+
+class TestSourceResolver:
+    async def test_plain_source_is_not_resolved(self, tmp_path: Path, faker: Faker) -> None:
+        resolver = SourceResolver(cache_path=tmp_path / "cache.json")
+        source = faker.url()
+
+        with patch("src.source_resolver.get_best_youtube_url") as get_best_youtube_url:
+            assert await resolver.resolve(source) == source
+
+        get_best_youtube_url.assert_not_called()
+        resolver.close()
+
+    async def test_concurrent_resolutions_share_single_call(self, tmp_path: Path) -> None:
+        resolver = SourceResolver(cache_path=tmp_path / "cache.json")
+        url = signed_url(time.time() + 3600)
+
+        def get_best_youtube_url(*_, **__) -> str:  # noqa: ANN002, ANN003
+            time.sleep(0.05)
+            return url
+
+        with patch("src.source_resolver.get_best_youtube_url", side_effect=get_best_youtube_url) as mock:
+            assert await asyncio.gather(*(resolver.resolve(YOUTUBE_URL) for _ in range(5))) == [url] * 5
+            # The cached URL is returned without resolving it again.
+            assert await resolver.resolve(YOUTUBE_URL) == url
+
+        mock.assert_called_once_with(YOUTUBE_URL, method="yt-dlp")
+        resolver.close()
+
+    async def test_cache_is_persisted(self, tmp_path: Path) -> None:
+        cache_path = tmp_path / "cache.json"
+        url = signed_url(time.time() + 3600)
+        expired_source = f"{YOUTUBE_URL}-expired"
+        resolver = SourceResolver(cache_path=cache_path)
+        with patch("src.source_resolver.get_best_youtube_url", return_value=url):
+            await resolver.resolve(YOUTUBE_URL)
+        with patch("src.source_resolver.get_best_youtube_url", return_value=signed_url(time.time() + 60)):
+            # Expires within the margin.
+            await resolver.resolve(expired_source)
+        resolver.close()
+
+        restarted_resolver = SourceResolver(cache_path=cache_path)
+        assert restarted_resolver.cached(YOUTUBE_URL) == url
+        assert restarted_resolver.cached(expired_source) is None
+        restarted_resolver.close()
+
+    async def test_refresh(self, tmp_path: Path) -> None:
+        resolver = SourceResolver(cache_path=tmp_path / "cache.json")
+        urls = [signed_url(time.time() + 3600), signed_url(time.time() + 7200)]
+
+        with patch("src.source_resolver.get_best_youtube_url", side_effect=urls):
+            assert await resolver.resolve(YOUTUBE_URL) == urls[0]
+            assert await resolver.resolve(YOUTUBE_URL, refresh=True) == urls[1]
+
+        assert resolver.cached(YOUTUBE_URL) == urls[1]
+        resolver.close()
+
+    async def test_failed_resolution(self, tmp_path: Path) -> None:
+        resolver = SourceResolver(cache_path=tmp_path / "cache.json", timeout=0.01)
+
+        with (
+            patch("src.source_resolver.get_best_youtube_url", side_effect=DownloadError("Private video")),
+            pytest.raises(ConnectionError),
+        ):
+            await resolver.resolve(YOUTUBE_URL)
+
+        with (
+            patch("src.source_resolver.get_best_youtube_url", side_effect=lambda *_, **__: time.sleep(0.1)),
+            pytest.raises(TimeoutError),
+        ):
+            await resolver.resolve(YOUTUBE_URL)
+        resolver.close()
@@ -1,14 +1,21 @@
-from asyncio import wait_for
+from asyncio import sleep, wait_for
+from collections.abc import AsyncIterator
 from datetime import UTC, datetime
+from pathlib import Path
+from threading import Event
 from typing import Any
-from unittest.mock import patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import numpy as np
 import pytest
+from aiohttp import ClientConnectionError
 from faker import Faker
 
 from src import SpotGazer
-from src.aiohttp_jwt_client import AiohttpJWTClient
-from src.settings import STREAMS_USAGE_DURATION
+from src.occupancy_smoother import OccupancySmoother
+from src.roi import StreamGeometry
+from src.settings import STREAM_CLAIM_STEP, STREAMS_USAGE_DURATION
+from src.stream_reader import Frame
 
 
 @pytest.fixture
@@ -46,13 +53,220 @@ def video_stream_sources(faker: Faker) -> dict[str, list[dict[str, Any]]]:
     }
 
 
+@pytest.fixture
+async def offline_spot_gazer(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> AsyncIterator[SpotGazer]:
+    """`SpotGazer` with a mocked model."""
+    monkeypatch.chdir(tmp_path)
+    with (
+        patch("src.batch_predictor.load_model"),
+        patch("src.source_resolver.get_best_youtube_url", side_effect=lambda url, **_: url),
+    ):
+        spot_gazer = SpotGazer()
+        yield spot_gazer
+        await spot_gazer.stop_detection()
+
+
 class TestSpotGazer:
     async def test_start_stop_detection(self, video_stream_sources: dict[str, list[dict[str, Any]]]) -> None:
-        with patch.object(AiohttpJWTClient, "request_json") as mock:
-            mock.return_value = video_stream_sources
-
+        with patch("src.spot_gazer.fetch_video_stream_sources", return_value=video_stream_sources["results"]):
             spot_gazer = SpotGazer()
             try:
                 await wait_for(spot_gazer.start_detection(datetime.now(UTC) + STREAMS_USAGE_DURATION), 15)
             except (KeyboardInterrupt, TimeoutError):
                 await spot_gazer.stop_detection()
+
+    async def test_sync_parking_lots(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]], faker: Faker
+    ) -> None:
+        first_parking_lot, second_parking_lot = video_stream_sources["results"]
+        stream_reader = MagicMock()
+        with patch("src.spot_gazer.StreamReader", stream_reader):
+            await offline_spot_gazer._sync_parking_lots(video_stream_sources["results"])
+        assert set(offline_spot_gazer._parking_lots) == {
+            first_parking_lot["parking_lot_id"],
+            second_parking_lot["parking_lot_id"],
+        }
+        assert all(
+            parking_lot_id in offline_spot_gazer.scheduler for parking_lot_id in offline_spot_gazer._parking_lots
+        )
+        assert stream_reader.call_count == 3
+
+        # The first parking lot is no longer assigned and a new stream is added to the second one.
+        new_stream = {"id": faker.pyint(), "stream_source": faker.url(), "is_active": True, "in_use_until": None}
+        second_parking_lot = {**second_parking_lot, "streams": [*second_parking_lot["streams"], new_stream]}
+        with patch("src.spot_gazer.StreamReader", stream_reader):
+            await offline_spot_gazer._sync_parking_lots([second_parking_lot])
+
+        assert set(offline_spot_gazer._parking_lots) == {second_parking_lot["parking_lot_id"]}
+        assert first_parking_lot["parking_lot_id"] not in offline_spot_gazer.scheduler
+        # Only the new stream has been opened, the running one is untouched.
+        assert stream_reader.call_count == 4
+        active_streams = offline_spot_gazer._parking_lots[second_parking_lot["parking_lot_id"]]["active_streams"]
+        assert [stream["id"] for stream in active_streams] == [stream["id"] for stream in second_parking_lot["streams"]]
+
+    async def test_reconfigured_stream_keeps_running(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]], faker: Faker
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        stream_reader = MagicMock()
+        with patch("src.spot_gazer.StreamReader", stream_reader):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+            # The lease renewal alone doesn't change the configuration.
+            renewed_streams = [{**stream, "in_use_until": faker.iso8601()} for stream in parking_lot["streams"]]
+            await offline_spot_gazer._sync_parking_lots([{**parking_lot, "streams": renewed_streams}])
+            (active_stream,) = offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]["active_streams"]
+            assert "reconfigured" not in active_stream
+
+            roi = [[[0, 0.5], [1, 0.5], [1, 1], [0, 1]]]
+            reconfigured_streams = [{**stream, "roi": roi} for stream in renewed_streams]
+            await offline_spot_gazer._sync_parking_lots([{**parking_lot, "streams": reconfigured_streams}])
+
+        assert stream_reader.call_count == 1
+        assert offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]["active_streams"] == [active_stream]
+        assert active_stream["roi"] == roi
+        assert active_stream["reconfigured"]
+
+    async def test_skipped_runs_are_not_smoothed(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]]
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        with patch("src.spot_gazer.StreamReader"):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+        parking_streams = offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]
+        (stream,) = parking_streams["active_streams"]
+        # The stream is sampled every other run.
+        stream["controller"] = MagicMock(stride=2, imgsz=640)
+        stream["controller"].is_due.side_effect = [True, False] * 5
+
+        def read_latest_frame(stream: dict[str, Any]) -> tuple[np.ndarray, bool]:
+            stream.setdefault("geometry", StreamGeometry((48, 64)))
+            stream.setdefault("smoother", OccupancySmoother(window=3))
+            return np.zeros((48, 64, 3), dtype=np.uint8), True
+
+        # A spurious detection of 9 vehicles between the frames with 5.
+        observed_vehicles = [np.array([[10, 10, 20, 20, 0.9]] * vehicles) for vehicles in (5, 5, 9, 5, 5)]
+        with (
+            patch("src.spot_gazer._read_latest_frame", read_latest_frame),
+            patch.object(offline_spot_gazer, "_detect_vehicles", AsyncMock(side_effect=observed_vehicles)),
+            patch.object(offline_spot_gazer.occupancy_publisher, "publish") as publish,
+        ):
+            for _ in range(10):
+                await offline_spot_gazer._detect_parking_occupancy(parking_streams)
+
+        assert [call.args[1] for call in publish.call_args_list] == [5] * 10
+
+    async def test_stalled_stream_is_not_deactivated(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]]
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        with patch("src.spot_gazer.StreamReader"):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+        parking_streams = offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]
+        (stream,) = parking_streams["active_streams"]
+        image = np.zeros((48, 64, 3), dtype=np.uint8)
+        # The reader is recovering the stream meanwhile, then it reports the stream lost.
+        stream["reader"].read.side_effect = [Frame(image, 0), Frame(image, 20), Frame(image, 40), None]
+        boxes = np.array([[10, 10, 20, 20, 0.9]] * 2)
+
+        with (
+            patch.object(offline_spot_gazer, "_detect_vehicles", AsyncMock(return_value=boxes)),
+            patch.object(offline_spot_gazer, "_deactivate_broken_stream", AsyncMock()) as deactivate_broken_stream,
+            patch.object(offline_spot_gazer.occupancy_publisher, "publish") as publish,
+        ):
+            for _ in range(3):
+                await offline_spot_gazer._detect_parking_occupancy(parking_streams)
+            deactivate_broken_stream.assert_not_awaited()
+            # The last detections are reused while the stream is stalled.
+            assert [call.args[1] for call in publish.call_args_list] == [2, 2, 2]
+
+            await offline_spot_gazer._detect_parking_occupancy(parking_streams)
+            deactivate_broken_stream.assert_awaited_once_with(stream)
+
+    async def test_reader_opened_after_timeout_is_closed(self, offline_spot_gazer: SpotGazer) -> None:
+        opened = Event()
+        stream_reader = MagicMock()
+
+        def open_stream_reader(*_: object, **__: object) -> MagicMock:
+            opened.wait(timeout=5)
+            return stream_reader
+
+        with (
+            patch("src.spot_gazer.StreamReader", side_effect=open_stream_reader),
+            patch("src.spot_gazer.FRAME_READ_TIMEOUT", 0.01),
+            pytest.raises(TimeoutError),
+        ):
+            await offline_spot_gazer._start_reader("rtsp://camera", MagicMock())
+        opened.set()
+
+        for _ in range(100):
+            if stream_reader.close.called:
+                break
+            await sleep(0.01)
+        stream_reader.close.assert_called_once()
+
+    async def test_failed_deactivation_does_not_leak_readers(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]], faker: Faker
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        broken_stream = {"id": faker.pyint(), "stream_source": faker.url(), "is_active": True, "in_use_until": None}
+        parking_lot = {**parking_lot, "streams": [*parking_lot["streams"], broken_stream]}
+
+        def open_reader(url: str, **_: object) -> MagicMock:
+            if url == broken_stream["stream_source"]:
+                raise ConnectionError
+            return MagicMock()
+
+        stream_reader = MagicMock(side_effect=open_reader)
+        offline_spot_gazer.http_client.request_json = AsyncMock(side_effect=ClientConnectionError)
+        with patch("src.spot_gazer.StreamReader", stream_reader):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+
+        active_streams = offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]["active_streams"]
+        assert [stream["id"] for stream in active_streams] == [parking_lot["streams"][0]["id"]]
+
+    async def test_reader_of_failed_stream_is_closed(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]]
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        stream_reader = MagicMock()
+
+        async def open_stream(stream: dict[str, Any]) -> bool:
+            stream["reader"] = stream_reader
+            raise RuntimeError
+
+        with patch.object(offline_spot_gazer, "_open_stream", open_stream):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+
+        assert offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]["active_streams"] == []
+        assert parking_lot["parking_lot_id"] not in offline_spot_gazer.scheduler
+        stream_reader.close.assert_called_once()
+
+    async def test_replay_source_is_not_opened_from_backend(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]]
+    ) -> None:
+        _, parking_lot = video_stream_sources["results"]
+        for stream in parking_lot["streams"]:
+            stream["stream_source"] = "replay:///etc?speed=max"
+
+        with (
+            patch("src.spot_gazer.open_replay") as open_replay,
+            patch.object(offline_spot_gazer, "_deactivate_broken_stream", AsyncMock()) as deactivate_broken_stream,
+        ):
+            await offline_spot_gazer._sync_parking_lots([parking_lot])
+
+        open_replay.assert_not_called()
+        assert deactivate_broken_stream.await_count == len(parking_lot["streams"])
+        assert offline_spot_gazer._parking_lots[parking_lot["parking_lot_id"]]["active_streams"] == []
+
+    async def test_stream_capacity(
+        self, offline_spot_gazer: SpotGazer, video_stream_sources: dict[str, list[dict[str, Any]]]
+    ) -> None:
+        with patch("src.spot_gazer.get_cpu_load", return_value=0.0):
+            assert offline_spot_gazer._stream_capacity(100) == STREAM_CLAIM_STEP
+            with patch("src.spot_gazer.StreamReader"):
+                await offline_spot_gazer._sync_parking_lots(video_stream_sources["results"])
+            assert offline_spot_gazer._stream_capacity(100) == 3 + STREAM_CLAIM_STEP
+            assert offline_spot_gazer._stream_capacity(5) == 5
+        # No new streams are leased while the node is overloaded.
+        with patch("src.spot_gazer.get_cpu_load", return_value=2.0):
+            assert offline_spot_gazer._stream_capacity(100) == 3
@@ -0,0 +1,135 @@
+import queue
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Event
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+import pytest
+
+from src.stream_reader import StreamReader
+
+FPS = 30
+
+
+class FakeCapture:
+    """`cv2.VideoCapture` whose `grab` blocks until the test hands it the next frame (`None` fails the grab)."""
+
+    def __init__(self, frame_count: int = 0) -> None:
+        self.frame_count = frame_count
+        self.frames: queue.Queue[np.ndarray | None] = queue.Queue()
+        self.grabbed: np.ndarray | None = None
+        self.grabs = 0
+        self.retrieves = 0
+        self.waiting = Event()
+        self.released = Event()
+
+    def isOpened(self) -> bool:  # noqa: N802
+        return True
+
+    def open(self, _: str) -> bool:
+        return True
+
+    def get(self, prop: int) -> float:
+        return FPS if prop == cv2.CAP_PROP_FPS else self.frame_count
+
+    def grab(self) -> bool:
+        self.waiting.set()
+        frame = self.frames.get()
+        self.waiting.clear()
+        if frame is None:
+            return False
+        self.grabs += 1
+        self.grabbed = frame
+        return True
+
+    def retrieve(self) -> tuple[bool, np.ndarray | None]:
+        self.retrieves += 1
+        return True, self.grabbed
+
+    def release(self) -> None:
+        self.released.set()
+
+    def put(self, value: int) -> None:
+        """Hand the next frame to `grab` and wait until it asks for another one."""
+        self.waiting.clear()
+        self.frames.put(np.full((48, 64, 3), value, dtype=np.uint8))
+        assert self.waiting.wait(timeout=5)
+
+
+@pytest.fixture
+def capture() -> Iterator[FakeCapture]:
+    capture = FakeCapture()
+    capture.frames.put(np.full((48, 64, 3), 0, dtype=np.uint8))
+    with patch("src.stream_reader.cv2.VideoCapture", return_value=capture):
+        yield capture
+    # Unblock the grabbing thread.
+    capture.frames.put(None)
+
+
+class TestStreamReader:
+    @pytest.mark.usefixtures("capture")
+    def test_read_returns_latest_frame(self) -> None:
+        reader = StreamReader("rtsp://camera")
+        frame = reader.read()
+        assert frame is not None
+        assert frame.image.shape == (48, 64, 3)
+        assert frame.age >= 0
+        # The same frame is returned until a newer one is grabbed.
+        assert reader.read().image is frame.image  # type: ignore[union-attr]
+        reader.close()
+
+    def test_read_drops_superseded_frames(self, capture: FakeCapture) -> None:
+        reader = StreamReader("rtsp://camera")
+        reader.read()
+        for value in (10, 20, 30):
+            capture.put(value)
+        # The superseded frames are grabbed without being retrieved.
+        assert (capture.grabs, capture.retrieves) == (4, 1)
+
+        with ThreadPoolExecutor(1) as executor:
+            future = executor.submit(reader.read)
+            # The next grabbed frame is retrieved once it's asked for.
+            while not reader._retrieve_requested:
+                time.sleep(0.001)
+            capture.frames.put(np.full((48, 64, 3), 40, dtype=np.uint8))
+            frame = future.result(timeout=5)
+        assert frame is not None
+        assert frame.image.mean() == 40
+        assert capture.retrieves == 2
+        reader.close()
+
+    def test_read_does_not_wait_for_hung_grab(self, capture: FakeCapture) -> None:
+        reader = StreamReader("rtsp://camera", retrieve_timeout=0.05)
+        first_frame = reader.read()
+        capture.put(10)
+        # The source hangs in `grab`, the last retrieved frame is returned with its growing age.
+        frame = reader.read()
+        assert frame is not None
+        assert frame.image is first_frame.image  # type: ignore[union-attr]
+        assert frame.age > first_frame.age  # type: ignore[union-attr]
+
+        started_at = time.monotonic()
+        reader.close()
+        assert time.monotonic() - started_at < 1
+        assert reader.read() is None
+        # The capture is released by the grabbing thread once the grab returns.
+        assert not capture.released.is_set()
+        capture.frames.put(None)
+        assert capture.released.wait(timeout=5)
+
+    def test_read_after_stream_end(self, capture: FakeCapture) -> None:
+        capture.frame_count = 1
+        reader = StreamReader("video.avi")
+        capture.frames.put(None)
+        reader._thread.join(timeout=5)
+        assert not reader.is_running
+        assert reader.read() is None
+        assert capture.released.is_set()
+
+    def test_open_missing_source(self, tmp_path: Path) -> None:
+        with pytest.raises(ConnectionError):
+            StreamReader(str(tmp_path / "missing.avi"))
@@ -0,0 +1,93 @@
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import pytest
+from faker import Faker
+
+from src.aiohttp_jwt_client import AiohttpJWTClient
+from src.benchmark import BenchmarkConfig, build_parking_lots
+from src.metrics import metrics
+from src.mock_backend import MockBackend
+from src.settings import TOKEN_REFRESH_URL, TOKEN_URL
+from src.stream_sources import StreamSourceSync, fetch_video_stream_sources
+
+
+@pytest.fixture
+def backend() -> MockBackend:
+    return MockBackend(build_parking_lots(BenchmarkConfig(streams=6, parking_lots=3), ["a.avi"]))
+
+
+@pytest.fixture
+async def http_client(backend: MockBackend, faker: Faker) -> AsyncIterator[AiohttpJWTClient]:
+    base_url = await backend.start()
+    client = AiohttpJWTClient(
+        username=faker.user_name(),
+        password=faker.password(),
+        api_token_url=TOKEN_URL,
+        api_token_refresh_url=TOKEN_REFRESH_URL,
+        base_url=base_url,
+    )
+    yield client
+    await client.close()
+    await backend.stop()
+
+
+def parking_lot_ids(parking_lots: list[dict[str, Any]] | None) -> list[int]:
+    assert parking_lots is not None
+    return [parking_lot["parking_lot_id"] for parking_lot in parking_lots]
+
+
+class TestFetchVideoStreamSources:
+    async def test_pages_are_followed(self, http_client: AiohttpJWTClient) -> None:
+        parking_lots = await fetch_video_stream_sources(
+            http_client, datetime.now(UTC) + timedelta(minutes=1), limit_streams=100, page_size=2
+        )
+        assert parking_lot_ids(parking_lots) == [1, 2, 3]
+
+    async def test_streams_are_limited(self, http_client: AiohttpJWTClient) -> None:
+        parking_lots = await fetch_video_stream_sources(
+            http_client, datetime.now(UTC) + timedelta(minutes=1), limit_streams=4, page_size=2
+        )
+        assert parking_lot_ids(parking_lots) == [1, 2]
+
+
+class TestStreamSourceSync:
+    async def test_unchanged_listing_is_skipped(self, http_client: AiohttpJWTClient, backend: MockBackend) -> None:
+        stream_source_sync = StreamSourceSync(http_client, page_size=2)
+        assert parking_lot_ids(await stream_source_sync.poll(100)) == [1, 2, 3]
+
+        metrics.reset()
+        assert await stream_source_sync.poll(100) is None
+        assert metrics.counters["stream_source_polls"] == 1
+
+        # A camera has been deactivated.
+        backend.parking_lots[0]["streams"][0]["is_active"] = False
+        parking_lots = await stream_source_sync.poll(100)
+        assert parking_lot_ids(parking_lots) == [1, 2, 3]
+        assert len(parking_lots[0]["streams"]) == 1  # type: ignore[index]
+
+    async def test_change_on_later_page_is_fetched(self, http_client: AiohttpJWTClient, backend: MockBackend) -> None:
+        stream_source_sync = StreamSourceSync(http_client, page_size=2)
+        parking_lots = await stream_source_sync.poll(100)
+        assert parking_lot_ids(parking_lots) == [1, 2, 3]
+        parking_lots[0]["streams"].clear()  # type: ignore[index]
+
+        # Only the last page has changed, a camera has been reconfigured.
+        backend.parking_lots[2]["streams"][0]["roi"] = [[[0, 0], [1, 0], [1, 1]]]
+        parking_lots = await stream_source_sync.poll(100)
+        assert parking_lot_ids(parking_lots) == [1, 2, 3]
+        assert parking_lots[2]["streams"][0]["roi"] == [[[0, 0], [1, 0], [1, 1]]]  # type: ignore[index]
+        # The unchanged pages are reused from the last listing.
+        assert len(parking_lots[0]["streams"]) == 2  # type: ignore[index]
+        assert await stream_source_sync.poll(100) is None
+
+    async def test_leases_are_renewed_unconditionally(self, http_client: AiohttpJWTClient) -> None:
+        stream_source_sync = StreamSourceSync(http_client, lease_renewal_interval=timedelta())
+        assert await stream_source_sync.poll(100) is not None
+        assert await stream_source_sync.poll(100) is not None
+
+    async def test_capacity_change_is_fetched(self, http_client: AiohttpJWTClient) -> None:
+        stream_source_sync = StreamSourceSync(http_client)
+        assert parking_lot_ids(await stream_source_sync.poll(2)) == [1]
+        assert parking_lot_ids(await stream_source_sync.poll(4)) == [1, 2]
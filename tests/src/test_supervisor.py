@@ -0,0 +1,209 @@
+import time
+from threading import Event
+from typing import Any
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.settings import STREAM_CLAIM_STEP, SUPERVISOR_MAX_WORKER_FAILURES
+from src.supervisor import Supervisor, Worker, WorkerFailureError, assign_parking_lots, parking_lot_cost
+
+
+def make_parking_lot(parking_lot_id: int, streams: int, processing_rate: float = 1) -> dict[str, Any]:
+    return {
+        "parking_lot_id": parking_lot_id,
+        "processing_rate": processing_rate,
+        "streams": [{"id": parking_lot_id * 100 + index} for index in range(streams)],
+    }
+
+
+def make_worker(*, alive: bool = True, exitcode: int | None = 0, status: dict[str, Any] | None = None) -> Worker:
+    process = MagicMock()
+    process.is_alive.return_value = alive
+    process.exitcode = None if alive else exitcode
+    connection = MagicMock()
+    connection.poll.return_value = False
+    return Worker(process, connection, status or {})
+
+
+def loads(parking_lots: list[dict[str, Any]], assignment: dict[int, int], workers: int) -> list[float]:
+    worker_loads = [0.0] * workers
+    for parking_streams in parking_lots:
+        worker_loads[assignment[parking_streams["parking_lot_id"]]] += parking_lot_cost(parking_streams)
+    return worker_loads
+
+
+class TestAssignParkingLots:
+    def test_cost(self) -> None:
+        assert parking_lot_cost(make_parking_lot(1, streams=3, processing_rate=2)) == 1.5
+
+    def test_balanced(self) -> None:
+        parking_lots = [make_parking_lot(1, 4), make_parking_lot(2, 3), make_parking_lot(3, 2), make_parking_lot(4, 1)]
+
+        assignment = assign_parking_lots(parking_lots, {}, workers=2)
+
+        assert loads(parking_lots, assignment, 2) == [5, 5]
+
+    def test_existing_assignment_is_kept(self) -> None:
+        parking_lots = [make_parking_lot(1, 4), make_parking_lot(2, 1), make_parking_lot(3, 2)]
+
+        assignment = assign_parking_lots(parking_lots, {1: 1, 2: 1, 5: 0}, workers=2)
+
+        assert assignment == {1: 1, 2: 1, 3: 0}
+
+    def test_unavailable_workers_get_no_parking_lots(self) -> None:
+        parking_lots = [make_parking_lot(1, 1), make_parking_lot(2, 1), make_parking_lot(3, 1)]
+
+        assignment = assign_parking_lots(parking_lots, {1: 0}, workers=3, unavailable={0})
+
+        assert set(assignment.values()) == {1, 2}
+
+    def test_assignment_to_removed_worker_is_dropped(self) -> None:
+        parking_lots = [make_parking_lot(1, 1)]
+
+        assert assign_parking_lots(parking_lots, {1: 3}, workers=2) == {1: 0}
+
+
+class TestSupervisor:
+    async def test_dead_worker_is_restarted_and_its_parking_lots_reassigned(self) -> None:
+        supervisor = Supervisor(workers=2)
+        supervisor._parking_lots = [make_parking_lot(1, 2), make_parking_lot(2, 2), make_parking_lot(3, 1)]
+        supervisor._assignment = {1: 0, 2: 1, 3: 1}
+        supervisor._workers = [make_worker(), make_worker(alive=False)]
+        new_worker = make_worker()
+
+        with patch.object(supervisor, "_start_worker", return_value=new_worker) as start_worker:
+            assert supervisor._check_workers()
+        supervisor._rebalance()
+
+        start_worker.assert_called_once_with(1)
+        assert supervisor._workers[1] is new_worker
+        assert supervisor._assignment == {1: 0, 2: 1, 3: 0}
+        new_worker.sender.shutdown()
+        sent = new_worker.connection.send.call_args.args[0]
+        assert [parking_streams["parking_lot_id"] for parking_streams in sent] == [2]
+        await supervisor.http_client.close()
+
+    async def test_stuck_worker_does_not_block_rebalance(self) -> None:
+        supervisor = Supervisor(workers=2)
+        supervisor._parking_lots = [make_parking_lot(1, 1), make_parking_lot(2, 1)]
+        supervisor._workers = [make_worker(), make_worker()]
+        # The first worker doesn't drain its pipe.
+        drained = Event()
+        supervisor._workers[0].connection.send.side_effect = lambda _: drained.wait(timeout=5)
+
+        started_at = time.monotonic()
+        supervisor._rebalance()
+        supervisor._rebalance()
+        assert time.monotonic() - started_at < 1
+
+        supervisor._workers[1].sender.shutdown()
+        assert supervisor._workers[1].connection.send.call_count == 2
+        drained.set()
+        supervisor._workers[0].sender.shutdown()
+        assert supervisor._workers[0].connection.send.call_count == 2
+        await supervisor.http_client.close()
+
+    async def test_worker_has_its_own_spool_and_log_file(self) -> None:
+        supervisor = Supervisor(workers=2)
+
+        with patch.object(supervisor, "_context") as context:
+            context.Pipe.return_value = (MagicMock(), MagicMock())
+            supervisor._start_worker(1)
+
+        _, _, spool_path, _, log_file = context.Process.call_args.kwargs["args"]
+        assert spool_path.stem.endswith("-1")
+        assert log_file.name == "spot-gazer-1.log"
+        await supervisor.http_client.close()
+
+    async def test_failed_worker_is_restarted_with_backoff(self) -> None:
+        # The backoff starts at 5 seconds and doubles with every failure.
+        supervisor = Supervisor(workers=2)
+        supervisor._parking_lots = [make_parking_lot(1, 1), make_parking_lot(2, 1)]
+        supervisor._assignment = {1: 0, 2: 1}
+        supervisor._workers = [make_worker(), make_worker(alive=False, exitcode=1)]
+        now = time.monotonic()
+
+        with (
+            patch.object(
+                supervisor, "_start_worker", return_value=make_worker(alive=False, exitcode=1)
+            ) as start_worker,
+            patch("src.supervisor.time.monotonic") as monotonic,
+        ):
+            restart_times = []
+            for elapsed in range(100):
+                monotonic.return_value = now + elapsed
+                calls = start_worker.call_count
+                supervisor._check_workers()
+                if start_worker.call_count > calls:
+                    restart_times.append(elapsed)
+                # The parking lots of the failed worker are processed by the other one meanwhile.
+                if 1 in supervisor._restart_due:
+                    supervisor._rebalance()
+                    assert supervisor._assignment == {1: 0, 2: 0}
+
+        # The exit is noticed on the check following the restart, then the delay doubles.
+        assert restart_times[:4] == [5, 5 + 1 + 10, 16 + 1 + 20, 37 + 1 + 40]
+        await supervisor.http_client.close()
+
+    async def test_supervisor_gives_up_on_failing_worker(self) -> None:
+        supervisor = Supervisor(workers=1)
+        supervisor._failures = [SUPERVISOR_MAX_WORKER_FAILURES - 1]
+        supervisor._workers = [make_worker(alive=False, exitcode=1)]
+
+        with pytest.raises(WorkerFailureError):
+            supervisor._check_workers()
+        await supervisor.http_client.close()
+
+    async def test_status_report_resets_failures(self) -> None:
+        supervisor = Supervisor(workers=1)
+        supervisor._failures = [3]
+        supervisor._workers = [make_worker(status={"lag": 0.1})]
+
+        supervisor._check_workers()
+
+        assert supervisor._failures == [0]
+        await supervisor.http_client.close()
+
+    async def test_stream_capacity(self) -> None:
+        supervisor = Supervisor(workers=3, limit_streams=100)
+        supervisor._parking_lots = [make_parking_lot(1, 2), make_parking_lot(2, 3)]
+        supervisor._workers = [make_worker(), make_worker(status={"lag": 10.0}), make_worker()]
+        supervisor._restart_due = {2: time.monotonic()}
+
+        with patch("src.supervisor.get_cpu_load", return_value=0.0):
+            # Only the first worker keeps up with its schedule.
+            assert supervisor._stream_capacity() == 5 + STREAM_CLAIM_STEP
+            supervisor.limit_streams = 6
+            assert supervisor._stream_capacity() == 6
+        # No new streams are leased while the node is overloaded.
+        with patch("src.supervisor.get_cpu_load", return_value=2.0):
+            assert supervisor._stream_capacity() == 5
+        await supervisor.http_client.close()
+
+    async def test_lagging_worker_is_offloaded(self) -> None:
+        supervisor = Supervisor(workers=2)
+        supervisor._parking_lots = [make_parking_lot(1, 2), make_parking_lot(2, 1), make_parking_lot(3, 1)]
+        supervisor._assignment = {1: 0, 2: 0, 3: 1}
+        lagging_worker = make_worker(status={"lag": 10.0})
+        lagging_worker.connection.poll.side_effect = [True, False, False]
+        lagging_worker.connection.recv.return_value = {"lag": 10.0, "skipped_runs": 3, "rss": 0}
+        supervisor._workers = [lagging_worker, make_worker(status={"lag": 0.1})]
+
+        assert supervisor._check_workers()
+
+        # The cheapest parking lot is moved and the worker gets time to catch up.
+        assert supervisor._assignment == {1: 0, 2: 1, 3: 1}
+        assert lagging_worker.status == {}
+        assert not supervisor._check_workers()
+        await supervisor.http_client.close()
+
+    async def test_single_parking_lot_is_not_offloaded(self) -> None:
+        supervisor = Supervisor(workers=2)
+        supervisor._parking_lots = [make_parking_lot(1, 5)]
+        supervisor._assignment = {1: 0}
+        supervisor._workers = [make_worker(status={"lag": 10.0}), make_worker()]
+
+        assert not supervisor._check_workers()
+        assert supervisor._assignment == {1: 0}
+        await supervisor.http_client.close()
@@ -0,0 +1,60 @@
+import numpy as np
+
+from src.tiling import TileLayout
+
+
+class TestTileLayout:
+    def test_tiles_cover_frame_with_overlap(self) -> None:
+        layout = TileLayout((2160, 3840), tile_size=1280, overlap=0.2, full_frame=False)
+
+        coverage = np.zeros((2160, 3840), dtype=np.uint8)
+        for x0, y0, x1, y1 in layout.tiles:
+            assert (x1 - x0, y1 - y0) == (1280, 1280)
+            coverage[y0:y1, x0:x1] += 1
+        assert coverage.min() >= 1
+        # Neighbouring tiles share at least the overlap.
+        xs = np.unique(layout.tiles[:, 0])
+        assert (np.diff(xs) <= 1280 * 0.8).all()
+
+    def test_small_frame_is_single_tile(self) -> None:
+        layout = TileLayout((480, 640), tile_size=1280)
+        assert layout.tiles.tolist() == [[0, 0, 640, 480]]
+
+    def test_full_frame_is_appended(self) -> None:
+        layout = TileLayout((1000, 2000), tile_size=1000, full_frame=True)
+        assert layout.tiles[-1].tolist() == [0, 0, 2000, 1000]
+        frame = np.zeros((1000, 2000, 3), dtype=np.uint8)
+        assert [tile.shape[:2] for tile in layout.split(frame)] == [(1000, 1000)] * 3 + [(1000, 2000)]
+
+    def test_merge_suppresses_cross_tile_duplicates(self) -> None:
+        layout = TileLayout((1000, 1800), tile_size=1000, full_frame=False)
+        x = layout.tiles[1, 0]
+        # A car on the shared strip, seen entirely by the first tile and partially by the second one.
+        first_tile_boxes = np.array([[900, 500, 980, 540, 0.9], [100, 100, 160, 140, 0.8]], dtype=np.float32)
+        second_tile_boxes = np.array([[930 - x, 500, 980 - x, 540, 0.6], [700, 100, 760, 140, 0.7]], dtype=np.float32)
+
+        boxes = layout.merge([first_tile_boxes, second_tile_boxes])
+
+        assert boxes[:, 4].tolist() == np.float32([0.9, 0.8, 0.7]).tolist()
+        assert boxes[0, :4].tolist() == [900, 500, 980, 540]
+        assert boxes[2, :4].tolist() == [700 + x, 100, 760 + x, 140]
+
+    def test_merge_suppresses_only_by_kept_boxes(self) -> None:
+        layout = TileLayout((1000, 1800), tile_size=1000, full_frame=False)
+        x = layout.tiles[1, 0]
+        # A chain of boxes: A covers B, B covers C, but C is a different car than A.
+        a, c = [800, 500, 900, 600, 0.9], [880, 500, 980, 600, 0.7]
+        b = [840 - x, 500, 940 - x, 600, 0.8]
+
+        boxes = layout.merge([np.array([a, c], dtype=np.float32), np.array([b], dtype=np.float32)])
+
+        assert boxes.tolist() == np.float32([a, c]).tolist()
+
+    def test_merge_keeps_overlapping_boxes_of_same_tile(self) -> None:
+        layout = TileLayout((1000, 1000), tile_size=1000)
+        tile_boxes = np.array([[0, 0, 100, 100, 0.9], [10, 10, 90, 90, 0.8]], dtype=np.float32)
+        assert len(layout.merge([tile_boxes])) == 2
+
+    def test_merge_without_detections(self) -> None:
+        layout = TileLayout((1000, 1800), tile_size=1000)
+        assert layout.merge([np.empty((0, 5), dtype=np.float32)] * len(layout)).shape == (0, 5)